@@ -0,0 +1,9 @@
+# Cosmology Ruler Bookmark:
+# Marque-Page Cosmologique
+# by Hervé Dole, Université Paris-Saclay
+#
+# Library side of the bookmark scripts (redshift_ruler.py,
+# redshift_ruler_21cm.py). Submodules are imported on demand so that the
+# numerical parts do not pull in the plotting stack.
+#
+# Please cite Dole (2024) arXiv:2401.03929 if you like or use this bookmark
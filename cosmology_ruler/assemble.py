@@ -0,0 +1,318 @@
+# In-process assembly of bookmark pdfs
+#
+# merge_pdf_files: recto and verso pdfs -> one multi-page pdf, without
+#                  ghostscript. Page contents, fonts and images are copied
+#                  as they are, nothing is decoded or drawn again.
+# write_pages:     figures -> one multi-page pdf, streamed with PdfPages.
+# impose:          N copies of a recto/verso pair tiled on A4/A3/letter
+#                  duplex sheets with crop marks. Each side is stored once
+#                  in the output as a form XObject; every copy on every
+#                  sheet is a reference to it, so the file size and the
+#                  work do not grow with the drawing of the sides.
+#
+# Only the classic pdf files written by matplotlib (xref table, one page)
+# are read; they are not a general pdf parser.
+#
+# Example: 300 bookmarks on A3 duplex sheets
+# python -m cosmology_ruler.assemble impose CosmologyRulerBookmark_Recto_v0.pdf CosmologyRulerBookmark_Verso_v0.pdf -n 300 --sheet A3 -o sheets.pdf
+#
+
+import argparse
+import io
+import math
+import re
+import zlib
+
+from .profiling import count, stage
+
+# sheet sizes in points (portrait)
+MM = 72. / 25.4
+SHEETS = {'A4': (210 * MM, 297 * MM), 'A3': (297 * MM, 420 * MM), 'letter': (612., 792.)}
+
+_REF = re.compile(rb'(\d+) 0 R')
+
+
+# Reading
+#--------
+
+class PdfPage:
+    """First page of a pdf written by matplotlib: its objects, media box,
+    and the numbers of its resources and contents objects."""
+
+    def __init__(self, data):
+        if not isinstance(data, bytes):
+            with open(data, 'rb') as f:
+                data = f.read()
+        self.objects = {}
+        start = int(re.search(rb'startxref\s+(\d+)', data[-1024:]).group(1))
+        xref = re.match(rb'xref\s+(\d+) (\d+)\s+', data[start:])
+        if xref is None:
+            raise ValueError("unsupported pdf: no xref table")
+        first, count = int(xref.group(1)), int(xref.group(2))
+        pos = start + xref.end()
+        offsets = {}
+        for i in range(count):
+            entry = data[pos + 20 * i:pos + 20 * i + 20]
+            if entry[17:18] == b'n':
+                offsets[first + i] = int(entry[:10])
+        trailer = data[pos + 20 * count:]
+
+        self._data = data
+        self._offsets = offsets
+        root = self._dict_ref(self.get(self._ref(trailer, b'Root'))[0], b'Pages')
+        kids = re.search(rb'/Kids\s*\[\s*(\d+) 0 R', self.get(root)[0])
+        page = self.get(int(kids.group(1)))[0]
+        box = re.search(rb'/MediaBox\s*\[([^\]]*)\]', page).group(1).split()
+        self.width, self.height = float(box[2]) - float(box[0]), float(box[3]) - float(box[1])
+        self.resources = self._dict_ref(page, b'Resources')
+        self.contents = self._dict_ref(page, b'Contents')
+
+    @staticmethod
+    def _ref(head, key):
+        return int(re.search(rb'/' + key + rb'\s+(\d+) 0 R', head).group(1))
+
+    def _dict_ref(self, head, key):
+        try:
+            return self._ref(head, key)
+        except AttributeError:
+            raise ValueError("unsupported pdf: /{} is not an indirect object".format(key.decode()))
+
+    def get(self, num):
+        """(dictionary or value, stream data or None) of object num."""
+        if num in self.objects:
+            return self.objects[num]
+        data = self._data
+        start = re.compile(rb'\d+ 0 obj\s*').match(data, self._offsets[num]).end()
+        end = data.index(b'endobj', start)
+        stream = data.find(b'stream', start, end)
+        if stream == -1:
+            obj = (data[start:end].strip(), None)
+        else:
+            head = data[start:stream].strip()
+            length = re.search(rb'/Length\s+(\d+)( 0 R)?', head)
+            n = int(length.group(1))
+            if length.group(2):
+                n = int(self.get(n)[0])
+            body = stream + 6 + (2 if data[stream + 6:stream + 8] == b'\r\n' else 1)
+            obj = (head, data[body:body + n])
+        self.objects[num] = obj
+        return obj
+
+    def closure(self, nums):
+        """Numbers of the objects nums and of all objects they refer to."""
+        seen = set()
+        todo = list(nums)
+        while todo:
+            num = todo.pop()
+            if num in seen:
+                continue
+            seen.add(num)
+            head, _ = self.get(num)
+            todo.extend(int(ref) for ref in _REF.findall(head))
+        return seen
+
+
+# Writing
+#--------
+
+class PdfWriter:
+
+    def __init__(self):
+        self.objects = [None]  # object 0 is the free entry
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects) - 1
+
+    def set(self, num, head, stream=None):
+        self.objects[num] = (head, stream)
+
+    def add(self, head, stream=None):
+        num = self.reserve()
+        self.set(num, head, stream)
+        return num
+
+    def add_form(self, page):
+        """Copy page as a form XObject; returns its object number."""
+        nums = sorted(page.closure([page.resources, page.contents]))
+        mapping = {num: self.reserve() for num in nums}
+        renumber = lambda head: _REF.sub(lambda m: b'%d 0 R' % mapping[int(m.group(1))], head)
+        for num in nums:
+            head, stream = page.get(num)
+            head = renumber(head)
+            if num == page.contents:
+                head = (b'<< /Type /XObject /Subtype /Form /BBox [ 0 0 %s %s ] /Resources %d 0 R '
+                        % (_num(page.width), _num(page.height), mapping[page.resources]) + head[2:])
+            self.set(mapping[num], head, stream)
+        return mapping[page.contents]
+
+    def write(self, output, pages):
+        """pages: list of (width, height, {name: form number}, content)."""
+        catalog, tree = self.reserve(), self.reserve()
+        kids = []
+        for width, height, forms, content in pages:
+            xobjects = b' '.join(b'/%s %d 0 R' % (name.encode(), num) for name, num in forms.items())
+            stream = zlib.compress(content)
+            contents = self.add(b'<< /Length %d /Filter /FlateDecode >>' % len(stream), stream)
+            kids.append(self.add(b'<< /Type /Page /Parent %d 0 R /MediaBox [ 0 0 %s %s ] '
+                                 b'/Resources << /XObject << %s >> >> /Contents %d 0 R >>'
+                                 % (tree, _num(width), _num(height), xobjects, contents)))
+        self.set(catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % tree)
+        self.set(tree, b'<< /Type /Pages /Kids [ %s ] /Count %d >>'
+                 % (b' '.join(b'%d 0 R' % k for k in kids), len(kids)))
+
+        with open(output, 'wb') as f:
+            f.write(b'%PDF-1.4\n%\xac\xdc \xab\xba\n')
+            offsets = []
+            for num, (head, stream) in enumerate(self.objects[1:], 1):
+                offsets.append(f.tell())
+                f.write(b'%d 0 obj\n%s\n' % (num, head))
+                if stream is not None:
+                    f.write(b'stream\n' + stream + b'\nendstream\n')
+                f.write(b'endobj\n')
+            xref = f.tell()
+            f.write(b'xref\n0 %d\n0000000000 65535 f \n' % len(self.objects))
+            for offset in offsets:
+                f.write(b'%010d 00000 n \n' % offset)
+            f.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                    % (len(self.objects), catalog, xref))
+
+
+def _num(x):
+    return ('%.4f' % x).rstrip('0').rstrip('.').encode()
+
+
+def _page(side):
+    # PdfPage from a pdf path, pdf bytes or a Figure (drawn once, as pdf)
+    if hasattr(side, 'savefig'):
+        buf = io.BytesIO()
+        side.savefig(buf, format='pdf')
+        side = buf.getvalue()
+    return PdfPage(side)
+
+
+# Assembly
+#---------
+
+def merge_pdf_files(inputs, output):
+    """One page per input pdf (path, bytes or Figure), in order."""
+    with stage('merge'):
+        writer = PdfWriter()
+        pages = []
+        for side in inputs:
+            page = _page(side)
+            form = writer.add_form(page)
+            pages.append((page.width, page.height, {'S': form}, b'/S Do\n'))
+        writer.write(output, pages)
+    count('files written')
+    return output
+
+
+def write_pages(figs, output, dpi=300):
+    """Figures drawn one after the other into a multi-page pdf."""
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with PdfPages(output) as pdf:
+        for fig in figs:
+            pdf.savefig(fig, dpi=dpi)
+    return output
+
+
+def _best_grid(width, height, size, margin, gap):
+    # (sheet width, height, columns, rows) of the orientation holding the
+    # most copies, None if none fits
+    best = None
+    for sw, sh in [size, size[::-1]]:
+        ncol = int((sw - 2 * margin + gap) // (width + gap))
+        nrow = int((sh - 2 * margin + gap) // (height + gap))
+        if ncol > 0 and nrow > 0 and (best is None or ncol * nrow > best[2] * best[3]):
+            best = (sw, sh, ncol, nrow)
+    return best
+
+
+def sheet_layout(width, height, sheet='A3', margin=10 * MM, gap=10 * MM):
+    """Sheet size and lower-left corners of the copies of a width x height
+    side, for the orientation of the sheet holding the most copies."""
+    size = SHEETS[sheet] if isinstance(sheet, str) else tuple(sheet)
+    best = _best_grid(width, height, size, margin, gap)
+    if best is None:
+        fits = [name for name in sorted(SHEETS) if _best_grid(width, height, SHEETS[name], margin, gap)]
+        raise ValueError("a {:.0f} x {:.0f} pt side does not fit on a {} sheet (fits on: {})".format(
+            width, height, sheet, ', '.join(fits) or 'none'))
+    sw, sh, ncol, nrow = best
+    # grid centred on the sheet, filled from the top left
+    x0 = (sw - ncol * width - (ncol - 1) * gap) / 2
+    y0 = (sh - nrow * height - (nrow - 1) * gap) / 2
+    slots = [(x0 + i * (width + gap), y0 + (nrow - 1 - j) * (height + gap))
+             for j in range(nrow) for i in range(ncol)]
+    return (sw, sh), slots
+
+
+def _crop_marks(slots, width, height, offset, length):
+    # thin marks outside the corners of every copy, in the gaps
+    ops = [b'q 0.25 w 0 G']
+    for x, y in slots:
+        for cx, dx in [(x, -1), (x + width, 1)]:
+            for cy, dy in [(y, -1), (y + height, 1)]:
+                ops.append(b'%s %s m %s %s l S' % (_num(cx + dx * offset), _num(cy),
+                                                  _num(cx + dx * (offset + length)), _num(cy)))
+                ops.append(b'%s %s m %s %s l S' % (_num(cx), _num(cy + dy * offset),
+                                                  _num(cx), _num(cy + dy * (offset + length))))
+    ops.append(b'Q')
+    return b'\n'.join(ops) + b'\n'
+
+
+def impose(recto, verso, output, copies, sheet='A3', margin=10 * MM, gap=10 * MM, crop_marks=True):
+    """copies recto/verso pairs tiled on duplex sheets (front: rectos,
+    back: versos mirrored for a long-edge flip), with crop marks.
+    recto and verso are pdf paths, pdf bytes or Figures."""
+    with stage('impose'):
+        recto, verso = _page(recto), _page(verso)
+        if (recto.width, recto.height) != (verso.width, verso.height):
+            raise ValueError("recto and verso have different sizes")
+        width, height = recto.width, recto.height
+        (sw, sh), slots = sheet_layout(width, height, sheet, margin, gap)
+
+        writer = PdfWriter()
+        forms = {'R': writer.add_form(recto), 'V': writer.add_form(verso)}
+        length = max(gap / 2 - 2., 0.)
+        pages = []
+        for first in range(0, copies, len(slots)):
+            front = slots[:min(len(slots), copies - first)]
+            back = [(sw - x - width, y) for x, y in front]
+            for name, sheet_slots in [('R', front), ('V', back)]:
+                content = b''.join(b'q 1 0 0 1 %s %s cm /%s Do Q\n' % (_num(x), _num(y), name.encode())
+                                   for x, y in sheet_slots)
+                if crop_marks and length > 0:
+                    content += _crop_marks(sheet_slots, width, height, 2., length)
+                pages.append((sw, sh, {name: forms[name]}, content))
+        writer.write(output, pages)
+    count('files written')
+    return math.ceil(copies / len(slots))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge or impose bookmark pdfs.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    merge = sub.add_parser('merge', help="one page per input pdf")
+    merge.add_argument('inputs', nargs='+')
+    merge.add_argument('-o', '--output', required=True)
+    imp = sub.add_parser('impose', help="tile recto/verso pairs on duplex sheets")
+    imp.add_argument('recto')
+    imp.add_argument('verso')
+    imp.add_argument('-n', '--copies', type=int, required=True)
+    imp.add_argument('--sheet', default='A3', choices=sorted(SHEETS))
+    imp.add_argument('--no-crop-marks', action='store_true')
+    imp.add_argument('-o', '--output', required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == 'merge':
+        merge_pdf_files(args.inputs, args.output)
+    else:
+        sheets = impose(args.recto, args.verso, args.output, args.copies, args.sheet,
+                        crop_marks=not args.no_crop_marks)
+        print("{}: {} duplex sheets".format(args.output, sheets))
+
+
+if __name__ == '__main__':
+    main()
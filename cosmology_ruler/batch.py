@@ -0,0 +1,253 @@
+# Batch rendering of bookmark sides and variants in a process pool
+#
+# Every (cosmology, side, dpi) is rendered by a worker process; the
+# cosmology tables are computed (or loaded from the cache) once by the
+# parent and shared read-only, memory-mapped, by the workers. The recto
+# and verso pdfs of a cosmology are merged as soon as both are written,
+# while the other sides are still rendering.
+#
+# Example: 3 cosmologies x (recto, verso) x 2 dpis on 8 cores
+# python -m cosmology_ruler.batch --jobs 8 --cosmology Planck18 Planck15 WMAP9 --dpi 300 600
+#
+# With --profile-report, each worker times the stages of its job and the
+# parent adds them up: stage times are summed over the workers, wall_time
+# is the one of the whole batch. --profile-stage writes one profile per
+# job, e.g. export.png.0.prof, export.png.1.prof, ...
+#
+# Sides up to date in the manifest of the output directory (see
+# cosmology_ruler.manifest) are skipped, and only stale sides are merged
+# again; --force rebuilds everything, --dry-run lists the stale targets.
+#
+# --sides also takes spec files (see cosmology_ruler.engine), named after
+# the file: --sides recto verso my_variant.yaml; run_batch also takes
+# spec dicts (e.g. the band rulers of cosmology_ruler.lines).
+#
+
+import argparse
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .assemble import merge_pdf_files
+from .fast import fast_cosmology
+from .labels import TEXT_ENGINES
+from .density import add_density_arguments, with_density
+from .manifest import Manifest, add_manifest_arguments, merge_digest, side_digest, target_name
+from .profiling import Profiler, add_profile_arguments, count, current_profiler, profiler_from_args
+from .render import VECTOR_FORMATS, output_files
+from .engine import build_spec, get_cosmology
+from .sides import default_table, recto_spec, spec_21cm, verso_spec
+
+SIDES = {'recto': recto_spec, 'verso': verso_spec, '21cm': spec_21cm}
+
+
+def side_name(side):
+    # recto, verso, 21cm, the name of a spec file or of a spec dict
+    if isinstance(side, dict):
+        return side['name']
+    return os.path.splitext(os.path.basename(side))[0]
+
+
+def side_basename(output_dir, cosmology, side):
+    name = side_name(side)
+    return os.path.join(output_dir, "CosmologyRulerBookmark_{}_{}_v0".format(
+        cosmology, name.capitalize() if name.islower() else name))
+
+
+def side_spec(side, table, cosmo, auto_ticks=False):
+    if isinstance(side, str) and side in SIDES:
+        return SIDES[side](table, cosmo, auto_ticks=auto_ticks)
+    return build_spec(side, table, cosmo, auto_ticks)
+
+
+def render_job(job):
+    """Worker: draw one side and export it, unless it is up to date in
+    job['manifest']; returns (written paths, digest, why it was stale)."""
+    from .render import build_side, export
+
+    cosmo = None if job['cosmology'] == 'Planck18' else fast_cosmology(get_cosmology(job['cosmology']))
+    spec = side_spec(job['side'], job['table'], cosmo, job.get('auto_ticks', False))
+    formats = [fmt for _, f in job['outputs'] for fmt in f]
+    digest = side_digest(spec, job['table'], job['text_engine'], formats, job['dpi'])
+    manifest = job.get('manifest')
+    reason = 'no manifest'
+    if manifest is not None:
+        reason = manifest.reason(job['target'], digest, job_files(job))
+        if reason is None or manifest.dry_run:
+            return [], digest, reason
+    fig = build_side(spec, job['text_engine'])
+    paths = []
+    for basename, formats in job['outputs']:
+        paths += export(fig, basename, formats=formats, dpis=[job['dpi']])
+    return paths, digest, reason
+
+
+def job_files(job):
+    # paths written by render_job
+    return [path for basename, formats in job['outputs']
+            for path, _, _ in output_files(basename, formats, [job['dpi']])]
+
+
+def merge_job(pdfs, output):
+    # Combine into a single file for easy print
+    return [merge_pdf_files(pdfs, output)]
+
+
+def profiled_job(func, profile, *args):
+    # Worker: func(*args), timed by a profiler of its own when profile
+    # (Profiler arguments) is given; returns (result, report or None)
+    if profile is None:
+        return func(*args), None
+    with Profiler(*profile) as profiler:
+        result = func(*args)
+    return result, profiler.report()
+
+
+def make_jobs(cosmologies, sides, formats, dpis, output_dir, tables, text_engine=None, auto_ticks=False,
+              manifest=None):
+    raster = [fmt for fmt in formats if fmt not in VECTOR_FORMATS]
+    vector = [fmt for fmt in formats if fmt in VECTOR_FORMATS]
+    jobs = []
+    for cosmology in cosmologies:
+        for side in sides:
+            basename = side_basename(output_dir, cosmology, side)
+            for i, dpi in enumerate(dpis):
+                outputs = []
+                if raster:
+                    outputs.append((basename + ("_{}dpi".format(dpi) if len(dpis) > 1 else ""), raster))
+                if vector and i == 0:
+                    # vector output does not depend on the dpi
+                    outputs.append((basename, vector))
+                if outputs:
+                    jobs.append(dict(cosmology=cosmology, side=side, dpi=dpi, text_engine=text_engine,
+                                     auto_ticks=auto_ticks, table=tables[cosmology], outputs=outputs,
+                                     target=target_name(basename, dpi), manifest=manifest))
+    return jobs
+
+
+def run_batch(cosmologies=('Planck18',), sides=('recto', 'verso'), formats=('png', 'pdf'),
+              dpis=(300,), output_dir='.', jobs=None, merge=True, text_engine=None, auto_ticks=False,
+              manifest=None, precision=None):
+    """Render all sides of all cosmologies with `jobs` worker processes
+    (default: number of cores). auto_ticks: ticks planned for each
+    cosmology instead of the lists of the printed bookmark. Targets up to
+    date in manifest (default: the one of output_dir) are skipped.
+    precision: tolerance in mm on the ticks, cosmology tables only as
+    accurate as needed (cosmology_ruler.precision).
+    Returns the list of written files."""
+    os.makedirs(output_dir, exist_ok=True)
+    if manifest is None:
+        manifest = Manifest(output_dir)
+
+    def table(name):
+        cosmo = None if name == 'Planck18' else get_cosmology(name)
+        if precision is None:
+            return default_table(cosmo)
+        from .precision import precise_table, tolerances
+        return precise_table(cosmo, tolerances(sides, precision, cosmo))
+
+    tables = {name: table(name) for name in cosmologies}
+    todo = make_jobs(cosmologies, sides, formats, dpis, output_dir, tables, text_engine, auto_ticks,
+                     manifest)
+
+    # merged pdf of a cosmology: waits for its recto and verso pdf jobs
+    merges = {}
+    if merge and 'pdf' in formats and 'recto' in sides and 'verso' in sides:
+        for cosmology in cosmologies:
+            merges[cosmology] = {'recto', 'verso'}
+
+    # workers time their jobs when a profiler is active here
+    profiler = current_profiler()
+    numbers = iter(range(len(todo) + len(merges)))
+
+    def submit(func, *args):
+        profile = None
+        if profiler is not None:
+            output = profiler.profile_output
+            if output:
+                root, ext = os.path.splitext(output)
+                output = "{}.{}{}".format(root, next(numbers), ext)
+            profile = (profiler.profile_stage, output, profiler.tool)
+        count('batch jobs')
+        return pool.submit(profiled_job, func, profile, *args)
+
+    written = []
+    pdf_targets = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = {submit(render_job, job): job for job in todo}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                result, report = future.result()
+                if report is not None:
+                    profiler.merge(report)
+                if job.get('side') is None:
+                    # merged pdf
+                    written += result
+                    manifest.record(job['target'], job['digest'], result)
+                    continue
+                paths, digest, reason = result
+                written += paths
+                manifest.note(job['target'], digest, reason)
+                if paths:
+                    manifest.record(job['target'], digest, job_files(job))
+                waiting = merges.get(job['cosmology'])
+                if waiting and side_name(job['side']) in waiting and any('pdf' in f for _, f in job['outputs']):
+                    pdf_targets[job['cosmology'], side_name(job['side'])] = job['target']
+                    waiting.discard(side_name(job['side']))
+                    if not waiting:
+                        merged = merge_target(manifest, output_dir, job['cosmology'], pdf_targets)
+                        if merged is not None:
+                            pending[submit(merge_job, *merged.pop('args'))] = merged
+    return written
+
+
+def merge_target(manifest, output_dir, cosmology, pdf_targets):
+    # merged pdf of a cosmology, None when up to date
+    pdfs = [side_basename(output_dir, cosmology, side) + '.pdf' for side in ['recto', 'verso']]
+    output = os.path.join(output_dir, "CosmologyRulerBookmark_{}_v0.pdf".format(cosmology))
+    target = os.path.basename(output)
+    digest = merge_digest([manifest.digests[pdf_targets[cosmology, side]] for side in ['recto', 'verso']])
+    if manifest.check(target, digest, [output]) is None or manifest.dry_run:
+        return None
+    return dict(target=target, digest=digest, args=(pdfs, output))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render bookmark sides and variants in parallel.")
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument('--cosmology', nargs='+', default=['Planck18'],
+                        help="astropy cosmologies (default: Planck18)")
+    parser.add_argument('--sides', nargs='+', default=['recto', 'verso'],
+                        help="{} or spec files (default: recto verso)".format(', '.join(sorted(SIDES))))
+    parser.add_argument('--formats', nargs='+', default=['png', 'pdf'])
+    parser.add_argument('--dpi', nargs='+', type=int, default=[300])
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--text-engine', choices=TEXT_ENGINES, default=None,
+                        help="typeset texts with LaTeX or matplotlib's mathtext (default: as in the side)")
+    parser.add_argument('--no-merge', action='store_true', help="do not merge recto and verso pdfs")
+    parser.add_argument('--auto-ticks', action='store_true',
+                        help="plan the ticks for each cosmology instead of the printed lists")
+    parser.add_argument('--precision', type=float, metavar='MM',
+                        help="tolerance on the tick positions in mm: cosmology tables only as accurate as needed")
+    add_density_arguments(parser)
+    add_manifest_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.output_dir, args.force, args.dry_run)
+    with profiler_from_args(args) as profiler:
+        written = run_batch(args.cosmology, with_density(args.sides, args), args.formats, args.dpi,
+                            args.output_dir, args.jobs, not args.no_merge, args.text_engine,
+                            args.auto_ticks, manifest, args.precision)
+    if args.profile_report:
+        profiler.write(args.profile_report)
+    for path in written:
+        print(path)
+    if args.dry_run:
+        print('\n'.join(manifest.summary()))
+
+
+if __name__ == '__main__':
+    main()
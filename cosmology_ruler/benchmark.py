@@ -0,0 +1,334 @@
+# Benchmarks of the ruler's computational and rendering hot paths
+#
+# Every benchmark runs in a fresh Python process, so that its peak memory
+# (peak RSS, imports and setup included) is its own. Setup (imports,
+# cosmology tables, figures to export) is not timed; the timed call is
+# repeated and the minimum and median times are kept.
+#
+# inversion.*      age and lookback time ticks of the recto / verso:
+#                  astropy's z_at_value one tick at a time, z_at_values
+#                  on all ticks at once, and the cached table
+# arcsec.*         arcsec_per_kpc_proper on grids of 1e3 to 1e6 redshifts:
+#                  astropy, fast backend and cached table
+# table.compute    cosmology table of the default grid, no cache
+# build.*          full figure of the recto / verso / 21cm, with mathtext
+#                  and with usetex (skipped when latex is not installed)
+# export.*         recto png at 300 and 600 dpi, and pdf
+#
+# Runs offline, on any Linux box:
+# python -m cosmology_ruler.benchmark run -o baseline.json
+# ... change the code ...
+# python -m cosmology_ruler.benchmark run -o new.json
+# python -m cosmology_ruler.benchmark compare baseline.json new.json --threshold 0.1
+# compare exits with status 1 when a benchmark is slower (or uses more
+# memory) than the baseline by more than the threshold.
+#
+
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SIDES = ['recto', 'verso', '21cm']
+
+
+# Setups: return the function to time
+#---------
+
+def _table():
+    from .sides import default_table
+    return default_table()
+
+
+def _tick_values(side):
+    # values of all age and lookback time ticks of a side (labelled or not)
+    import astropy.units as u
+    from .sides import recto_spec, verso_spec
+
+    table = _table()
+    spec = {'recto': recto_spec, 'verso': verso_spec}[side](table)
+    values = {}
+    for name, axis in [('age', spec['axes'][1]), ('lookback_time', spec['axes'][2])]:
+        ticks = np.r_[axis['ticks'], axis.get('more_ticks', [])]
+        z = 10**ticks if side == 'recto' else ticks
+        values[name] = table.evaluate(name, z).to(u.Gyr)
+    return values
+
+
+def inversion_scalar(side):
+    from astropy.cosmology import Planck18, z_at_value
+
+    values = _tick_values(side)
+
+    def run():
+        for name, targets in values.items():
+            for value in targets:
+                z_at_value(getattr(Planck18, name), value, zmin=1e-8, zmax=1100)
+    return run
+
+
+def inversion_batched(side):
+    from astropy.cosmology import Planck18
+    from .inversion import z_at_values
+
+    values = _tick_values(side)
+
+    def run():
+        for name, targets in values.items():
+            z_at_values(getattr(Planck18, name), targets, zmax=1100)
+    return run
+
+
+def inversion_table(side):
+    values = _tick_values(side)
+    table = _table()
+
+    def run():
+        for name, targets in values.items():
+            table.z_at(name, targets, zmax=1100)
+    return run
+
+
+def _redshifts(n):
+    return np.geomspace(1e-3, 1000, n)
+
+
+def arcsec_astropy(n):
+    from astropy.cosmology import Planck18
+    z = _redshifts(n)
+    return lambda: Planck18.arcsec_per_kpc_proper(z)
+
+
+def arcsec_fast(n):
+    from astropy.cosmology import Planck18
+    from .fast import fast_cosmology
+    cosmo = fast_cosmology(Planck18)
+    cosmo.arcsec_per_kpc_proper(1.)  # fits made once, at setup
+    z = _redshifts(n)
+    return lambda: cosmo.arcsec_per_kpc_proper(z)
+
+
+def arcsec_table(n):
+    table = _table()
+    z = _redshifts(n)
+    return lambda: table.evaluate('arcsec_per_kpc_proper', z)
+
+
+def table_compute():
+    from astropy.cosmology import Planck18
+    from .cache import cosmology_table
+
+    def run():
+        # new fast backend every time: its fits are part of the work
+        cosmology_table(Planck18, directory=False)
+    return run
+
+
+def build(side, text_engine):
+    from .render import build_side
+    from .sides import recto_spec, spec_21cm, verso_spec
+
+    make_spec = {'recto': recto_spec, 'verso': verso_spec, '21cm': spec_21cm}[side]
+    table = _table()
+
+    def run():
+        # spec (tick inversion) + axes and texts + layout of every label
+        fig = build_side(make_spec(table), text_engine)
+        fig.draw_without_rendering()
+    return run
+
+
+def export_recto(fmt, dpi):
+    from .render import build_side, export
+    from .sides import recto_spec
+
+    fig = build_side(recto_spec(_table()), 'mathtext')
+    fig.draw_without_rendering()
+    directory = tempfile.mkdtemp(prefix='cosmology_ruler_benchmark')
+
+    def run():
+        export(fig, os.path.join(directory, 'recto'), formats=[fmt], dpis=[dpi])
+    return run
+
+
+def _needs_latex():
+    if shutil.which('latex') is None or shutil.which('dvipng') is None:
+        return "latex or dvipng not installed"
+
+
+# name: (setup, arguments, repeat, reason to skip or None)
+BENCHMARKS = {}
+for _side in ['recto', 'verso']:
+    BENCHMARKS['inversion.scalar.' + _side] = (inversion_scalar, (_side,), 1, None)
+    BENCHMARKS['inversion.batched.' + _side] = (inversion_batched, (_side,), 5, None)
+    BENCHMARKS['inversion.table.' + _side] = (inversion_table, (_side,), 20, None)
+for _n in [10**3, 10**4, 10**5, 10**6]:
+    BENCHMARKS['arcsec.astropy.{:.0e}'.format(_n)] = (arcsec_astropy, (_n,), 3 if _n < 10**5 else 1, None)
+    BENCHMARKS['arcsec.fast.{:.0e}'.format(_n)] = (arcsec_fast, (_n,), 5, None)
+    BENCHMARKS['arcsec.table.{:.0e}'.format(_n)] = (arcsec_table, (_n,), 5, None)
+BENCHMARKS['table.compute'] = (table_compute, (), 3, None)
+for _side in SIDES:
+    BENCHMARKS['build.{}.mathtext'.format(_side)] = (build, (_side, 'mathtext'), 3, None)
+    BENCHMARKS['build.{}.usetex'.format(_side)] = (build, (_side, 'usetex'), 3, 'latex')
+BENCHMARKS['export.png.300dpi'] = (export_recto, ('png', 300), 3, None)
+BENCHMARKS['export.png.600dpi'] = (export_recto, ('png', 600), 3, None)
+BENCHMARKS['export.pdf'] = (export_recto, ('pdf', 300), 3, None)
+
+
+# Running
+#---------
+
+def _peak_rss_mb():
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def run_one(name, repeat=None):
+    """Time benchmark name in this process; returns its result dict."""
+    setup, args, default_repeat, needs = BENCHMARKS[name]
+    if needs == 'latex' and _needs_latex():
+        return {'skipped': _needs_latex()}
+    repeat = repeat or default_repeat
+    func = setup(*args)
+    setup_rss = _peak_rss_mb()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return {'time_min': min(times), 'time_median': statistics.median(times),
+            'repeat': repeat, 'setup_rss_mb': setup_rss, 'peak_rss_mb': _peak_rss_mb()}
+
+
+def select(patterns=None):
+    if not patterns:
+        return list(BENCHMARKS)
+    return [name for name in BENCHMARKS if any(fnmatch.fnmatch(name, p) for p in patterns)]
+
+
+def metadata():
+    import astropy
+    import matplotlib
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'numpy': np.__version__, 'astropy': astropy.__version__,
+            'matplotlib': matplotlib.__version__}
+
+
+def run(names, repeat=None, verbose=True):
+    """Run benchmarks, each in its own process; returns the report dict."""
+    results = {}
+    for name in names:
+        cmd = [sys.executable, '-m', 'cosmology_ruler.benchmark', '_one', name]
+        if repeat:
+            cmd += ['--repeat', str(repeat)]
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+        results[name] = json.loads(out.splitlines()[-1])
+        if verbose:
+            print(_format(name, results[name]), flush=True)
+    return {'meta': metadata(), 'results': results}
+
+
+def _format(name, r):
+    if 'skipped' in r:
+        return "{:28s} skipped: {}".format(name, r['skipped'])
+    return "{:28s} {:10.4f} s (median {:.4f} s, {} runs)  peak RSS {:7.1f} MB".format(
+        name, r['time_min'], r['time_median'], r['repeat'], r['peak_rss_mb'])
+
+
+# Comparison
+#------------
+
+def compare(baseline, new, threshold=0.1, rss_threshold=0.2):
+    """Lines comparing two reports, and the names of the benchmarks slower
+    (min time) or bigger (peak RSS) than the baseline beyond thresholds."""
+    lines, flagged = [], []
+    for name, r in new['results'].items():
+        b = baseline['results'].get(name)
+        if b is None or 'skipped' in b or 'skipped' in r:
+            lines.append("{:28s} not compared".format(name))
+            continue
+        dt = r['time_min'] / b['time_min'] - 1
+        drss = r['peak_rss_mb'] / b['peak_rss_mb'] - 1
+        flags = []
+        if dt > threshold:
+            flags.append('SLOWER')
+        if drss > rss_threshold:
+            flags.append('MORE MEMORY')
+        if flags:
+            flagged.append(name)
+        lines.append("{:28s} {:10.4f} s -> {:10.4f} s ({:+6.1%})  RSS {:7.1f} -> {:7.1f} MB ({:+6.1%})  {}".format(
+            name, b['time_min'], r['time_min'], dt, b['peak_rss_mb'], r['peak_rss_mb'], drss,
+            ' '.join(flags)).rstrip())
+    return lines, flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the cosmology ruler.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('run', help="run benchmarks and save the results")
+    p.add_argument('patterns', nargs='*', help="benchmark names or patterns, e.g. 'build.*' (default: all)")
+    p.add_argument('-o', '--output', help="results file (JSON)")
+    p.add_argument('--repeat', type=int, help="timed runs per benchmark (default: per benchmark)")
+    p.add_argument('--compare', metavar='BASELINE', help="also compare with a baseline file")
+    p.add_argument('--threshold', type=float, default=0.1)
+    p.add_argument('--rss-threshold', type=float, default=0.2)
+    p = sub.add_parser('compare', help="compare results with a baseline")
+    p.add_argument('baseline')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=0.1,
+                   help="flag benchmarks slower than the baseline by this fraction (default: 0.1)")
+    p.add_argument('--rss-threshold', type=float, default=0.2,
+                   help="flag benchmarks with a peak RSS higher by this fraction (default: 0.2)")
+    sub.add_parser('list', help="list the benchmarks")
+    p = sub.add_parser('_one')  # worker: one benchmark, result as JSON
+    p.add_argument('name')
+    p.add_argument('--repeat', type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == '_one':
+        print(json.dumps(run_one(args.name, args.repeat)))
+        return
+    if args.command == 'list':
+        print('\n'.join(BENCHMARKS))
+        return
+
+    if args.command == 'run':
+        names = select(args.patterns)
+        if not names:
+            parser.error("no benchmark matches {}".format(args.patterns))
+        report = run(names, args.repeat)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        if not args.compare:
+            return
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.new) as f:
+            report = json.load(f)
+
+    lines, flagged = compare(baseline, report, args.threshold, args.rss_threshold)
+    print('\n'.join(lines))
+    if flagged:
+        print("{} benchmark(s) beyond the thresholds: {}".format(len(flagged), ', '.join(flagged)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
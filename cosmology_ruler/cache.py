@@ -0,0 +1,290 @@
+# Persistent cache of cosmology lookup tables
+#
+# A table holds, on a dense grid uniform in log(1+z):
+#   z, age [Gyr], lookback time [Gyr], comoving distance [Mpc],
+#   angular diameter distance [Mpc], angle for 1 proper kpc [arcsec]
+# It is stored as one .npy file named after a hash of the cosmology
+# parameters (H0, Om0, Ode0, Tcmb0, Neff, m_nu, Ob0, w0, wa) and of the grid,
+# and loaded memory-mapped read-only: a warm start does no integration at
+# all, and processes using the same table share the same pages.
+#
+# Files are written to a temporary name then renamed, so concurrent
+# writers and readers never see a partial table. The least recently used
+# tables are removed when the cache grows beyond max_bytes.
+#
+# Cache directory: $COSMOLOGY_RULER_CACHE, default ~/.cache/cosmology_ruler
+#
+# Tables of astropy's realizations (Planck18, WMAP9, ...) on the default
+# grid are also listed by name (one small file <name>.name per realization,
+# holding the key of its table, replaced as the tables are: concurrent
+# writers never lose each other's names): named_table('Planck18') loads one
+# without importing astropy.cosmology (nor scipy).
+#
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import astropy.units as u
+
+from .fast import ARCSEC_PER_RADIAN, DEFAULT_DEGREE, fast_cosmology
+from .inversion import invert_grid
+from .profiling import count, stage
+
+COLUMNS = ['z', 'age', 'lookback_time', 'comoving_distance',
+           'angular_diameter_distance', 'arcsec_per_kpc_proper']
+UNITS = [u.dimensionless_unscaled, u.Gyr, u.Gyr, u.Mpc, u.Mpc, u.arcsec / u.kpc]
+
+# columns equal to zero at z = 0
+VANISHING = ['lookback_time', 'comoving_distance', 'angular_diameter_distance']
+
+KEY_PARAMETERS = ['H0', 'Om0', 'Ode0', 'Tcmb0', 'Neff', 'm_nu', 'Ob0', 'w0', 'wa']
+
+# 2**14 + 1 points up to z = 1e4: interpolation is good to ~1e-7, inversion
+# (with the Newton step of invert_grid) to ~1e-11 in log(1+z)
+DEFAULT_GRID = dict(zmin=0., zmax=1e4, n=16385)
+DEFAULT_MAX_BYTES = 256 * 1024**2
+NAME_SUFFIX = '.name'
+
+
+def cache_dir():
+    path = os.environ.get('COSMOLOGY_RULER_CACHE')
+    if not path:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'cosmology_ruler')
+    return path
+
+
+def cosmology_parameters(cosmo):
+    """JSON-able parameters identifying cosmo (astropy or fast backend)."""
+    cosmo = getattr(cosmo, 'cosmology', cosmo)
+    params = {'class': type(cosmo).__name__}
+    for name in KEY_PARAMETERS:
+        value = getattr(cosmo, name, None)
+        if value is None:
+            continue
+        if hasattr(value, 'unit'):
+            params[name] = [np.atleast_1d(value.value).tolist(), str(value.unit)]
+        else:
+            params[name] = float(value)
+    return params
+
+
+def table_key(cosmo, zmin, zmax, n):
+    spec = {'cosmology': cosmology_parameters(cosmo),
+            'grid': [float(zmin), float(zmax), int(n)], 'columns': COLUMNS}
+    # fits of the fast backend of a lower degree (precision mode)
+    degree = getattr(cosmo, 'degree', DEFAULT_DEGREE)
+    if degree != DEFAULT_DEGREE:
+        spec['degree'] = int(degree)
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:32]
+
+
+class CosmologyTable:
+    """Tabulated cosmology quantities (see COLUMNS), values in UNITS."""
+
+    def __init__(self, data, key=None):
+        self.data = data
+        self.key = key
+
+    def __getattr__(self, name):
+        if name in COLUMNS:
+            return self.data[COLUMNS.index(name)]
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        # worker processes reopen the shared file instead of copying the table
+        if isinstance(self.data, np.memmap):
+            return {'filename': self.data.filename, 'key': self.key}
+        return {'data': np.asarray(self.data), 'key': self.key}
+
+    def __setstate__(self, state):
+        self.key = state['key']
+        if 'filename' in state:
+            self.data = np.load(state['filename'], mmap_mode='r')
+        else:
+            self.data = state['data']
+
+    def _values(self, name, values):
+        unit = UNITS[COLUMNS.index(name)]
+        if hasattr(values, 'unit'):
+            return values.to_value(unit)
+        return np.asarray(values, dtype=float)
+
+    def smooth_column(self, name):
+        """(log(1+z), values) of the grid; VANISHING columns are divided by
+        log(1+z), which is smooth down to z = 0 (extrapolated there)."""
+        xg = np.log1p(self.data[0])
+        f = np.asarray(self.data[COLUMNS.index(name)])
+        if name in VANISHING:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                f = f / xg
+            if xg[0] == 0:
+                f[0] = f[1] - (f[2] - f[1]) / (xg[2] - xg[1]) * xg[1]
+        return xg, f
+
+    def evaluate(self, name, z):
+        """Quantity name at redshifts z, interpolated in log(1+z)."""
+        if name == 'arcsec_per_kpc_proper':
+            # 1/z close to z = 0: invert the smooth distance instead
+            with np.errstate(divide='ignore'):
+                return ARCSEC_PER_RADIAN / self.evaluate('angular_diameter_distance', z).to(u.kpc) * u.arcsec
+        i = COLUMNS.index(name)
+        x = np.log1p(np.asarray(z, dtype=float))
+        xg, f = self.smooth_column(name)
+        if name in VANISHING:
+            return np.interp(x, xg, f) * x * UNITS[i]
+        return np.interp(x, xg, f) * UNITS[i]
+
+    def grid(self, name, zmin=None, zmax=None):
+        """(z, values) of the table, restricted to [zmin, zmax]."""
+        z = self.data[0]
+        keep = np.ones(z.shape, dtype=bool)
+        if zmin is not None:
+            keep &= z >= zmin
+        if zmax is not None:
+            keep &= z <= zmax
+        return z[keep], self.data[COLUMNS.index(name)][keep]
+
+    def z_at(self, name, targets, zmin=None, zmax=None):
+        """Redshifts where quantity name equals targets (no integration:
+        grid interpolation and one Newton step, see invert_grid).
+        [zmin, zmax] must select a monotonic part, e.g. for the angle."""
+        with stage('tick inversion'):
+            z, f = self.grid(name, zmin, zmax)
+            targets = self._values(name, targets)
+            count('inverted values', targets.size)
+            return invert_grid(z, f, targets)
+
+
+def compute_table(cosmo, zmin, zmax, n):
+    with stage('cosmology eval'):
+        z = np.expm1(np.linspace(np.log1p(zmin), np.log1p(zmax), n))
+        cosmo = fast_cosmology(cosmo)
+        data = np.empty((len(COLUMNS), n))
+        data[0] = z
+        with np.errstate(divide='ignore'):
+            for i, name in enumerate(COLUMNS[1:], 1):
+                data[i] = getattr(cosmo, name)(z).to_value(UNITS[i])
+    count('tables computed')
+    return data
+
+
+def _evict(directory, max_bytes, keep):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.npy'):
+            path = os.path.join(directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cosmology_table(cosmo, zmin=DEFAULT_GRID['zmin'], zmax=DEFAULT_GRID['zmax'],
+                    n=DEFAULT_GRID['n'], directory=None, max_bytes=DEFAULT_MAX_BYTES):
+    """CosmologyTable for cosmo, from the cache if present (memory-mapped),
+    otherwise computed and stored. directory=False disables the cache."""
+    key = table_key(cosmo, zmin, zmax, n)
+    if directory is False:
+        return CosmologyTable(compute_table(cosmo, zmin, zmax, n), key)
+
+    directory = directory or cache_dir()
+    path = os.path.join(directory, key + '.npy')
+    # named: tables of the default grid and fits (not those of precision mode)
+    if [zmin, zmax, n] == [DEFAULT_GRID['zmin'], DEFAULT_GRID['zmax'], DEFAULT_GRID['n']] \
+            and getattr(cosmo, 'degree', DEFAULT_DEGREE) == DEFAULT_DEGREE:
+        _name_table(directory, cosmo, key)
+    try:
+        with stage('cosmology table load'):
+            data = np.load(path, mmap_mode='r')
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            # read-only cache
+            pass
+        count('tables loaded from cache')
+        return CosmologyTable(data, key)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    data = compute_table(cosmo, zmin, zmax, n)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=key, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    _evict(directory, max_bytes, path)
+    return CosmologyTable(np.load(path, mmap_mode='r'), key)
+
+
+def _named_key(directory, name):
+    try:
+        with open(os.path.join(directory, name + NAME_SUFFIX)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _name_table(directory, cosmo, key):
+    # <name>.name holding the key of the table of cosmo, if cosmo is an
+    # astropy realization
+    import astropy.cosmology
+
+    cosmo = getattr(cosmo, 'cosmology', cosmo)
+    name = getattr(cosmo, 'name', None)
+    if name not in astropy.cosmology.available or getattr(astropy.cosmology, name) != cosmo:
+        return
+    if _named_key(directory, name) == key:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=name, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(key + '\n')
+        os.replace(tmp, os.path.join(directory, name + NAME_SUFFIX))
+    except OSError:
+        # read-only cache: the table is just not listed
+        pass
+
+
+def named_table(name, directory=None):
+    """CosmologyTable (default grid) of the astropy realization name, if
+    in the cache; None otherwise."""
+    directory = directory or cache_dir()
+    key = _named_key(directory, name)
+    if key is None:
+        return None
+    try:
+        with stage('cosmology table load'):
+            data = np.load(os.path.join(directory, key + '.npy'), mmap_mode='r')
+    except (FileNotFoundError, ValueError):
+        return None
+    count('tables loaded from cache')
+    return CosmologyTable(data, key)
+
+
+def clear_cache(directory=None):
+    directory = directory or cache_dir()
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(('.npy', '.tmp', NAME_SUFFIX)):
+                os.remove(os.path.join(directory, name))
@@ -0,0 +1,337 @@
+# Ruler quantities for whole galaxy catalogs
+#
+# The conversions printed on the bookmark, for every redshift of a
+# catalog: age, lookback time, comoving and angular diameter distances,
+# arcsec per proper kpc, and the observed wavelength and frequency of the
+# 21cm line. The catalog is read in chunks of rows (bounded memory,
+# whatever its size), every quantity is computed on the whole chunk at
+# once from the cached cosmology table (one interpolation search per chunk
+# shared by all quantities), and the result is streamed to the output.
+#
+# Inputs:  .csv (column by name or number), .npy (plain or structured),
+#          .fits (binary table, memory-mapped), .parquet (needs pyarrow)
+# Outputs: a directory of .npy files, one per quantity (memory-mapped),
+#          or a .parquet file (needs pyarrow)
+#
+# Redshifts outside the table (z > 1e4) are computed by the fast backend;
+# missing values and z <= -1 give NaN.
+#
+# Example: 10^8 galaxies, 8 worker processes
+# python -m cosmology_ruler.catalog galaxies.fits --column Z -o galaxies_ruler/ --jobs 8
+#
+
+import argparse
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .cache import COLUMNS, UNITS, VANISHING
+from .fast import ARCSEC_PER_RADIAN
+from .profiling import add_profile_arguments, count, profiler_from_args, stage
+
+DEFAULT_CHUNK = 1000000
+
+# name, unit of the output columns
+QUANTITIES = [
+    ('z', ''),
+    ('age', 'Gyr'),
+    ('lookback_time', 'Gyr'),
+    ('comoving_distance', 'Mpc'),
+    ('angular_diameter_distance', 'Mpc'),
+    ('arcsec_per_kpc_proper', 'arcsec / kpc'),
+    ('lambda_21cm', 'm'),
+    ('nu_21cm', 'MHz'),
+]
+
+
+# Computation
+#-------------
+
+def ruler_quantities(table, z, cosmo=None):
+    """Dict of float arrays, one per QUANTITIES, for redshifts z.
+    cosmo (default: fast Planck18) is used beyond the range of the table."""
+    from .sides import lambda_ref, nu_ref
+
+    z = np.asarray(z, dtype=float)
+    out = {'z': z}
+    zg = table.data[0]
+    inside = (z >= zg[0]) & (z <= zg[-1])
+    x = np.log1p(np.where(inside, z, zg[0]))
+
+    # one search for all columns: x between xg[i] and xg[i + 1]
+    xg = np.log1p(zg)
+    i = np.clip(np.searchsorted(xg, x, side='right') - 1, 0, len(xg) - 2)
+    w = (x - xg[i]) / (xg[i + 1] - xg[i])
+    for name in COLUMNS[1:-1]:
+        f = table.smooth_column(name)[1]
+        out[name] = (1 - w) * f[i] + w * f[i + 1]
+        if name in VANISHING:
+            out[name] *= x
+    with np.errstate(divide='ignore'):
+        out['arcsec_per_kpc_proper'] = ARCSEC_PER_RADIAN / (out['angular_diameter_distance'] * 1e3)
+
+    outside = ~inside & (z > -1)
+    if np.any(outside):
+        _outside(z, outside, out, cosmo)
+    for name in COLUMNS[1:]:
+        out[name][~inside & ~outside] = np.nan
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['lambda_21cm'] = lambda_ref * (1 + z)
+        out['nu_21cm'] = nu_ref / 1e6 / (1 + z)
+    return out
+
+
+def _outside(z, outside, out, cosmo):
+    # rows beyond the table: fast backend (astropy beyond its own range)
+    from astropy.cosmology import Planck18
+    from .fast import fast_cosmology
+
+    cosmo = fast_cosmology(cosmo or Planck18)
+    zo = z[outside]
+    for name in COLUMNS[1:]:
+        with np.errstate(divide='ignore'):
+            out[name][outside] = getattr(cosmo, name)(zo).to_value(UNITS[COLUMNS.index(name)])
+    count('catalog rows outside the table', zo.size)
+
+
+# Readers: (number of rows, iterator over chunks of redshifts)
+#---------
+
+def _column_index(names, column):
+    if column.isdigit():
+        return int(column)
+    try:
+        return names.index(column)
+    except ValueError:
+        raise ValueError("no column {!r} in {}".format(column, names))
+
+
+def read_npy(path, column, chunk):
+    data = np.load(path, mmap_mode='r')
+    if data.dtype.names:
+        data = data[column]
+    elif data.ndim == 2:
+        data = data[:, int(column)]
+    return len(data), (np.array(data[i:i + chunk], dtype=float) for i in range(0, len(data), chunk))
+
+
+def read_fits(path, column, chunk, hdu=1):
+    from astropy.io import fits
+
+    hdul = fits.open(path, memmap=True)
+    data = hdul[hdu].data
+
+    def chunks():
+        with hdul:
+            for i in range(0, len(data), chunk):
+                yield np.array(data[column][i:i + chunk], dtype=float)
+    return len(data), chunks()
+
+
+def _count_lines(path):
+    # lines of a text file; blank lines too, skipped by the parser
+    n, last = 0, b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            n += block.count(b'\n')
+            last = block[-1:]
+    return n + (last != b'\n')
+
+
+def read_csv(path, column, chunk, delimiter=','):
+    n = _count_lines(path) - 1
+    f = open(path)
+    index = _column_index([name.strip() for name in f.readline().split(delimiter)], column)
+
+    def chunks():
+        with f:
+            while True:
+                lines = list(itertools.islice(f, chunk))
+                if not lines:
+                    break
+                if not any(line.strip() for line in lines):
+                    continue
+                # empty fields are missing values
+                yield np.genfromtxt(lines, delimiter=delimiter, usecols=index, ndmin=1,
+                                    filling_values=np.nan)
+    return n, chunks()
+
+
+def read_parquet(path, column, chunk):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("reading parquet catalogs needs the pyarrow package")
+    f = pq.ParquetFile(path)
+    batches = f.iter_batches(batch_size=chunk, columns=[column])
+    return f.metadata.num_rows, (b.column(0).to_numpy(zero_copy_only=False).astype(float) for b in batches)
+
+
+READERS = {'.csv': read_csv, '.npy': read_npy, '.fits': read_fits, '.fit': read_fits,
+           '.parquet': read_parquet}
+
+
+# Writers
+#---------
+
+def _truncate_npy(path, n):
+    # first n rows of a 1d .npy file: header rewritten in place (a shorter
+    # shape fits in its padding), data cut
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        start = f.tell()
+        _, _, dtype = (np.lib.format.read_array_header_1_0(f) if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0(f))
+        offset = f.tell()
+        size = 2 if version == (1, 0) else 4
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(
+            np.lib.format.dtype_to_descr(dtype), n)
+        f.seek(start + size)
+        f.write((header.ljust(offset - start - size - 1) + '\n').encode('latin1'))
+        f.truncate(offset + n * dtype.itemsize)
+
+
+class NpyWriter:
+    """Directory of .npy files, one per quantity, written chunk by chunk;
+    n_rows: at least the rows written, the files are cut to them on close."""
+
+    def __init__(self, path, n_rows, names):
+        os.makedirs(path, exist_ok=True)
+        self.paths = {name: os.path.join(path, name + '.npy') for name in names}
+        self.columns = {name: np.lib.format.open_memmap(self.paths[name], mode='w+', dtype=float, shape=(n_rows,))
+                        for name in names}
+        self.n_rows = n_rows
+        self.rows = 0
+
+    def write(self, values):
+        n = len(values['z'])
+        for name, column in self.columns.items():
+            column[self.rows:self.rows + n] = values[name]
+        self.rows += n
+
+    def close(self):
+        for column in self.columns.values():
+            column.flush()
+        self.columns = {}
+        if self.rows < self.n_rows:
+            # e.g. blank lines of a csv
+            for path in self.paths.values():
+                _truncate_npy(path, self.rows)
+
+
+class ParquetWriter:
+
+    def __init__(self, path, n_rows, names):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("writing parquet catalogs needs the pyarrow package")
+        self._pa = pa
+        units = dict(QUANTITIES)
+        self.schema = pa.schema([pa.field(name, pa.float64(), metadata={'unit': units[name]})
+                                 for name in names])
+        self.writer = pq.ParquetWriter(path, self.schema)
+        self.rows = 0
+
+    def write(self, values):
+        self.rows += len(values['z'])
+        self.writer.write_table(self._pa.table({name: values[name] for name in self.schema.names},
+                                               schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+# Conversion
+#------------
+
+_worker = {}
+
+
+def _init_worker(table, cosmo):
+    _worker.update(table=table, cosmo=cosmo)
+
+
+def _compute(z):
+    return ruler_quantities(_worker['table'], z, _worker['cosmo'])
+
+
+def convert(input, output, column='z', chunk=DEFAULT_CHUNK, jobs=None, cosmo=None):
+    """Stream the ruler quantities of the redshift column of input to output
+    (.parquet file, otherwise a directory of .npy files) for cosmo (default:
+    Planck18). With jobs > 1, chunks are computed by worker processes, at
+    most 2 * jobs chunks in flight. Returns the number of rows."""
+    from .sides import default_table
+
+    table = default_table(cosmo)
+    ext = os.path.splitext(input)[1].lower()
+    if ext not in READERS:
+        raise ValueError("unknown catalog format {!r}, one of {}".format(ext, sorted(READERS)))
+    n_rows, chunks = READERS[ext](input, column, chunk)
+    names = [name for name, _ in QUANTITIES]
+    writer = (ParquetWriter if output.endswith('.parquet') else NpyWriter)(output, n_rows, names)
+
+    def read():
+        while True:
+            with stage('catalog read'):
+                z = next(chunks, None)
+            if z is None:
+                return
+            yield z
+
+    def write(values):
+        with stage('catalog write'):
+            writer.write(values)
+        count('catalog rows', len(values['z']))
+
+    try:
+        if not jobs or jobs == 1:
+            for z in read():
+                with stage('catalog compute'):
+                    values = ruler_quantities(table, z, cosmo)
+                write(values)
+        else:
+            # results written in order, reading goes on while workers compute
+            with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(table, cosmo)) as pool:
+                pending = collections.deque()
+                for z in read():
+                    pending.append(pool.submit(_compute, z))
+                    if len(pending) >= 2 * jobs:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ruler quantities (age, lookback time, distances, "
+                                                 "arcsec/kpc, 21cm wavelength and frequency) for a catalog.")
+    parser.add_argument('input', help="catalog: {}".format(', '.join(sorted(READERS))))
+    parser.add_argument('-o', '--output', required=True,
+                        help="output .parquet file, or directory of .npy files")
+    parser.add_argument('--column', default='z', help="redshift column, name or number (default: z)")
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help="rows per chunk")
+    parser.add_argument('--jobs', '-j', type=int, default=None, help="worker processes (default: none)")
+    parser.add_argument('--cosmology', default='Planck18', help="astropy cosmology (default: Planck18)")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from .engine import get_cosmology
+
+    with profiler_from_args(args) as profiler:
+        n = convert(args.input, args.output, args.column, args.chunk, args.jobs,
+                    get_cosmology(args.cosmology))
+    if args.profile_report:
+        profiler.write(args.profile_report)
+    print("{}: {} rows".format(args.output, n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# Density strip of a galaxy catalog along the redshift axis
+#
+# Where the redshifts of a survey catalog (Euclid, JWST, SDSS-like:
+# millions of rows) fall on a side, as a thin grey strip next to its z
+# axis. The catalog is read in chunks (cosmology_ruler.catalog readers:
+# csv, npy, fits, parquet) and counted into fixed bins of the axis
+# coordinate, log10(z) on log sides (recto) and z on linear sides (verso):
+# memory does not depend on the number of rows. The strip is drawn as one
+# image.
+#
+# Histograms are cached (cache directory, "density") by the sha256 of the
+# catalog file, its column and the bins: a re-render does not read the
+# catalog again. The hash of a file is itself remembered for its path,
+# size and modification time.
+#
+# In a spec (see cosmology_ruler.engine):
+#   "density": {"catalog": "euclid.fits", "column": "Z", "axis": 0,
+#               "bins": 256, "width": 0.02, "offset": 0.005, "cmap": "Greys",
+#               "norm": "log" or "linear"}
+# or for the standard sides:
+# python -m cosmology_ruler.batch --density euclid.fits --density-column Z
+#
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .cache import cache_dir
+from .profiling import count, stage
+from .ticks import axis_coordinates
+
+DEFAULT_BINS = 256
+DEFAULT_CHUNK = 1000000
+# strip: width and distance to the axis line (left of it, the tick labels
+# are on the right), figure fraction
+DEFAULT_WIDTH = 0.02
+DEFAULT_OFFSET = 0.005
+
+
+def density_dir():
+    return os.path.join(cache_dir(), 'density')
+
+
+def _save(path, write):
+    # written to a temporary name then renamed
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+# Hashes of the catalogs
+#------------------------
+
+def file_hash(path):
+    with stage('catalog hash'):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 24), b''):
+                h.update(block)
+        return h.hexdigest()
+
+
+def catalog_hash(path):
+    """sha256 of the file path, computed again only when its size or
+    modification time changed."""
+    index_path = os.path.join(density_dir(), 'hashes.json')
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        index = {}
+    st = os.stat(path)
+    key = os.path.realpath(path)
+    if index.get(key, [None] * 3)[:2] == [st.st_size, st.st_mtime_ns]:
+        return index[key][2]
+    index[key] = [st.st_size, st.st_mtime_ns, file_hash(path)]
+    _save(index_path, lambda f: f.write(json.dumps(index, indent=1).encode()))
+    return index[key][2]
+
+
+# Histograms
+#------------
+
+def bin_counts(chunks, c0, c1, bins, scale):
+    """Counts of the redshifts of chunks (iterable of arrays) in bins of
+    equal width in the axis coordinate, between c0 and c1."""
+    counts = np.zeros(bins, dtype=np.int64)
+    for z in chunks:
+        with stage('density binning'):
+            c = axis_coordinates(z, scale)
+            i = np.floor((c - c0) / (c1 - c0) * bins)
+            i = i[np.isfinite(i) & (i >= 0) & (i < bins)].astype(np.intp)
+            counts += np.bincount(i, minlength=bins)
+            count('catalog rows', np.size(z))
+    return counts
+
+
+def catalog_density(path, column='z', zmin=0.1, zmax=1000, scale='log', bins=DEFAULT_BINS,
+                    chunk=DEFAULT_CHUNK):
+    """Counts of the catalog redshifts in bins of the axis coordinate of
+    [zmin, zmax] (log10(z) or z), from the cache when possible."""
+    from .catalog import READERS
+    from .manifest import digest
+
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in READERS:
+        raise ValueError("unknown catalog format {!r}, one of {}".format(ext, sorted(READERS)))
+    c0, c1 = (float(c) for c in axis_coordinates([zmin, zmax], scale))
+    key = digest({'catalog': catalog_hash(path), 'column': column, 'scale': scale,
+                  'bins': [c0, c1, int(bins)]})
+    cached = os.path.join(density_dir(), key + '.npy')
+    try:
+        counts = np.load(cached)
+        count('density from cache')
+        return counts
+    except (FileNotFoundError, ValueError):
+        pass
+    counts = bin_counts(READERS[ext](path, column, chunk)[1], c0, c1, bins, scale)
+    _save(cached, lambda f: np.save(f, counts))
+    return counts
+
+
+def density_entry(density, zmin, zmax, scale):
+    """Density of a built spec (render.draw_density) from the "density" of
+    a declarative spec."""
+    bins = density.get('bins', DEFAULT_BINS)
+    return {
+        'counts': catalog_density(density['catalog'], density.get('column', 'z'), zmin, zmax, scale, bins),
+        'ylim': tuple(float(c) for c in axis_coordinates([zmin, zmax], scale)),
+        'axis': density.get('axis', 0),
+        'width': density.get('width', DEFAULT_WIDTH),
+        'offset': density.get('offset', DEFAULT_OFFSET),
+        'cmap': density.get('cmap', 'Greys'),
+        'norm': density.get('norm', 'log'),
+    }
+
+
+def add_density_arguments(parser):
+    parser.add_argument('--density', metavar='CATALOG',
+                        help="draw the density of the redshifts of this catalog next to the z axis")
+    parser.add_argument('--density-column', default='z', help="redshift column of the catalog (default: z)")
+
+
+def with_density(sides, args):
+    """Specs of sides (names, files or dicts) with the density strip of
+    the --density catalog, if any."""
+    from .engine import load_spec
+
+    if not args.density:
+        return sides
+    density = dict(catalog=args.density, column=args.density_column)
+    return [dict(load_spec(side), density=density) for side in sides]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bin the redshifts of a catalog as the density strip of a side.")
+    parser.add_argument('catalog')
+    parser.add_argument('--column', default='z', help="redshift column, name or number (default: z)")
+    parser.add_argument('--zmin', type=float, default=0.1)
+    parser.add_argument('--zmax', type=float, default=1000.)
+    parser.add_argument('--scale', choices=['log', 'linear'], default='log')
+    parser.add_argument('--bins', type=int, default=DEFAULT_BINS)
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK, help="rows per chunk")
+    args = parser.parse_args(argv)
+
+    counts = catalog_density(args.catalog, args.column, args.zmin, args.zmax, args.scale, args.bins, args.chunk)
+    edges = np.linspace(*axis_coordinates([args.zmin, args.zmax], args.scale), args.bins + 1)
+    if args.scale == 'log':
+        edges = 10**edges
+    print("{}: {} redshifts in [{:g}, {:g}], {} bins".format(args.catalog, counts.sum(), args.zmin, args.zmax, args.bins))
+    top = np.argsort(counts)[::-1][:5]
+    for i in sorted(top):
+        print("  z in [{:.4g}, {:.4g}]: {}".format(edges[i], edges[i + 1], counts[i]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,469 @@
+# Bookmark sides from declarative specs (JSON or YAML)
+#
+# A side is described by a spec file instead of a script: figure size and
+# margins, the redshift range, one entry per vertical axis and the texts.
+# The specs of the printed bookmark are in cosmology_ruler/specs
+# (recto.json, verso.json, 21cm.json); a new variant is a new file.
+#
+# Spec keys:
+#   include          spec file(s) (relative path, or shipped spec) giving
+#                    defaults: keys of the spec replace theirs, "strings"
+#                    are merged
+#   name, figsize, subplots_adjust, text_engine    as in render.build_side
+#   z                {"min", "max", "scale": "log" or "linear"}; without
+#                    min and max, the range of the ticks of all axes
+#   line             {"name": line of cosmology_ruler.lines.LINES} or
+#                    {"rest_wavelength": meters}, default of the line axes
+#   strings          named texts, used by the texts and overridden by the
+#                    cosmology: params1, params2, ref1 (cosmo given),
+#                    nu_ref, lambda_ref (line given); cosmology_ref:
+#                    format of ref1, default "({} cosmology)"
+#   texts            [{"x", "y", "s": text or "text": name of a string,
+#                      "fontsize" (9), "kind": "axis_label", ...}]
+#   axes             one per vertical axis, left to right:
+#     quantity       one of QUANTITIES: z, age, lookback_time [Gyr],
+#                    comoving_distance, angular_diameter_distance [Mpc],
+#                    arcsec_per_kpc_proper [arcsec/kpc], wavelength and
+#                    frequency of the observed line
+#     line           line of the axis (wavelength, frequency): name of
+#                    LINES, or "rest_wavelength": meters
+#     unit           of wavelength (default m) and frequency (MHz)
+#     range          [min, max] of the values of the quantity: ticks
+#                    outside are dropped (e.g. the band of an instrument)
+#     ticks          values of the quantity, or "auto" (cosmology_ruler.ticks)
+#     at: "z"        ticks are redshifts, labelled with the quantity there
+#     labels         labels of the ticks, default: format.format(value)
+#     format         default "{:g}"
+#     more_ticks     unlabelled ticks (values of the quantity)
+#     yscale: "log"  axis in log scale, ticks at their redshifts (log
+#                    sides, z axes); otherwise the axis coordinate is
+#                    log10(z) (log sides) or z (linear sides)
+#   density          {"catalog", "column", "axis", "bins", ...}: strip of
+#                    the redshifts of a catalog (cosmology_ruler.density)
+#   language         of the texts (default "en"): the strings of
+#                    specs/lang/<language>.json replace those of the spec
+#   Keys named "comment" are ignored.
+#
+# All axes of a side share one z grid (the cosmology table up to ZMAX):
+# each quantity is evaluated on it once, and tick values of all axes are
+# inverted on it. Values not reached on the grid are dropped.
+#
+# Example: render a spec for two cosmologies
+# python -m cosmology_ruler.engine my_ruler.yaml --cosmology Planck18 WMAP9
+#
+
+import argparse
+import collections
+import copy
+import json
+import os
+
+import numpy as np
+
+from .cache import COLUMNS, UNITS
+from .inversion import invert_grid
+from .lines import emitted_at, observe, rest_wavelength
+from .profiling import add_profile_arguments, count, profiler_from_args, stage
+
+SPEC_DIR = os.path.join(os.path.dirname(__file__), 'specs')
+SPEC_EXTENSIONS = ['.json', '.yaml', '.yml']
+# translations of the strings: {"strings": {...}, "sides": {name: {...}}}
+LANG_DIR = os.path.join(SPEC_DIR, 'lang')
+
+# redshifts of the shared grid: up to the top of the printed bookmark
+ZMAX = 1000
+
+# typesetting of the texts (cosmology_ruler.labels)
+TEXT_ENGINES = ['usetex', 'mathtext']
+
+
+# Quantities of the axes
+#------------------------
+
+# evaluate(table, z, axis) -> values; invert(values, axis) -> redshifts, or
+# None: inverted on the shared grid; column of the cosmology table, or None
+Quantity = collections.namedtuple('Quantity', 'evaluate invert column')
+QUANTITIES = {}
+
+
+def register_quantity(name, evaluate, invert=None, column=None):
+    """New axis quantity for the specs: evaluate(table, z, axis) returns its
+    values at redshifts z (axis: the spec entry, for its parameters);
+    invert(values, axis) their redshifts, default: interpolation on the
+    shared grid (the quantity must be monotonic there)."""
+    QUANTITIES[name] = Quantity(evaluate, invert, column)
+
+
+def _table_quantity(name):
+    unit = UNITS[COLUMNS.index(name)]
+    return lambda table, z, axis: table.evaluate(name, z).to_value(unit)
+
+
+def _line_quantity(name):
+    return (lambda table, z, axis: observe(axis['rest_wavelength'], z, name, axis.get('unit')),
+            lambda values, axis: emitted_at(axis['rest_wavelength'], values, name, axis.get('unit')))
+
+
+register_quantity('z', lambda table, z, axis: np.asarray(z, dtype=float), lambda values, axis: values)
+for _name in COLUMNS[1:]:
+    register_quantity(_name, _table_quantity(_name), column=_name)
+register_quantity('wavelength', *_line_quantity('wavelength'))
+register_quantity('frequency', *_line_quantity('frequency'))
+LINE_QUANTITIES = ['wavelength', 'frequency']
+
+
+def quantity(axis):
+    try:
+        return QUANTITIES[axis['quantity']]
+    except KeyError:
+        raise ValueError("unknown axis quantity {!r}, one of {}".format(
+            axis.get('quantity'), ', '.join(QUANTITIES)))
+
+
+class ZGrid:
+    """Redshifts of the cosmology table up to zmax, shared by the axes of a
+    side; each quantity is evaluated once on it."""
+
+    def __init__(self, table, zmax=ZMAX):
+        self.table = table
+        self.keep = table.data[0] <= zmax
+        self.z = table.data[0][self.keep]
+        self._values = {}
+
+    def values(self, axis):
+        q = quantity(axis)
+        key = (axis['quantity'], axis.get('rest_wavelength'), axis.get('unit'))
+        if key not in self._values:
+            if q.column is not None:
+                self._values[key] = self.table.data[COLUMNS.index(q.column)][self.keep]
+            else:
+                with stage('cosmology eval'):
+                    self._values[key] = q.evaluate(self.table, self.z, axis)
+        return self._values[key]
+
+    def z_at(self, axis, values):
+        """Redshifts of values of the quantity of axis, and the mask of the
+        values reached on the grid."""
+        q = quantity(axis)
+        values = np.asarray(values, dtype=float)
+        if q.invert is not None:
+            return q.invert(values, axis), np.ones(values.shape, dtype=bool)
+        f = self.values(axis)
+        keep = (values >= min(f[0], f[-1])) & (values <= max(f[0], f[-1]))
+        with stage('tick inversion'):
+            count('inverted values', int(keep.sum()))
+            return invert_grid(self.z, f, values[keep]), keep
+
+
+# Loading
+#---------
+
+def available_specs():
+    """Names of the specs shipped with the package."""
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(SPEC_DIR)
+                  if os.path.splitext(f)[1] in SPEC_EXTENSIONS and f != 'bookmark.json')
+
+
+def spec_path(name, directory='.'):
+    # spec file (relative to directory), or shipped spec, by name or file name
+    for path in [os.path.join(directory, name)] + [os.path.join(SPEC_DIR, name + ext) for ext in [''] + SPEC_EXTENSIONS]:
+        if os.path.splitext(path)[1] in SPEC_EXTENSIONS and os.path.exists(path):
+            return path
+    raise ValueError("unknown spec {!r}: a file, or one of {}".format(name, ', '.join(available_specs())))
+
+
+def available_languages():
+    # 'en': the strings of the specs themselves
+    return ['en'] + sorted(os.path.splitext(f)[0] for f in os.listdir(LANG_DIR) if f.endswith('.json'))
+
+
+def read_spec_file(path):
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1] == '.json':
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML specs need the PyYAML package")
+        return yaml.safe_load(f)
+
+
+def load_spec(spec):
+    """Spec dict, with its includes resolved, from a dict, a file path or
+    the name of a shipped spec ('recto', 'verso', '21cm')."""
+    if isinstance(spec, dict):
+        spec, directory = copy.deepcopy(spec), '.'
+    else:
+        path = spec_path(spec)
+        spec, directory = read_spec_file(path), os.path.dirname(path)
+        spec.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    includes = spec.pop('include', [])
+    for include in [includes] if isinstance(includes, str) else includes:
+        base = load_spec(spec_path(include, directory))
+        strings = dict(base.get('strings', {}), **spec.get('strings', {}))
+        base.update(spec)
+        spec = dict(base, strings=strings)
+    return spec
+
+
+# Building
+#----------
+
+def get_cosmology(name):
+    # astropy realization by name (Planck18, Planck15, WMAP9, ...)
+    import astropy.cosmology
+
+    if name not in astropy.cosmology.available:
+        raise ValueError("unknown cosmology {!r}, available: {}".format(
+            name, ', '.join(astropy.cosmology.available)))
+    return getattr(astropy.cosmology, name)
+
+
+def default_table(cosmo=None):
+    # z -> age, lookback time, angle table, cached on disk between runs;
+    # Planck18 from the cache without importing astropy.cosmology
+    from .cache import cosmology_table, named_table
+    from .fast import fast_cosmology
+
+    if cosmo is None:
+        table = named_table('Planck18')
+        if table is not None:
+            return table
+        from astropy.cosmology import Planck18
+        cosmo = Planck18
+    return cosmology_table(fast_cosmology(cosmo))
+
+
+def cosmology_strings(cosmo, ref="({} cosmology)"):
+    # Om, OL, H0 and reference lines of the top text
+    return {'params1': "$\\Omega_{{m}} = {:.3f} \\, \\, \\Omega_{{\\Lambda}} = {:.3f} $".format(cosmo.Om0, cosmo.Ode0),
+            'params2': "$H_0 = {:.1f} \\, \\rm{{km}}/\\rm{{s}}/\\rm{{Mpc}} $".format(cosmo.H0.value),
+            'ref1': ref.format(cosmo.name)}
+
+
+def line_wavelength(line):
+    # rest wavelength (m): name of a line of LINES, {"name"} or {"rest_wavelength"}
+    if isinstance(line, str):
+        return rest_wavelength(line)
+    if 'rest_wavelength' in line:
+        return line['rest_wavelength']
+    return rest_wavelength(line['name'])
+
+
+def line_strings(line):
+    lambda_ref = line_wavelength(line)
+    return {'nu_ref': fr"$\nu_{{\mathrm{{ref}}}} = {observe(lambda_ref, 0, 'frequency', 'MHz'):.2f}\,\mathrm{{MHz}}$",
+            'lambda_ref': rf"$\lambda_{{\mathrm{{ref}}}} = {lambda_ref*1e2:.2f}\,\mathrm{{cm}}$"}
+
+
+def language_strings(language, name):
+    # translated strings of side name ('en': none)
+    if language in (None, 'en'):
+        return {}
+    if language not in available_languages():
+        raise ValueError("unknown language {!r}, one of {}".format(language, ', '.join(available_languages())))
+    with open(os.path.join(LANG_DIR, language + '.json'), encoding='utf-8') as f:
+        translation = json.load(f)
+    return dict(translation.get('strings', {}), **translation.get('sides', {}).get(name, {}))
+
+
+def build_texts(spec, cosmo=None, language=None, strings=None):
+    # strings: replace those of the spec and language (e.g. a branding)
+    overrides = strings or {}
+    strings = dict(spec.get('strings', {}))
+    strings.update(language_strings(language or spec.get('language'), spec.get('name')))
+    strings.update(overrides)
+    if 'line' in spec:
+        strings.update(line_strings(spec['line']))
+    if cosmo is not None:
+        strings.update(cosmology_strings(cosmo, strings.get('cosmology_ref', "({} cosmology)")))
+    texts = []
+    for entry in spec.get('texts', []):
+        entry = {k: v for k, v in entry.items() if k != 'comment'}
+        x, y, kind = entry.pop('x'), entry.pop('y'), entry.pop('kind', None)
+        s = entry.pop('s') if 's' in entry else strings[entry.pop('text')]
+        text = dict(x=x, y=y, s=s, fontsize=entry.pop('fontsize', 9), ha='center')
+        if kind == 'axis_label':
+            text.update(rotation='vertical', zorder=2)
+        text.update(entry)
+        texts.append(text)
+    return texts
+
+
+def in_range(axis, values):
+    # mask of the values within the range of the axis
+    if 'range' not in axis:
+        return np.ones(np.shape(values), dtype=bool)
+    return (values >= min(axis['range'])) & (values <= max(axis['range']))
+
+
+def place_ticks(grid, axis):
+    """Ticks of a hand-made axis: (redshifts, labels, redshifts of
+    more_ticks or None). Values not reached on the grid, or outside the
+    range of the axis, are dropped."""
+    fmt = axis.get('format', '{:g}')
+    ticks = np.asarray(axis['ticks'], dtype=float)
+    labels = axis.get('labels')
+    more = axis.get('more_ticks')
+    if axis.get('at') == 'z':
+        with stage('cosmology eval'):
+            values = quantity(axis).evaluate(grid.table, ticks, axis)
+        keep = in_range(axis, values)
+        if labels is None:
+            labels = [fmt.format(value) for value in values]
+        if more is not None:
+            more = np.asarray(more, dtype=float)
+            more = more[in_range(axis, quantity(axis).evaluate(grid.table, more, axis))]
+        return ticks[keep], [label for label, k in zip(labels, keep) if k], more
+    keep = in_range(axis, ticks)
+    z, reached = grid.z_at(axis, ticks[keep])
+    keep[keep] = reached
+    if labels is None:
+        labels = [fmt.format(value) for value in ticks[keep]]
+    else:
+        labels = [label for label, k in zip(labels, keep) if k]
+    if more is not None:
+        more = np.asarray(more, dtype=float)
+        more = grid.z_at(axis, more[in_range(axis, more)])[0]
+    return z, labels, more
+
+
+def axis_window(grid, axis, zmin, zmax):
+    # redshifts where the quantity of axis is within its range
+    if 'range' not in axis or axis.get('at') == 'z':
+        return zmin, zmax
+    q = quantity(axis)
+    values = np.asarray(axis['range'], dtype=float)
+    if q.invert is None:
+        f = grid.values(axis)
+        values = np.clip(values, min(f[0], f[-1]), max(f[0], f[-1]))
+    z = grid.z_at(axis, values)[0]
+    return max(zmin, z.min()), min(zmax, z.max())
+
+
+def plan_axis(grid, axis, zmin, zmax, scale, length):
+    # ticks "auto": cosmology_ruler.ticks, in axis coordinates, within the
+    # range of the axis
+    from .ticks import axis_coordinates, plan_quantity, plan_ticks
+
+    table = grid.table
+    q = quantity(axis)
+    lo, hi = axis_window(grid, axis, zmin, zmax)
+    if lo >= hi:
+        return dict(ticks=[], labels=[])
+    c = axis_coordinates([zmin, zmax, lo, hi], scale)
+    length *= (c[3] - c[2]) / (c[1] - c[0])
+    zmin, zmax = lo, hi
+    if axis.get('at') == 'z':
+        return plan_ticks(lambda z: z, lambda z: z, zmin, zmax, scale, length=length, minor=False,
+                          label_values=lambda z: q.evaluate(table, z, axis),
+                          fmt=axis.get('format', '{:g}'))
+    if q.column is not None or axis['quantity'] == 'z':
+        return plan_quantity(table, axis['quantity'], zmin, zmax, scale, length=length)
+    return plan_ticks(lambda z: q.evaluate(table, z, axis), lambda v: q.invert(v, axis),
+                      zmin, zmax, scale, length=length)
+
+
+def build_spec(spec, table=None, cosmo=None, auto_ticks=False, language=None):
+    """Spec for cosmology_ruler.render.build_side from a declarative spec
+    (see load_spec), for cosmo (default: Planck18, with the texts of the
+    printed bookmark). auto_ticks: all axes planned automatically;
+    language: of the texts, instead of the one of the spec."""
+    from .ticks import axis_coordinates, axis_length
+
+    spec = load_spec(spec)
+    table = table or default_table(cosmo)
+    grid = ZGrid(table)
+    zspec = spec.get('z', {})
+    scale = zspec.get('scale', 'log')
+    axes = []
+    for axis in spec['axes']:
+        axis = dict(axis)
+        if axis['quantity'] in LINE_QUANTITIES and 'rest_wavelength' not in axis:
+            axis['rest_wavelength'] = line_wavelength(axis['line'] if 'line' in axis else spec['line'])
+        axes.append(axis)
+
+    # hand-made ticks, each distinct axis once
+    placed = {}
+    for axis in axes:
+        key = json.dumps(axis, sort_keys=True)
+        if axis['ticks'] != 'auto' and key not in placed:
+            placed[key] = place_ticks(grid, axis)
+    if 'min' in zspec and 'max' in zspec:
+        zmin, zmax = zspec['min'], zspec['max']
+    else:
+        z = np.concatenate([ticks for ticks, _, _ in placed.values()])
+        zmin, zmax = np.min(z), np.max(z)
+    ylim = tuple(axis_coordinates([zmin, zmax], scale))
+    length = axis_length(spec['figsize'], spec['subplots_adjust'])
+
+    out = []
+    for axis in axes:
+        key = json.dumps(axis, sort_keys=True)
+        if auto_ticks or axis['ticks'] == 'auto':
+            out.append(dict(ylim=ylim, **plan_axis(grid, axis, zmin, zmax, scale, length)))
+            continue
+        z, labels, more = placed[key]
+        if axis.get('yscale') == 'log':
+            entry = dict(ylim=(zmin, zmax), yscale='log', ticks=z, labels=labels)
+            if more is not None:
+                entry['more_ticks'] = more
+        else:
+            entry = dict(ylim=ylim, ticks=axis_coordinates(z, scale), labels=labels)
+            if more is not None:
+                entry['more_ticks'] = axis_coordinates(more, scale)
+        out.append(entry)
+
+    built = {
+        'name': spec['name'],
+        'figsize': tuple(spec['figsize']),
+        'subplots_adjust': dict(spec['subplots_adjust']),
+        'text_engine': spec.get('text_engine', 'mathtext'),
+        'axes': out,
+        'texts': build_texts(spec, cosmo, language),
+    }
+    if spec.get('density'):
+        from .density import density_entry
+
+        built['density'] = density_entry(spec['density'], zmin, zmax, scale)
+    return built
+
+
+def main(argv=None):
+    from .batch import run_batch
+    from .density import add_density_arguments, with_density
+    from .manifest import Manifest, add_manifest_arguments
+
+    parser = argparse.ArgumentParser(description="Render bookmark sides from spec files (JSON or YAML).")
+    parser.add_argument('specs', nargs='+', help="spec files, or names of shipped specs ({})".format(
+        ', '.join(available_specs())))
+    parser.add_argument('--cosmology', nargs='+', default=['Planck18'],
+                        help="astropy cosmologies (default: Planck18)")
+    parser.add_argument('--formats', nargs='+', default=['png', 'pdf'])
+    parser.add_argument('--dpi', nargs='+', type=int, default=[300])
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument('--text-engine', choices=TEXT_ENGINES, default=None,
+                        help="typeset texts with LaTeX or matplotlib's mathtext (default: as in the spec)")
+    parser.add_argument('--auto-ticks', action='store_true',
+                        help="plan the ticks of all axes automatically")
+    add_density_arguments(parser)
+    add_manifest_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.output_dir, args.force, args.dry_run)
+    with profiler_from_args(args) as profiler:
+        written = run_batch(args.cosmology, with_density(args.specs, args), args.formats, args.dpi, args.output_dir,
+                            args.jobs, False, args.text_engine, args.auto_ticks, manifest)
+    if args.profile_report:
+        profiler.write(args.profile_report)
+    for path in written:
+        print(path)
+    if args.dry_run:
+        print('\n'.join(manifest.summary()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+# Batch inversion of cosmological functions: redshift for given values
+#
+# astropy's z_at_value runs one bounded optimizer per target value, each
+# evaluating the cosmology integrals tens of times. The ruler needs the
+# redshift of every age / lookback time / angle tick, so here all the
+# targets of an axis are inverted together:
+#   1. the forward function is evaluated once on a dense grid in log(1+z)
+#   2. every target is interpolated on that grid
+#   3. all positions are refined together with Newton steps on the
+#      function, with the slope of the cubic interpolant of the grid (that
+#      of the step of invert_grid), until |dz| < ztol * (1 + z); values
+#      not converged in max_iter steps raise an error
+#
+# Example:
+# z_at_values(Planck18.age, [1, 2, 5] * u.Gyr)
+#
+
+import numpy as np
+
+from .profiling import count, stage
+
+
+def _values(quantity, unit=None):
+    # plain float array, in the unit of the targets if any
+    if unit is not None:
+        return np.asarray(quantity.to_value(unit), dtype=float)
+    return np.asarray(getattr(quantity, 'value', quantity), dtype=float)
+
+
+def forward_grid(func, zmin=1e-8, zmax=1000, n_grid=256, unit=None):
+    """Evaluate func on a grid uniform in log(1+z); returns (z, f(z))."""
+    z = np.expm1(np.linspace(np.log1p(zmin), np.log1p(zmax), n_grid))
+    return z, _values(func(z), unit)
+
+
+def invert_grid(z, f, targets):
+    """Redshifts of targets on a monotonic grid (z, f): linear interpolation
+    in log(1+z), then one Newton step on the cubic (Hermite) interpolant of
+    the grid, slopes from the grid itself (no function evaluation)."""
+    z = np.asarray(z, dtype=float)
+    f = np.asarray(f, dtype=float)
+    targets = np.asarray(targets, dtype=float)
+
+    df = np.diff(f)
+    if np.all(df > 0):
+        increasing = True
+    elif np.all(df < 0):
+        increasing = False
+    else:
+        raise ValueError("function is not monotonic on [{:g}, {:g}]: "
+                         "narrow zmin/zmax".format(z[0], z[-1]))
+
+    lo, hi = (f[0], f[-1]) if increasing else (f[-1], f[0])
+    outside = (targets < lo) | (targets > hi)
+    if np.any(outside):
+        raise ValueError("values {} are outside the range [{:g}, {:g}] reached "
+                         "for z in [{:g}, {:g}]".format(targets[outside], lo, hi, z[0], z[-1]))
+
+    u = np.log1p(z)
+    if increasing:
+        u0 = np.interp(targets, f, u)
+    else:
+        u0 = np.interp(targets, f[::-1], u[::-1])
+    if len(u) < 3:
+        return np.expm1(u0)
+
+    # Newton step: error of the linear start ~ h^2, after it ~ h^3
+    fu, dfu = hermite(u, f, np.gradient(f, u), u0)
+    return np.expm1(np.clip(u0 - (fu - targets) / dfu, u[0], u[-1]))
+
+
+def hermite(u, f, slope, x):
+    """Cubic (Hermite) interpolant of the grid (u, f) with slopes slope
+    (df/du), and its derivative, at x."""
+    i = np.clip(np.searchsorted(u, x, side='right') - 1, 0, len(u) - 2)
+    h = u[i + 1] - u[i]
+    s = (x - u[i]) / h
+    fx = ((2 * s - 3) * s * s + 1) * f[i] + (3 - 2 * s) * s * s * f[i + 1] \
+        + h * s * (1 - s) * ((1 - s) * slope[i] - s * slope[i + 1])
+    dfx = 6 * s * (1 - s) * (f[i + 1] - f[i]) / h \
+        + (1 - s) * (1 - 3 * s) * slope[i] + s * (3 * s - 2) * slope[i + 1]
+    return fx, dfx
+
+
+def z_at_values(func, targets, zmin=1e-8, zmax=1000, n_grid=256, ztol=1e-8,
+                max_iter=20, grid=None):
+    """Redshifts where func(z) equals each of targets, in one vectorized pass.
+
+    func must accept an array of redshifts and be monotonic on [zmin, zmax]
+    (e.g. cosmo.age, cosmo.lookback_time, or cosmo.arcsec_per_kpc_proper on
+    one side of its minimum). targets may be an astropy Quantity, func values
+    are then converted to its unit. grid=(z, f(z)) reuses a precomputed grid.
+    Returns a float array with the shape of targets; RuntimeError if some
+    values are not within ztol after max_iter Newton steps.
+    """
+    with stage('tick inversion'):
+        unit = getattr(targets, 'unit', None)
+        t = _values(targets)
+        shape = t.shape
+        t = t.ravel()
+        count('inverted values', t.size)
+
+        if grid is None:
+            grid = forward_grid(func, zmin, zmax, n_grid, unit)
+        zg, fg = np.asarray(grid[0], dtype=float), np.asarray(grid[1], dtype=float)
+
+        z = invert_grid(zg, fg, t)
+
+        # Newton steps in u = log(1+z), slope df/du of the interpolant of
+        # the grid (as in invert_grid)
+        ug = np.log1p(zg)
+        slope_g = np.gradient(fg, ug)
+        umin, umax = ug[0], ug[-1]
+        rounding = 4 * np.finfo(float).eps * np.max(np.abs(fg))
+        u = np.log1p(z)
+        todo = np.ones(t.shape, dtype=bool)
+        for _ in range(max_iter):
+            if not np.any(todo):
+                break
+            f = _values(func(np.expm1(u[todo])), unit)
+            du = (f - t[todo]) / hermite(ug, fg, slope_g, u[todo])[1]
+            u[todo] = np.clip(u[todo] - du, umin, umax)
+            # converged, or exact to the rounding of func where it is nearly
+            # flat (lookback time, age at z ~ 1000: steps stay above ztol)
+            done = (np.abs(du) < ztol) | (np.abs(f - t[todo]) <= rounding)
+            idx = np.flatnonzero(todo)
+            todo[idx[done]] = False
+        if np.any(todo):
+            raise RuntimeError("no convergence to ztol={:g} in {} steps for the values {}: raise ztol or "
+                               "max_iter".format(ztol, max_iter, t[todo]))
+
+        return np.expm1(u).reshape(shape)
+
+
+def z_at_age(cosmo, ages, **kwargs):
+    """Redshifts where the age of the Universe equals ages."""
+    return z_at_values(cosmo.age, ages, **kwargs)
+
+
+def z_at_lookback_time(cosmo, times, **kwargs):
+    """Redshifts where the lookback time equals times."""
+    return z_at_values(cosmo.lookback_time, times, **kwargs)
@@ -0,0 +1,167 @@
+# Text engines and cache of LaTeX label rendering
+#
+# usetex:   labels typeset by LaTeX (the printed bookmark). matplotlib runs
+#           latex (and dvipng for raster output) once per distinct label
+#           and keeps the dvi/png files in its tex.cache directory; the
+#           boxes (width, height, descent) of the labels are then read
+#           back from the dvi files at every layout. Here:
+#           - prepare_tex_labels runs the latex/dvipng jobs of all the
+#             labels of a figure in parallel, instead of one by one during
+#             the first draw
+#           - the label boxes are kept in a table on disk, keyed by label,
+#             font size, preamble and resolution, shared by all runs and
+#             processes: unchanged labels cost no TeX work at all. It is
+#             read through the TexManager of each renderer drawing a side
+#             (use_tex_cache, called by the figures of build_side), not by
+#             matplotlib's TexManager class itself
+# mathtext: the same texts rendered by matplotlib's mathtext, no external
+#           process; LaTeX-only markup ({\bf ...}, \&, \rm{...}) is
+#           translated by mathtext_label
+#
+# Table of label boxes: <cache directory>/tex_metrics.json
+# (see cosmology_ruler.cache.cache_dir)
+#
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from matplotlib.texmanager import TexManager
+
+from .cache import cache_dir
+from .engine import TEXT_ENGINES
+
+# font of the math parts in mathtext mode, close to LaTeX's
+MATH_FONTFAMILY = 'cm'
+
+
+def mathtext_label(s):
+    """Text s written for LaTeX, as (text, text properties) for mathtext."""
+    props = {}
+    bold = re.fullmatch(r'\{\\bf (.*)\}', s)
+    if bold:
+        s = bold.group(1)
+        props['fontweight'] = 'bold'
+    s = s.replace('\\&', '&')
+    s = s.replace('\\rm{', '\\mathrm{')
+    return s, props
+
+
+# Label boxes
+#------------
+
+_lock = threading.Lock()
+_metrics = None
+_new_metrics = {}
+
+
+def metrics_path():
+    return os.path.join(cache_dir(), 'tex_metrics.json')
+
+
+def _load_metrics():
+    try:
+        with open(metrics_path()) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _metrics_key(tex, fontsize, dpi_fraction):
+    src = json.dumps([tex, float(fontsize), float(dpi_fraction),
+                      TexManager.get_font_preamble(), TexManager.get_custom_preamble()])
+    return hashlib.sha256(src.encode()).hexdigest()
+
+
+class TexBoxes:
+    """TexManager of a renderer, reading the label boxes from the table on
+    disk (measured by TexManager when not in it)."""
+
+    def __init__(self, texmanager):
+        self.texmanager = texmanager
+
+    def __getattr__(self, name):
+        return getattr(self.texmanager, name)
+
+    def get_text_width_height_descent(self, tex, fontsize, renderer=None):
+        global _metrics
+        if tex.strip() == '':
+            return 0, 0, 0
+        key = _metrics_key(tex, fontsize, renderer.points_to_pixels(1.) if renderer else 1)
+        with _lock:
+            if _metrics is None:
+                _metrics = _load_metrics()
+            box = _metrics.get(key)
+        if box is None:
+            box = self.texmanager.get_text_width_height_descent(tex, fontsize, renderer)
+            with _lock:
+                _metrics[key] = _new_metrics[key] = list(box)
+        return tuple(box)
+
+
+def use_tex_cache(renderer):
+    """Have renderer (and its TeX texts) read the LaTeX label boxes from the
+    table on disk: its own TexManager is wrapped, nothing process-wide."""
+    # the vector renderer of savefig's pdf/svg/ps renderers
+    renderer = getattr(renderer, '_vector_renderer', renderer)
+    if not isinstance(renderer._texmanager, TexBoxes):
+        renderer._texmanager = TexBoxes(renderer.get_texmanager())
+
+
+def save_tex_cache():
+    """Add the label boxes measured by this process to the table on disk.
+    The table is merged with the one on disk and replaced atomically."""
+    with _lock:
+        if not _new_metrics:
+            return
+        new = dict(_new_metrics)
+        _new_metrics.clear()
+    path = metrics_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = _load_metrics()
+    table.update(new)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(table, f)
+    os.replace(tmp, path)
+
+
+# LaTeX runs
+#-----------
+
+def tex_labels(fig):
+    """(text, font size) of all the labels of fig typeset by LaTeX."""
+    labels = set()
+    for t in fig.texts:
+        if t.get_usetex() and t.get_text().strip():
+            labels.add((t.get_text(), t.get_fontsize()))
+    for ax in fig.axes:
+        if ax.get_label() == 'density':
+            # image only (cosmology_ruler.density)
+            continue
+        ticklabels = ax.axis["x"].major_ticklabels
+        if not ticklabels.get_usetex():
+            continue
+        ymin, ymax = sorted(ax.get_ylim())
+        locs = [y for y in ax.yaxis.get_majorticklocs() if ymin <= y <= ymax]
+        for s in ax.yaxis.get_major_formatter().format_ticks(locs):
+            if s.strip():
+                labels.add((s, ticklabels.get_size()))
+    return labels
+
+
+def prepare_tex_labels(fig, dpis=(), workers=None):
+    """Run latex for every label of fig, and dvipng at each of dpis (raster
+    output), in parallel. Labels already in matplotlib's tex.cache are
+    skipped by matplotlib itself."""
+    labels = tex_labels(fig)
+    if not labels:
+        return
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(lambda label: TexManager.make_dvi(*label), labels))
+        list(pool.map(lambda job: TexManager.make_png(*job),
+                      [(s, size, dpi) for s, size in labels for dpi in dpis]))
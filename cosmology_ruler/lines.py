@@ -0,0 +1,253 @@
+# Spectral lines and instrument bands for line rulers
+#
+# LINES: rest wavelengths (vacuum) of the lines used on the rulers, from
+# the HI 21cm line to the optical recombination lines, with the fine
+# structure and CO lines of the submm in between.
+# BANDS: instrument bands, with the lines worth a ruler axis in each.
+#
+# Observed wavelengths and frequencies of lines are computed for all
+# lines and all redshifts at once (observe, emitted_at broadcast the rest
+# wavelengths against the redshifts or observed values). band_spec
+# turns a band into the spec of a bookmark side (cosmology_ruler.engine):
+# a redshift axis and one axis per line visible in the band, with ticks
+# at round observed frequencies (or wavelengths) of the line, or at
+# given redshifts.
+#
+# Example: one bookmark per ALMA band and for LOFAR, in parallel
+# python -m cosmology_ruler.lines --bands ALMA-B3 ALMA-B4 ALMA-B6 ALMA-B7 LOFAR-HBA -j 8
+# python -m cosmology_ruler.lines --list
+#
+
+import argparse
+import functools
+import os
+
+import numpy as np
+import astropy.constants as cst
+import astropy.units as u
+
+# name: (rest wavelength or frequency, unit, label on the ruler)
+LINES = {
+    'HI21': (1420.405751768, 'MHz', "HI 21cm"),
+    'Lya': (1215.67, 'Angstrom', "Ly$\\alpha$"),
+    'CIV': (1549.06, 'Angstrom', "CIV 1549"),
+    'MgII': (2798.75, 'Angstrom', "MgII 2799"),
+    'OII3727': (3728.48, 'Angstrom', "[OII] 3727"),
+    'Hb': (4862.68, 'Angstrom', "H$\\beta$"),
+    'OIII5007': (5008.24, 'Angstrom', "[OIII] 5007"),
+    'Ha': (6564.61, 'Angstrom', "H$\\alpha$"),
+    'Paa': (1.87561, 'um', "Pa$\\alpha$"),
+    'OI63': (4744.77749, 'GHz', "[OI] 63$\\mu$m"),
+    'OIII88': (3393.006244, 'GHz', "[OIII] 88$\\mu$m"),
+    'NII122': (2459.380, 'GHz', "[NII] 122$\\mu$m"),
+    'OI145': (2060.06909, 'GHz', "[OI] 145$\\mu$m"),
+    'CII158': (1900.5369, 'GHz', "[CII] 158$\\mu$m"),
+    'NII205': (1461.1314, 'GHz', "[NII] 205$\\mu$m"),
+    'CI1-0': (492.160651, 'GHz', "[CI](1-0)"),
+    'CI2-1': (809.34197, 'GHz', "[CI](2-1)"),
+    'H2O557': (556.9359877, 'GHz', "H$_2$O 557GHz"),
+    'CO1-0': (115.2712018, 'GHz', "CO(1-0)"),
+    'CO2-1': (230.5380000, 'GHz', "CO(2-1)"),
+    'CO3-2': (345.7959899, 'GHz', "CO(3-2)"),
+    'CO4-3': (461.0407682, 'GHz', "CO(4-3)"),
+    'CO5-4': (576.2679305, 'GHz', "CO(5-4)"),
+    'CO6-5': (691.4730763, 'GHz', "CO(6-5)"),
+    'CO7-6': (806.6518060, 'GHz', "CO(7-6)"),
+    'CO8-7': (921.7997000, 'GHz', "CO(8-7)"),
+}
+
+# name: (quantity, unit, observed range, lines)
+BANDS = {
+    'ALMA-B3': ('frequency', 'GHz', (84., 116.), ['CO1-0', 'CO2-1', 'CO3-2', 'CO4-3', 'CI1-0', 'CII158']),
+    'ALMA-B4': ('frequency', 'GHz', (125., 163.), ['CO2-1', 'CO3-2', 'CO4-3', 'CO5-4', 'CI1-0', 'CII158']),
+    'ALMA-B6': ('frequency', 'GHz', (211., 275.), ['CO3-2', 'CO4-3', 'CO5-4', 'CO6-5', 'CI1-0', 'CI2-1',
+                                                  'NII205', 'CII158', 'OIII88']),
+    'ALMA-B7': ('frequency', 'GHz', (275., 373.), ['CO3-2', 'CO4-3', 'CO5-4', 'CO6-5', 'CO7-6', 'CI2-1',
+                                                  'NII205', 'CII158', 'OIII88']),
+    'LOFAR-HBA': ('frequency', 'MHz', (110., 240.), ['HI21']),
+    'SKA-Low': ('frequency', 'MHz', (50., 350.), ['HI21']),
+    'MeerKAT-L': ('frequency', 'MHz', (856., 1712.), ['HI21']),
+    'Euclid-NISP': ('wavelength', 'um', (0.92, 2.02), ['OII3727', 'Hb', 'OIII5007', 'Ha', 'Paa']),
+    'JWST-NIRSpec': ('wavelength', 'um', (0.6, 5.3), ['Lya', 'CIV', 'MgII', 'OII3727', 'Hb', 'OIII5007',
+                                                     'Ha', 'Paa']),
+}
+
+# redshift range of the band rulers
+ZMAX = 20.
+# of the observed values
+DEFAULT_UNITS = {'wavelength': 'm', 'frequency': 'MHz'}
+# width of a ruler axis (inches); bookmarks are at least 2 inches wide
+AXIS_WIDTH = 0.5
+
+
+# Observed lines
+#----------------
+
+@functools.lru_cache(maxsize=None)
+def rest_wavelength(name):
+    """Rest wavelength (m) of a line of LINES."""
+    try:
+        value, unit, _ = LINES[name]
+    except KeyError:
+        raise ValueError("unknown line {!r}, one of {}".format(name, ', '.join(LINES)))
+    return (value * u.Unit(unit)).to_value(u.m, equivalencies=u.spectral())
+
+
+def rest_wavelengths(names):
+    return np.array([rest_wavelength(name) for name in names])
+
+
+def _factor(quantity, unit):
+    # observed values in unit = wavelength (m) / factor, or c / (wavelength * factor)
+    if quantity == 'wavelength':
+        return u.Unit(unit or DEFAULT_UNITS[quantity]).to(u.m)
+    if quantity == 'frequency':
+        return u.Unit(unit or DEFAULT_UNITS[quantity]).to(u.Hz)
+    raise ValueError("quantity must be 'wavelength' or 'frequency', not {!r}".format(quantity))
+
+
+def observe(rest, z, quantity='frequency', unit=None):
+    """Observed wavelength or frequency, in unit (default: m, MHz), of lines
+    of rest wavelengths rest (m) at redshifts z. rest and z broadcast, e.g.
+    rest[:, None] and z[None, :]: all lines at all redshifts."""
+    wavelength = np.asarray(rest, dtype=float) * (1 + np.asarray(z, dtype=float))
+    factor = _factor(quantity, unit)
+    if quantity == 'wavelength':
+        return wavelength / factor
+    return cst.c.si.value / wavelength / factor
+
+
+def emitted_at(rest, values, quantity='frequency', unit=None):
+    """Redshifts at which lines of rest wavelengths rest (m) are observed at
+    values (unit); broadcast as in observe."""
+    values = np.asarray(values, dtype=float) * _factor(quantity, unit)
+    rest = np.asarray(rest, dtype=float)
+    if quantity == 'wavelength':
+        return values / rest - 1.
+    return cst.c.si.value / values / rest - 1.
+
+
+def windows(rest, vrange, quantity='frequency', unit=None):
+    """(zlo, zhi) arrays: redshift ranges where lines of rest wavelengths
+    rest are observed within vrange."""
+    z = emitted_at(np.asarray(rest, dtype=float)[:, None], vrange, quantity, unit)
+    return z.min(axis=1), z.max(axis=1)
+
+
+# Ruler specs
+#-------------
+
+def line_axes(lines, quantity='frequency', unit=None, vrange=None, z_ticks=None, fmt='{:.4g}'):
+    """Spec axes, one per line: ticks planned at round observed values
+    (within vrange), or at the redshifts z_ticks, labelled with the
+    observed values of all lines (one broadcast)."""
+    axes = [dict(quantity=quantity, line=name, unit=unit, ticks='auto') for name in lines]
+    if vrange is not None:
+        for axis in axes:
+            axis['range'] = list(vrange)
+    if z_ticks is None:
+        return axes
+    z = np.asarray(z_ticks, dtype=float)
+    values = observe(rest_wavelengths(lines)[:, None], z[None, :], quantity, unit)
+    inside = np.ones(values.shape, dtype=bool)
+    if vrange is not None:
+        inside = (values >= min(vrange)) & (values <= max(vrange))
+    for axis, v, keep in zip(axes, values, inside):
+        axis.update(at='z', ticks=z[keep].tolist(), labels=[fmt.format(x) for x in v[keep]])
+    return axes
+
+
+def band_spec(band, lines=None, zmax=ZMAX, z_ticks=None, text_engine='usetex'):
+    """Spec of a bookmark side for an instrument band of BANDS: a
+    redshift axis and one axis per line observed in the band for
+    0 < z <= zmax (default: the lines of the band)."""
+    quantity, unit, vrange, default_lines = BANDS[band]
+    lines = list(lines or default_lines)
+    zlo, zhi = windows(rest_wavelengths(lines), vrange, quantity, unit)
+    visible = (zhi > 0) & (zlo < zmax)
+    if not visible.any():
+        raise ValueError("no line of {} observed in {} for z < {:g}".format(', '.join(lines), band, zmax))
+    lines = [name for name, v in zip(lines, visible) if v]
+    zmin, zmax = max(zlo[visible].min(), 0.), min(zhi[visible].max(), zmax)
+    # log scale when the range spans a decade or more
+    scale = 'log' if zmin > 0 and zmax / zmin >= 10 else 'linear'
+
+    n = len(lines) + 1
+    width = max(AXIS_WIDTH * n + 0.4, 2.)
+    adjust = dict(bottom=0.04, top=0.88, left=0.2 / width, right=1 - 0.2 / width)
+    step = (adjust['right'] - adjust['left']) / n
+    texts = [dict(x=adjust['left'] + step * (i + 0.5) - 0.2 / width, y=0.5, s=s, kind='axis_label', va='center')
+             for i, s in enumerate(["Redshift $z$"] + [LINES[name][2] for name in lines])]
+    texts += [
+        dict(x=0.5, y=0.98, text='title_us1'),
+        dict(x=0.5, y=0.965, text='title_fr1'),
+        dict(x=0.5, y=0.94, s="{}: {:g}-{:g} {}".format(band, vrange[0], vrange[1], unit.replace('um', '$\\mu$m'))),
+        dict(x=0.5, y=0.925, s="observed {} [{}]".format(quantity, unit.replace('um', '$\\mu$m'))),
+        dict(x=0.5, y=0.905, text='params1', fontsize=7.),
+        dict(x=0.5, y=0.893, text='params2', fontsize=7.),
+    ]
+    z_axis = dict(quantity='z', ticks='auto' if z_ticks is None else list(z_ticks))
+    return {
+        'include': 'bookmark',
+        'name': band,
+        'figsize': [width, 10],
+        'subplots_adjust': adjust,
+        'text_engine': text_engine,
+        'z': dict(min=zmin, max=zmax, scale=scale),
+        'axes': [z_axis] + line_axes(lines, quantity, unit, vrange, z_ticks),
+        'texts': texts,
+    }
+
+
+def main(argv=None):
+    from .labels import TEXT_ENGINES
+    from .manifest import Manifest, add_manifest_arguments
+
+    parser = argparse.ArgumentParser(description="Line rulers: one bookmark per instrument band.")
+    parser.add_argument('--bands', nargs='+', default=[], help="bands of BANDS (see --list)")
+    parser.add_argument('--lines', nargs='+', help="lines of LINES, instead of those of each band")
+    parser.add_argument('--z-ticks', nargs='+', type=float,
+                        help="ticks at these redshifts on every axis (default: round observed values)")
+    parser.add_argument('--list', action='store_true', help="list the lines and bands")
+    parser.add_argument('--write-specs', metavar='DIR', help="write the specs (JSON) instead of rendering")
+    parser.add_argument('--cosmology', nargs='+', default=['Planck18'])
+    parser.add_argument('--formats', nargs='+', default=['pdf'])
+    parser.add_argument('--dpi', nargs='+', type=int, default=[300])
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--jobs', '-j', type=int, default=None)
+    parser.add_argument('--text-engine', choices=TEXT_ENGINES, default=None,
+                        help="typeset texts with LaTeX or matplotlib's mathtext (default: LaTeX)")
+    add_manifest_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, (value, unit, label) in LINES.items():
+            print("{:10s} {:>14g} {:8s} {}".format(name, value, unit, label))
+        for name, (quantity, unit, vrange, lines) in BANDS.items():
+            print("{:14s} {} {:g}-{:g} {}: {}".format(name, quantity, vrange[0], vrange[1], unit, ' '.join(lines)))
+        return
+
+    specs = [band_spec(band, args.lines, z_ticks=args.z_ticks) for band in args.bands]
+    if args.write_specs:
+        import json
+
+        os.makedirs(args.write_specs, exist_ok=True)
+        for spec in specs:
+            path = os.path.join(args.write_specs, spec['name'] + '.json')
+            with open(path, 'w') as f:
+                json.dump(spec, f, indent=2)
+            print(path)
+        return
+
+    from .batch import run_batch
+
+    manifest = Manifest(args.output_dir, args.force, args.dry_run)
+    for path in run_batch(args.cosmology, specs, args.formats, args.dpi, args.output_dir, args.jobs,
+                          False, args.text_engine, manifest=manifest):
+        print(path)
+    if args.dry_run:
+        print('\n'.join(manifest.summary()))
+
+
+if __name__ == '__main__':
+    main()
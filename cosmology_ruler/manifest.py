@@ -0,0 +1,211 @@
+# Incremental builds: sides are rendered again only when their inputs change
+#
+# A build manifest (cosmology_ruler_manifest.json, in the output directory)
+# records for every target the hash of all its inputs and the files it
+# wrote. A target is a side exported in some formats at one dpi, or a
+# merged recto/verso pdf. The inputs of a side are its full spec as built
+# for the cosmology (tick values, labels, text strings, layout), the
+# cosmology parameters, the text engine, formats and dpi, the matplotlib
+# style (rcParams used for drawing) and the drawing code (render, labels
+# and the matplotlib version). The spec is cheap to build (the tick
+# inversion uses the cached cosmology table), so a side whose hash is in
+# the manifest, with its outputs unchanged on disk, is skipped without
+# being drawn. A merged pdf is rebuilt only when one of its sides is.
+#
+# Changing a caption of the verso then re-renders the verso and the
+# merged pdf only. --force rebuilds everything, --dry-run lists the stale
+# targets (and why) without building anything:
+# python redshift_ruler.py --dry-run
+# python -m cosmology_ruler.batch --cosmology Planck18 WMAP9 --dry-run
+#
+
+import functools
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+MANIFEST_FILE = 'cosmology_ruler_manifest.json'
+
+# rcParams that change the drawing of a side
+RC_GROUPS = ['font', 'text', 'mathtext', 'axes', 'xtick', 'ytick', 'lines', 'figure',
+             'savefig', 'pdf', 'ps', 'svg', 'agg', 'image', 'path']
+
+
+# Hashes of the inputs
+#----------------------
+
+def _jsonable(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("cannot hash {!r}".format(obj))
+
+
+def digest(inputs):
+    """sha256 of JSON-able inputs (numpy arrays and scalars allowed)."""
+    text = json.dumps(inputs, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+@functools.lru_cache()
+def code_version(*modules):
+    # sources of the cosmology_ruler modules and matplotlib version
+    import matplotlib
+
+    h = hashlib.sha256(matplotlib.__version__.encode())
+    for name in modules:
+        with open(importlib.import_module('.' + name, __package__).__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def rc_style():
+    import matplotlib
+
+    return {key: str(value) for key, value in matplotlib.rcParams.items()
+            if key.split('.')[0] in RC_GROUPS}
+
+
+def side_digest(spec, table, text_engine, formats, dpi):
+    """Hash of everything a side exported in formats at dpi is made of."""
+    return digest({'spec': spec, 'cosmology': table.key,
+                   'text_engine': text_engine or spec.get('text_engine', 'mathtext'),
+                   'formats': sorted(formats), 'dpi': dpi, 'rc': rc_style(),
+                   'code': code_version('render', 'labels')})
+
+
+def merge_digest(digests):
+    """Hash of a pdf merged from sides of these digests."""
+    return digest({'sides': list(digests), 'code': code_version('assemble')})
+
+
+def target_name(basename, dpi):
+    return "{} {}dpi".format(os.path.basename(basename), dpi)
+
+
+# Manifest
+#----------
+
+class Manifest:
+    """Hashes of the targets built in a directory, and the outputs they wrote.
+    force: every target is stale; dry_run: nothing is recorded."""
+
+    def __init__(self, directory='.', force=False, dry_run=False):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self.force = force
+        self.dry_run = dry_run
+        try:
+            with open(self.path) as f:
+                self.targets = json.load(f)['targets']
+        except (FileNotFoundError, ValueError, KeyError):
+            self.targets = {}
+        # of this run: digests of the targets, and (target, reason) of the stale ones
+        self.digests = {}
+        self.stale = []
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.directory)
+
+    def reason(self, name, digest, outputs):
+        """Why target name, of inputs digest and output files outputs, must
+        be built; None when it is up to date."""
+        entry = self.targets.get(name)
+        if self.force:
+            return 'forced'
+        if entry is None:
+            return 'new'
+        if entry['digest'] != digest:
+            return 'inputs changed'
+        if sorted(entry['outputs']) != sorted(self._relative(path) for path in outputs):
+            return 'outputs changed'
+        for path in outputs:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return 'output missing'
+            if [st.st_size, st.st_mtime_ns] != entry['outputs'][self._relative(path)]:
+                return 'output modified'
+        return None
+
+    def note(self, name, digest, reason):
+        self.digests[name] = digest
+        if reason is not None:
+            self.stale.append((name, reason))
+
+    def check(self, name, digest, outputs):
+        """reason(), noted for this run."""
+        reason = self.reason(name, digest, outputs)
+        self.note(name, digest, reason)
+        return reason
+
+    def record(self, name, digest, outputs):
+        """Target name was built: its digest and outputs, saved at once."""
+        if self.dry_run:
+            return
+        files = {}
+        for path in outputs:
+            st = os.stat(path)
+            files[self._relative(path)] = [st.st_size, st.st_mtime_ns]
+        self.targets[name] = {'digest': digest, 'outputs': files}
+        self.save()
+
+    def save(self):
+        os.makedirs(self.directory or '.', exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory or '.', prefix=MANIFEST_FILE, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'targets': self.targets}, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def summary(self):
+        lines = ["stale: {} ({})".format(name, reason) for name, reason in self.stale]
+        fresh = len(self.digests) - len(self.stale)
+        if fresh:
+            lines.append("up to date: {} target(s)".format(fresh))
+        return lines
+
+
+# Targets
+#---------
+
+def update_side(manifest, spec, table, basename, formats=('png', 'pdf'), dpi=300, text_engine=None):
+    """Draw and export spec as basename.<format> unless it is up to date in
+    manifest; returns the target name."""
+    from .render import build_side, export, output_files
+
+    name = target_name(basename, dpi)
+    outputs = [path for path, _, _ in output_files(basename, formats, [dpi])]
+    d = side_digest(spec, table, text_engine, formats, dpi)
+    if manifest.check(name, d, outputs) is not None and not manifest.dry_run:
+        export(build_side(spec, text_engine), basename, formats=formats, dpis=[dpi])
+        manifest.record(name, d, outputs)
+    return name
+
+
+def update_merge(manifest, sides, inputs, output):
+    """Merge the pdfs inputs into output unless it is up to date in
+    manifest; sides: target names of the inputs."""
+    from .assemble import merge_pdf_files
+
+    name = os.path.basename(output)
+    d = merge_digest([manifest.digests[side] for side in sides])
+    if manifest.check(name, d, [output]) is not None and not manifest.dry_run:
+        merge_pdf_files(inputs, output)
+        manifest.record(name, d, [output])
+    return name
+
+
+def add_manifest_arguments(parser):
+    parser.add_argument('--force', action='store_true',
+                        help="build every output, even those up to date in the manifest")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="list the stale outputs without building them")
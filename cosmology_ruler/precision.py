@@ -0,0 +1,269 @@
+# Precision mode: cosmology table accuracy from a tolerance on paper
+#
+# Where an age or lookback time tick lands on a side depends on two
+# approximations of the cosmology table:
+#   - the fits of the fast backend (cosmology_ruler.fast): Chebyshev
+#     series of the lookback time and comoving distance integrals, of
+#     degree DEFAULT_DEGREE (~1e-13 relative)
+#   - the inversion of the tick values on the grid of the table: linear
+#     interpolation of log(1+z) between grid points, then one Newton step
+#     on the cubic interpolant of the grid (inversion.invert_grid); for a
+#     grid step h in u = log(1+z) the error of the linear start is
+#     ~ h^2 / 8 |f''(u) / f'(u)|, used here as a bound: after the step it
+#     is much smaller (~ h^3)
+# Both are far beyond what a printer resolves. Given a tolerance in mm on
+# paper, the length and scale of the sides turn it into a tolerance on the
+# axis coordinate (log10 z or z); the lowest degree whose fit error stays
+# within half of it is used, and the coarsest grid (2^k + 1 points) whose
+# interpolation error stays within half of the rest. Such a table is
+# several times cheaper to compute (new cosmologies, cold caches).
+#
+# Tolerances are derived from a small probe table of full degree. The
+# report then checks every tick of the sides against astropy itself
+# (z_at_values: Newton steps on astropy's own functions down to 1e-12 in
+# log(1+z); age as age(0) - lookback time, see cosmology_ruler.fast): its
+# error in mm, and for the axes ticked at redshifts ("at": "z") whether
+# the printed label is unchanged. Planned ("auto") axes are not checked.
+#
+# Example:
+# python -m cosmology_ruler.precision recto verso --tolerance-mm 0.01 -o errors.csv
+# python -m cosmology_ruler.batch --precision 0.01
+#
+
+import argparse
+import csv
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from .cache import COLUMNS, DEFAULT_GRID, UNITS, cosmology_table
+from .engine import ZMAX, ZGrid, build_spec, get_cosmology, in_range, load_spec, quantity
+from .fast import DEFAULT_DEGREE, FastFlatLCDM, fast_cosmology
+from .tables import MM_PER_POINT
+from .ticks import axis_coordinates, axis_length
+
+# tried from the lowest
+DEGREES = [8, 12, 16, 20, 24, 32, 40, 48, 64, DEFAULT_DEGREE]
+PROBE_POINTS = 2049
+MIN_POINTS = 257
+# share of the grid budget used: h^2 / 8 |f''/f'| is the leading term only
+GRID_SAFETY = 0.5
+REFERENCE_ZTOL = 1e-12
+ERROR_FIELDS = ['side', 'axis', 'quantity', 'value', 'label', 'minor', 'z', 'z_ref', 'error_mm', 'label_ok']
+
+
+def side_geometry(spec, built):
+    """(scale, zmin, zmax, mm per unit of axis coordinate) of a built side."""
+    scale = spec.get('z', {}).get('scale', 'log')
+    entry = built['axes'][0]
+    if entry.get('yscale') == 'log':
+        c0, c1 = axis_coordinates(entry['ylim'], scale)
+    else:
+        c0, c1 = entry['ylim']
+    zmin, zmax = (10**c0, 10**c1) if scale == 'log' else (c0, c1)
+    length = axis_length(built['figsize'], built['subplots_adjust']) * MM_PER_POINT
+    return scale, float(zmin), float(zmax), length / (c1 - c0)
+
+
+def coordinate_slope(z, scale):
+    # d(axis coordinate) / d(log(1+z))
+    z = np.asarray(z, dtype=float)
+    if scale == 'log':
+        with np.errstate(divide='ignore'):
+            return (1. + z) / (z * np.log(10.))
+    return 1. + z
+
+
+def inverted_axes(spec):
+    # axes whose tick values are inverted on the grid of the table
+    return [axis for axis in spec['axes'] if quantity(axis).column is not None and axis.get('at') != 'z']
+
+
+# Tolerances
+#------------
+
+def tolerances(sides, tolerance_mm, cosmo=None):
+    """Lowest fit degree and coarsest table grid placing the inverted ticks
+    of sides within tolerance_mm of their exact position on paper, for
+    cosmo (default: Planck18): dict(tolerance_mm, degree (None: no fits,
+    astropy evaluated directly), n (grid points), fit_mm and grid_mm
+    (estimated worst errors))."""
+    from astropy.cosmology import Planck18
+
+    base = getattr(cosmo, 'cosmology', cosmo) or Planck18
+    reference = fast_cosmology(base)
+    probe = cosmology_table(reference, n=PROBE_POINTS, directory=False)
+    z_all = np.asarray(probe.z)
+    u_all = np.log1p(z_all)
+
+    # per inverted axis: redshifts, values, coordinate per unit of value
+    # (in tolerances); worst interpolation term h^2 |f''/f'| / 8 (idem)
+    checks, curvature = [], 0.
+    for side in sides:
+        spec = load_spec(side)
+        scale, zmin, zmax, mm = side_geometry(spec, build_spec(spec, probe, cosmo))
+        per_tolerance = mm / tolerance_mm
+        keep = (z_all >= zmin) & (z_all <= min(zmax, ZMAX)) & (z_all > 0)
+        slope = coordinate_slope(z_all[keep], scale) * per_tolerance
+        for axis in inverted_axes(spec):
+            f = np.asarray(getattr(probe, axis['quantity']))
+            df = np.gradient(f, u_all)
+            d2f = np.gradient(df, u_all)
+            curvature = max(curvature, float(np.max(np.abs(d2f / df)[keep] * slope / 8.)))
+            checks.append((axis['quantity'], z_all[keep], f[keep], slope / np.abs(df[keep])))
+
+    degree, fit = None, 0.
+    if isinstance(reference, FastFlatLCDM):
+        for degree in DEGREES:
+            fitted = FastFlatLCDM(base, degree=degree)
+            fit = 0.
+            for name, z, f, scale_of_value in checks:
+                values = getattr(fitted, name)(z).to_value(UNITS[COLUMNS.index(name)])
+                fit = max(fit, float(np.max(np.abs(values - f) * scale_of_value)))
+            if fit <= 0.5:
+                break
+
+    n = MIN_POINTS
+    if curvature > 0:
+        h = math.sqrt(GRID_SAFETY * (1. - fit) / curvature)
+        n = max(n, 2**math.ceil(math.log2(u_all[-1] / h)) + 1)
+    h = u_all[-1] / (n - 1)
+    return dict(tolerance_mm=tolerance_mm, degree=degree, n=int(n),
+                fit_mm=fit * tolerance_mm, grid_mm=h * h * curvature * tolerance_mm)
+
+
+def precise_table(cosmo, settings, directory=None):
+    """Cosmology table of cosmo (default: Planck18) with the fit degree and
+    grid of settings (see tolerances); cached like the others."""
+    from astropy.cosmology import Planck18
+
+    base = getattr(cosmo, 'cosmology', cosmo) or Planck18
+    if settings['degree'] is not None:
+        base = FastFlatLCDM(base, degree=settings['degree'])
+    return cosmology_table(base, n=settings['n'], directory=directory)
+
+
+# Errors of the ticks
+#---------------------
+
+def reference_function(cosmo, name):
+    # astropy's own function; age as age(0) - lookback time (see cosmology_ruler.fast)
+    if name == 'age':
+        age0 = cosmo.age(0)
+        return lambda z: age0 - cosmo.lookback_time(z)
+    return getattr(cosmo, name)
+
+
+def tick_errors(side, table, cosmo=None):
+    """Errors on paper of the ticks of side placed with table, against
+    astropy for cosmo (default: Planck18): one dict (ERROR_FIELDS) per tick,
+    minor: unlabelled tick (more_ticks)."""
+    from astropy.cosmology import Planck18
+
+    from .inversion import z_at_values
+
+    ref = getattr(cosmo, 'cosmology', cosmo) or Planck18
+    spec = load_spec(side)
+    scale, _, _, mm = side_geometry(spec, build_spec(spec, table, cosmo))
+    grid = ZGrid(table)
+    rows = []
+    for i, axis in enumerate(spec['axes']):
+        name = axis['quantity']
+        if axis['ticks'] == 'auto' or quantity(axis).column is None:
+            continue
+        fmt = axis.get('format', '{:g}')
+        row = dict(side=spec['name'], axis=i, quantity=name)
+        if axis.get('at') == 'z':
+            # exact positions: the labels are checked
+            z = np.asarray(axis['ticks'], dtype=float)
+            values = quantity(axis).evaluate(table, z, axis)
+            exact = reference_function(ref, name)(z).value
+            for zi, value, expected in zip(z, values, exact):
+                label = fmt.format(value)
+                rows.append(dict(row, value=float(value), label=label, minor=False, z=float(zi), z_ref=float(zi),
+                                 error_mm=0., label_ok=label == fmt.format(expected)))
+            continue
+        ticks = [(False, np.asarray(axis['ticks'], dtype=float))]
+        if axis.get('more_ticks'):
+            ticks.append((True, np.asarray(axis['more_ticks'], dtype=float)))
+        labels = axis.get('labels')
+        for minor, values in ticks:
+            keep = in_range(axis, values)
+            z, reached = grid.z_at(axis, values[keep])
+            keep[keep] = reached
+            values = values[keep]
+            z_ref = z_at_values(reference_function(ref, name), values, zmin=0., zmax=ZMAX, ztol=REFERENCE_ZTOL)
+            errors = np.abs(axis_coordinates(z, scale) - axis_coordinates(z_ref, scale)) * mm
+            if minor:
+                names = [None] * len(values)
+            elif labels is not None:
+                names = [label for label, k in zip(labels, keep) if k]
+            else:
+                names = [fmt.format(value) for value in values]
+            for value, label, zi, zr, error in zip(values, names, z, z_ref, errors):
+                rows.append(dict(row, value=float(value), label=label, minor=minor, z=float(zi), z_ref=float(zr),
+                                 error_mm=float(error), label_ok=True))
+    return rows
+
+
+def write_report(rows, path):
+    """Tick errors as JSON, or CSV if path ends with .csv."""
+    if os.path.splitext(path)[1].lower() != '.csv':
+        with open(path, 'w') as f:
+            json.dump({'ticks': rows}, f, indent=1)
+        return path
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, ERROR_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, label='' if row['label'] is None else row['label']))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cosmology table accuracy from a tolerance in mm on paper, "
+                                                 "and the error of every tick.")
+    parser.add_argument('sides', nargs='*', default=['recto', 'verso'], help="spec files, or names of shipped specs")
+    parser.add_argument('--tolerance-mm', type=float, default=0.01, help="on the printed side (default: 0.01)")
+    parser.add_argument('--cosmology', default='Planck18')
+    parser.add_argument('--output', '-o', help="errors of all ticks, .json or .csv")
+    args = parser.parse_args(argv)
+
+    cosmo = None if args.cosmology == 'Planck18' else get_cosmology(args.cosmology)
+    settings = tolerances(args.sides, args.tolerance_mm, cosmo)
+    print("tolerance {tolerance_mm:g} mm: fit degree {degree} (default {0}), {n} grid points (default {1}); "
+          "estimated worst errors {fit_mm:.2g} mm (fit) + {grid_mm:.2g} mm (grid)".format(
+              DEFAULT_DEGREE, DEFAULT_GRID['n'], **settings))
+
+    # in memory: compute times of both tables
+    base = cosmo or get_cosmology('Planck18')
+    start = time.perf_counter()
+    default = cosmology_table(base, directory=False)
+    middle = time.perf_counter()
+    table = precise_table(cosmo, settings, directory=False)
+    end = time.perf_counter()
+    print("table: {:.0f} ms, default {:.0f} ms".format((end - middle) * 1e3, (middle - start) * 1e3))
+
+    rows = []
+    failed = False
+    for side in args.sides:
+        errors = tick_errors(side, table, cosmo)
+        baseline = [row['error_mm'] for row in tick_errors(side, default, cosmo)]
+        placed = [row['error_mm'] for row in errors]
+        changed = sum(not row['label_ok'] for row in errors)
+        worst = max(placed, default=0.)
+        failed |= worst > args.tolerance_mm or changed > 0
+        print("{}: {} ticks, worst error {:.2g} mm (default table {:.2g} mm), {} labels changed".format(
+            load_spec(side)['name'], len(errors), worst, max(baseline, default=0.), changed))
+        rows += errors
+    if args.output:
+        print(write_report(rows, args.output))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
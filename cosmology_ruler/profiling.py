@@ -0,0 +1,181 @@
+# Stage timers, counters and profiler hook for bookmark builds
+#
+# The library marks its stages with stage(name) and its work with
+# count(name, n). Nothing is recorded unless a Profiler is active:
+#
+# with Profiler() as prof:
+#     fig = build_side(recto_spec())
+#     export(fig, "recto", formats=['png', 'pdf'])
+# prof.write("out.json")
+#
+# Stages: 'cosmology eval', 'cosmology table load', 'tick inversion',
+# 'axes setup', 'text layout', 'tex labels', 'export.<format>', 'merge'.
+# Nested stages are timed on their own: their times add up to more than
+# the wall time.
+#
+# In a script, profiler.start() ... profiler.stop() does the same.
+# Profiler(profile_stage='tick inversion', profile_output='inv.prof')
+# additionally runs cProfile (or pyinstrument, tool='pyinstrument')
+# inside that stage only.
+#
+
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('cosmology_ruler_profiler', default=None)
+
+PROFILER_TOOLS = ['cprofile', 'pyinstrument']
+
+
+class Profiler:
+
+    def __init__(self, profile_stage=None, profile_output=None, tool='cprofile'):
+        if tool not in PROFILER_TOOLS:
+            raise ValueError("tool must be one of {}".format(PROFILER_TOOLS))
+        self.stages = {}
+        self.counters = {}
+        self.profile_stage = profile_stage
+        self.profile_output = profile_output
+        self.tool = tool
+        self._profile = None
+        self._lock = threading.Lock()
+        self._start = None
+        self._wall = 0.
+        self._tokens = []
+
+    def start(self):
+        """Make this the active profiler (same as entering `with`)."""
+        self._tokens.append(_current.set(self))
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self):
+        self._wall += time.perf_counter() - self._start
+        _current.reset(self._tokens.pop())
+        self._save_profile()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name):
+        profile = self._start_profile() if name == self.profile_stage else None
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            dt = time.perf_counter() - t0
+            if profile is not None:
+                self._stop_profile(profile)
+            with self._lock:
+                s = self.stages.setdefault(name, {'calls': 0, 'total': 0., 'max': 0.})
+                s['calls'] += 1
+                s['total'] += dt
+                s['max'] = max(s['max'], dt)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, report):
+        """Add the stages and counters of another report (e.g. from a worker)."""
+        with self._lock:
+            for name, r in report['stages'].items():
+                s = self.stages.setdefault(name, {'calls': 0, 'total': 0., 'max': 0.})
+                s['calls'] += r['calls']
+                s['total'] += r['total']
+                s['max'] = max(s['max'], r['max'])
+            for name, n in report['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        with self._lock:
+            return {'wall_time': self._wall,
+                    'stages': {name: dict(s) for name, s in self.stages.items()},
+                    'counters': dict(self.counters)}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+    # cProfile / pyinstrument inside profile_stage
+    def _start_profile(self):
+        if self._profile is None:
+            if self.tool == 'cprofile':
+                import cProfile
+                self._profile = cProfile.Profile()
+            else:
+                try:
+                    import pyinstrument
+                except ImportError:
+                    raise ImportError("tool='pyinstrument' needs the pyinstrument package")
+                self._profile = pyinstrument.Profiler()
+        if self.tool == 'cprofile':
+            self._profile.enable()
+        else:
+            self._profile.start()
+        return self._profile
+
+    def _stop_profile(self, profile):
+        if self.tool == 'cprofile':
+            profile.disable()
+        else:
+            profile.stop()
+
+    def _save_profile(self):
+        if self._profile is None or not self.profile_output:
+            return
+        if self.tool == 'cprofile':
+            self._profile.dump_stats(self.profile_output)
+        else:
+            with open(self.profile_output, 'w') as f:
+                if self.profile_output.endswith('.html'):
+                    f.write(self._profile.output_html())
+                else:
+                    f.write(self._profile.output_text())
+
+
+def current_profiler():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed code as stage name of the active Profiler, if any."""
+    profiler = _current.get()
+    if profiler is None:
+        yield
+    else:
+        with profiler.stage(name):
+            yield
+
+
+def count(name, n=1):
+    profiler = _current.get()
+    if profiler is not None:
+        profiler.count(name, n)
+
+
+def add_profile_arguments(parser):
+    # --profile-report / --profile-stage / --profiler options of the scripts
+    parser.add_argument('--profile-report', metavar='OUT.json',
+                        help="write stage timings and counters as JSON")
+    parser.add_argument('--profile-stage', metavar='STAGE',
+                        help="run a profiler inside this stage only")
+    parser.add_argument('--profiler', choices=PROFILER_TOOLS, default='cprofile')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help="output of --profile-stage (default: <stage>.prof or .txt)")
+
+
+def profiler_from_args(args):
+    output = args.profile_output
+    if args.profile_stage and not output:
+        suffix = '.prof' if args.profiler == 'cprofile' else '.txt'
+        output = args.profile_stage.replace(' ', '_') + suffix
+    return Profiler(args.profile_stage, output, args.profiler)
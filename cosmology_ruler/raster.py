@@ -0,0 +1,499 @@
+# Tiled raster export, in bounded memory, for print shops
+#
+# At 1200-2400 dpi an imposed sheet takes gigabytes as one image, and the
+# encoders of savefig hold the whole file besides the pixels. Here a side
+# is rendered in bands of whole pixel rows, each on its own Agg renderer of
+# the band's height (memory: tile_rows x width x 4 bytes per band, -j
+# processes rendering bands ahead of the writer), and streamed into the
+# output by encoders that hold one row at a time: PNG (zlib, dpi in pHYs)
+# or uncompressed TIFF (strips, resolution tags). A band renderer computes
+# the positions as Agg does on the whole canvas and moves them by whole
+# rows once rounded, so the pixels are those of savefig at the dpi (a
+# figure merely shifted under a smaller renderer rounds the half pixel
+# positions, as of the decade ticks, differently). Rows are hashed as they
+# are written: --verify renders the side with savefig too (low dpi) and
+# checks that the pixels, hence the files, are identical.
+#
+# impose_raster writes the front (rectos) and back (versos) of a duplex
+# sheet of copies (layout of cosmology_ruler.assemble.impose): each side
+# is spooled once to a raw file on disk (memory-mapped), and the rows of
+# the sheet are assembled from them band by band.
+#
+# Example:
+# python -m cosmology_ruler.raster side recto --dpi 2400 -o recto_2400dpi.tif -j 4
+# python -m cosmology_ruler.raster impose --dpi 1200 --sheet A3 -n 300 -o sheet_1200dpi.png -j 2
+#
+
+import argparse
+import collections
+import hashlib
+import io
+import math
+import os
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .profiling import count, stage
+
+DEFAULT_TILE_ROWS = 512
+# rows of an imposed sheet assembled at once
+SHEET_BAND = 256
+POINTS_PER_INCH = 72.
+
+
+# Encoders
+#----------
+
+class PngStream:
+    """8-bit RGB png written row by row (filter none, zlib stream)."""
+
+    def __init__(self, path, width, height, dpi):
+        self.f = open(path, 'wb')
+        self.width, self.height = width, height
+        self.rows = 0
+        self.sha = hashlib.sha256()
+        self.z = zlib.compressobj(6)
+        self.f.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        ppm = round(dpi / 0.0254)
+        self._chunk(b'pHYs', struct.pack('>IIB', ppm, ppm, 1))
+        self._pending = []
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack('>I', len(data)) + kind + data)
+        self.f.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    def write(self, rows):
+        """rows: uint8 array (n, width, 3), from the top."""
+        rows = np.ascontiguousarray(rows)
+        self.sha.update(rows.tobytes())
+        self.rows += len(rows)
+        data = np.zeros((len(rows), 1 + self.width * 3), dtype=np.uint8)
+        data[:, 1:] = rows.reshape(len(rows), -1)
+        self._pending.append(self.z.compress(data.tobytes()))
+        if sum(map(len, self._pending)) >= 1 << 20:
+            self._chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError("{} rows written, {} expected".format(self.rows, self.height))
+        self._chunk(b'IDAT', b''.join(self._pending) + self.z.flush())
+        self._chunk(b'IEND', b'')
+        self.f.close()
+
+
+class TiffStream:
+    """Uncompressed 8-bit RGB baseline tiff written row by row, one strip
+    per STRIP_ROWS rows (classic tiff: at most 4 GB)."""
+
+    STRIP_ROWS = 16
+
+    def __init__(self, path, width, height, dpi):
+        self.width, self.height = width, height
+        self.rows = 0
+        self.sha = hashlib.sha256()
+        row_bytes = width * 3
+        if row_bytes * height >= 2**32 - 2**20:
+            raise ValueError("{} x {} px is too large for a tiff: write a png".format(width, height))
+        nstrips = -(-height // self.STRIP_ROWS)
+        # header, 13 entries, then their values: bits per sample, resolutions, strips
+        entries = 13
+        ifd = 8
+        values = ifd + 2 + 12 * entries + 4
+        bits, xres, yres = values, values + 6, values + 14
+        offsets, counts = values + 22, values + 22 + 4 * nstrips
+        data = counts + 4 * nstrips
+        strip_offsets = [data + i * self.STRIP_ROWS * row_bytes for i in range(nstrips)]
+        strip_counts = [min(self.STRIP_ROWS, height - i * self.STRIP_ROWS) * row_bytes for i in range(nstrips)]
+        tags = [
+            (256, 4, 1, width), (257, 4, 1, height), (258, 3, 3, bits), (259, 3, 1, 1),
+            (262, 3, 1, 2), (273, 4, nstrips, offsets if nstrips > 1 else strip_offsets[0]),
+            (277, 3, 1, 3), (278, 4, 1, self.STRIP_ROWS),
+            (279, 4, nstrips, counts if nstrips > 1 else strip_counts[0]),
+            (282, 5, 1, xres), (283, 5, 1, yres), (284, 3, 1, 1), (296, 3, 1, 2),
+        ]
+        header = b'II*\x00' + struct.pack('<I', ifd) + struct.pack('<H', entries)
+        for tag, kind, n, value in tags:
+            packed = struct.pack('<H', value) + b'\x00\x00' if kind == 3 and n == 1 else struct.pack('<I', value)
+            header += struct.pack('<HHI', tag, kind, n) + packed
+        header += struct.pack('<I', 0)
+        header += struct.pack('<3H', 8, 8, 8)
+        header += struct.pack('<II', round(dpi * 100), 100) * 2
+        header += struct.pack('<{}I'.format(nstrips), *strip_offsets)
+        header += struct.pack('<{}I'.format(nstrips), *strip_counts)
+        assert len(header) == data
+        self.f = open(path, 'wb')
+        self.f.write(header)
+
+    def write(self, rows):
+        rows = np.ascontiguousarray(rows)
+        self.sha.update(rows.tobytes())
+        self.rows += len(rows)
+        self.f.write(rows.tobytes())
+
+    def close(self):
+        if self.rows != self.height:
+            raise ValueError("{} rows written, {} expected".format(self.rows, self.height))
+        self.f.close()
+
+
+ENCODERS = {'.png': PngStream, '.tif': TiffStream, '.tiff': TiffStream}
+
+
+def open_encoder(path, width, height, dpi):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ENCODERS:
+        raise ValueError("raster output must be one of {}".format(', '.join(ENCODERS)))
+    return ENCODERS[ext](path, width, height, dpi)
+
+
+# Tiles
+#-------
+
+def pixel_size(spec, dpi):
+    """(width, height) in pixels of a side at dpi."""
+    w, h = spec['figsize']
+    return int(round(w * dpi)), int(round(h * dpi))
+
+
+class _Band:
+    # Agg renderer of the rows r0 to r1 of a canvas of the given height,
+    # with the methods of the one of the whole canvas: positions are
+    # computed as Agg computes them on the canvas (same floating point
+    # operations), moved up by r0 once exact or rounded, and drawn through a
+    # flip that Agg undoes exactly. Exact for the paths, markers, glyphs and
+    # images of the sides (edges of slanted paths cut at the band edges and
+    # hatches could differ by a rounding).
+
+    def __init__(self, width, height, dpi, r0, r1):
+        from matplotlib.backends._backend_agg import RendererAgg
+        from matplotlib.transforms import Affine2D
+
+        self.agg = RendererAgg(int(width), r1 - r0, dpi)
+        self.height = float(int(height))
+        self.r0, self.rows = r0, r1 - r0
+        # y -> rows - y: Agg's flip of the band, undone
+        self.flip = Affine2D.from_values(1., 0., 0., -1., 0., float(self.rows))
+        # clip paths by id of the canvas's (Agg caches the last one by id)
+        self.clip_paths = {}
+
+    def _canvas(self, vertices, matrix, dx=0., dy=0.):
+        # vertices (x, y) on the canvas as Agg transforms them: matrix, then
+        # the flip of y (dx, dy: the shift of marker positions)
+        (sx, shx, tx), (shy, sy, ty) = matrix[0], matrix[1]
+        x, y = vertices[:, 0], vertices[:, 1]
+        return x * sx + y * shx + (tx + dx), x * -shy + y * -sy + ((self.height + dy) - ty)
+
+    def _path(self, path, matrix):
+        from matplotlib.path import Path
+
+        x, y = self._canvas(np.asarray(path.vertices, float), matrix)
+        band = Path(np.column_stack([x, y - self.r0]), path.codes)
+        band.should_simplify = path.should_simplify
+        band.simplify_threshold = path.simplify_threshold
+        return band
+
+    def _gc(self, gc):
+        from matplotlib.backend_bases import GraphicsContextBase
+        from matplotlib.transforms import Bbox, TransformedPath
+
+        band = GraphicsContextBase()
+        band.copy_properties(gc)
+        if gc._cliprect is not None:
+            (x0, y0), (x1, y1) = gc._cliprect.get_points()
+            # clip box rows on the canvas, as in Agg
+            k0, k1 = (math.floor((self.height - y) + 0.5) - self.r0 for y in (y0, y1))
+            band._cliprect = Bbox([[x0, self.rows - k0], [x1, self.rows - k1]])
+        path, affine = gc.get_clip_path()
+        if path is not None:
+            key = id(path), affine.get_matrix().tobytes()
+            if key not in self.clip_paths:
+                self.clip_paths[key] = path, TransformedPath(self._path(path, affine.get_matrix()), self.flip)
+            band._clippath = self.clip_paths[key][1]
+        return band
+
+    def draw_path(self, gc, path, transform, rgbFace=None):
+        self.agg.draw_path(self._gc(gc), self._path(path, transform.get_matrix()), self.flip, rgbFace)
+
+    def draw_markers(self, gc, marker_path, marker_trans, path, trans, rgbFace=None):
+        from matplotlib.path import Path
+
+        # marker positions: whole pixels of the canvas
+        x, y = self._canvas(np.asarray(path.vertices, float), trans.get_matrix(), 0.5, 0.5)
+        positions = Path(np.column_stack([np.floor(x), np.floor(y) - self.r0]), path.codes)
+        self.agg.draw_markers(self._gc(gc), marker_path, marker_trans, positions, self.flip, rgbFace)
+
+    def draw_text_image(self, image, x, y, angle, gc):
+        self.agg.draw_text_image(image, x, y - self.r0, angle, self._gc(gc))
+
+    def draw_image(self, gc, x, y, im):
+        # top row of the image on the canvas, as in Agg
+        top = int(self.height - (y + im.shape[0]))
+        self.agg.draw_image(self._gc(gc), x, float(self.rows - im.shape[0] - (top - self.r0)), im)
+
+    def draw_gouraud_triangles(self, gc, triangles_array, colors_array, transform):
+        raise NotImplementedError("gouraud shading is not drawn in bands")
+
+    def copy_from_bbox(self, bbox):
+        raise NotImplementedError("a band has no full canvas to copy from")
+
+    def clear(self):
+        self.agg.clear()
+
+
+def band_renderer(width, height, dpi, r0, r1):
+    """Agg renderer of the pixel rows r0 to r1 of a figure of width x
+    height pixels at dpi: the figure drawn on it has these rows of its
+    render on one canvas, in a buffer of r1 - r0 rows."""
+    from matplotlib.backend_bases import RendererBase
+    from matplotlib.backends.backend_agg import RendererAgg
+    from matplotlib.mathtext import MathTextParser
+    from matplotlib.transforms import Bbox
+
+    class BandRenderer(RendererAgg):
+        def __init__(self):
+            # as RendererAgg of the canvas, on a band
+            RendererBase.__init__(self)
+            self.dpi, self.width, self.height = dpi, width, height
+            self._renderer = _Band(width, height, dpi, r0, r1)
+            self._filter_renderers = []
+            self._update_methods()
+            self.mathtext_parser = MathTextParser('path')
+            self.bbox = Bbox.from_bounds(0, 0, width, height)
+
+        def _update_methods(self):
+            # collections and meshes: drawn path by path, by RendererBase
+            for name in ['draw_gouraud_triangles', 'draw_image', 'draw_markers', 'copy_from_bbox']:
+                setattr(self, name, getattr(self._renderer, name))
+
+        def buffer_rgba(self):
+            return memoryview(self._renderer.agg)
+
+        def start_filter(self):
+            raise NotImplementedError("agg filters are not drawn in bands")
+
+    return BandRenderer()
+# side laid out in a process rendering its bands
+_laid_out = {}
+
+
+def _lay_out(spec, dpi, text_engine):
+    from .render import build_side, layout
+
+    fig = build_side(spec, text_engine)
+    layout(fig, (dpi,))
+    # as savefig at dpi
+    fig.set_dpi(dpi)
+    _laid_out['figure'] = fig
+
+
+def _band_pixels(r0, r1):
+    # rows r0 to r1 of the side laid out, as uint8 RGB
+    fig = _laid_out['figure']
+    width, height = fig.bbox.size
+    renderer = band_renderer(width, height, fig.dpi, r0, r1)
+    fig.draw(renderer)
+    return np.asarray(renderer.buffer_rgba())[:, :, :3].copy()
+
+
+def tiles(spec, dpi, text_engine=None, tile_rows=DEFAULT_TILE_ROWS, jobs=1):
+    """Row tiles of the side, in order from the top, as uint8 RGB: bands of
+    tile_rows rows each rendered on its own, by jobs processes."""
+    height = pixel_size(spec, dpi)[1]
+    bands = [(r0, min(r0 + tile_rows, height)) for r0 in range(0, height, tile_rows)]
+    if jobs and jobs > 1:
+        with ProcessPoolExecutor(jobs, initializer=_lay_out, initargs=(spec, dpi, text_engine)) as pool:
+            # no more than two bands per process rendered ahead
+            pending = collections.deque()
+            for band in bands:
+                pending.append(pool.submit(_band_pixels, *band))
+                if len(pending) > 2 * jobs:
+                    with stage('raster render'):
+                        tile = pending.popleft().result()
+                    count('tiles')
+                    yield tile
+            while pending:
+                with stage('raster render'):
+                    tile = pending.popleft().result()
+                count('tiles')
+                yield tile
+    else:
+        _lay_out(spec, dpi, text_engine)
+        try:
+            for band in bands:
+                with stage('raster render'):
+                    tile = _band_pixels(*band)
+                count('tiles')
+                yield tile
+        finally:
+            _laid_out.clear()
+
+
+def export_tiled(spec, path, dpi, text_engine=None, tile_rows=DEFAULT_TILE_ROWS, jobs=1):
+    """Side as a png or tiff at dpi, streamed in tiles rendered by jobs
+    processes; returns the sha256 of its pixels."""
+    width, height = pixel_size(spec, dpi)
+    encoder = open_encoder(path, width, height, dpi)
+    for tile in tiles(spec, dpi, text_engine, tile_rows, jobs):
+        with stage('raster write'):
+            encoder.write(tile)
+    encoder.close()
+    count('files written')
+    return encoder.sha.hexdigest()
+
+
+def monolithic_digest(spec, dpi, text_engine=None):
+    """sha256 of the pixels of the side rendered in one piece at dpi."""
+    from .render import build_side, layout
+
+    fig = build_side(spec, text_engine)
+    layout(fig, (dpi,))
+    buf = io.BytesIO()
+    fig.savefig(buf, format='rgba', dpi=dpi)
+    width, height = pixel_size(spec, dpi)
+    pixels = np.frombuffer(buf.getvalue(), np.uint8).reshape(height, width, 4)[..., :3]
+    return hashlib.sha256(np.ascontiguousarray(pixels).tobytes()).hexdigest()
+
+
+# Imposed sheets
+#----------------
+
+def _spool(spec, dpi, text_engine, tile_rows, jobs, path):
+    # side rendered to a raw file on disk (.npy), returns its path
+    width, height = pixel_size(spec, dpi)
+    raw = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+    r0 = 0
+    for tile in tiles(spec, dpi, text_engine, tile_rows, jobs):
+        raw[r0:r0 + len(tile)] = tile
+        r0 += len(tile)
+    raw.flush()
+    return path
+
+
+def _sheet(path, side, slots, size, dpi, marks):
+    # sheet of copies of side (raw rows) at slots (pixels: left, top), crop
+    # marks: rectangles (top, bottom, left, right) in pixels
+    sw, sh = size
+    height, width = side.shape[:2]
+    encoder = open_encoder(path, sw, sh, dpi)
+    for r0 in range(0, sh, SHEET_BAND):
+        r1 = min(r0 + SHEET_BAND, sh)
+        with stage('raster sheet'):
+            band = np.full((r1 - r0, sw, 3), 255, dtype=np.uint8)
+            for left, top in slots:
+                a, b = max(r0, top), min(r1, top + height)
+                if a < b:
+                    band[a - r0:b - r0, left:left + width] = side[a - top:b - top]
+            for top, bottom, left, right in marks:
+                a, b = max(r0, top), min(r1, bottom)
+                if a < b:
+                    band[a - r0:b - r0, left:right] = 0
+        with stage('raster write'):
+            encoder.write(band)
+    encoder.close()
+    count('files written')
+    return path
+
+
+def impose_raster(recto, verso, output, dpi, sheet='A3', text_engine=None, tile_rows=DEFAULT_TILE_ROWS,
+                  jobs=1, crop_marks=True):
+    """Front and back (output_front.<ext>, output_back.<ext>) of a duplex
+    sheet holding as many recto/verso copies as fit, as in
+    assemble.impose. Returns (paths, copies per sheet)."""
+    from .assemble import MM, sheet_layout
+
+    width, height = pixel_size(recto, dpi)
+    if pixel_size(verso, dpi) != (width, height):
+        raise ValueError("recto and verso have different sizes")
+    px = lambda points: int(round(points * dpi / POINTS_PER_INCH))
+    wpt, hpt = (x * POINTS_PER_INCH for x in recto['figsize'])
+    gap = 10 * MM
+    (sw, sh), slots = sheet_layout(wpt, hpt, sheet, gap=gap)
+    size = px(sw), px(sh)
+    front = [(px(x), size[1] - px(y) - height) for x, y in slots]
+    back = [(size[0] - left - width, top) for left, top in front]
+
+    def marks(slots):
+        # as assemble._crop_marks: 0.25 pt lines, 2 pt from the corners
+        if not crop_marks:
+            return []
+        line, offset, length = max(px(0.25), 1), px(2.), px(max(gap / 2 - 2., 0.))
+        rects = []
+        for left, top in slots:
+            for cx, dx in [(left, -1), (left + width, 1)]:
+                for cy in [top, top + height]:
+                    x0, x1 = sorted([cx + dx * offset, cx + dx * (offset + length)])
+                    rects.append((cy - line // 2, cy - line // 2 + line, x0, x1))
+            for cy, dy in [(top, -1), (top + height, 1)]:
+                for cx in [left, left + width]:
+                    y0, y1 = sorted([cy + dy * offset, cy + dy * (offset + length)])
+                    rects.append((y0, y1, cx - line // 2, cx - line // 2 + line))
+        return [(max(t, 0), min(b, size[1]), max(l, 0), min(r, size[0])) for t, b, l, r in rects]
+
+    base, ext = os.path.splitext(output)
+    paths = []
+    with tempfile.TemporaryDirectory() as directory:
+        raws = [os.path.join(directory, name + '.npy') for name in ['recto', 'verso']]
+        spooled = [_spool(spec, dpi, text_engine, tile_rows, jobs, raw) for spec, raw in zip([recto, verso], raws)]
+        for name, raw, places in [('front', spooled[0], front), ('back', spooled[1], back)]:
+            side = np.load(raw, mmap_mode='r')
+            paths.append(_sheet("{}_{}{}".format(base, name, ext), side, places, size, dpi, marks(places)))
+            del side
+    return paths, len(slots)
+
+
+def main(argv=None):
+    from .engine import TEXT_ENGINES, available_specs, build_spec, default_table, get_cosmology
+
+    parser = argparse.ArgumentParser(description="High-dpi png/tiff of sides or imposed sheets, "
+                                                 "streamed in tiles in bounded memory.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    side = sub.add_parser('side', help="one side")
+    side.add_argument('side', help="spec file, or one of {}".format(', '.join(available_specs())))
+    side.add_argument('--verify', action='store_true',
+                      help="check against a render in one piece (needs the memory of it)")
+    imp = sub.add_parser('impose', help="front and back of a duplex sheet of recto/verso copies")
+    imp.add_argument('--recto', default='recto')
+    imp.add_argument('--verso', default='verso')
+    imp.add_argument('-n', '--copies', type=int, default=None, help="bookmarks wanted: prints the sheets needed")
+    imp.add_argument('--sheet', default='A3', choices=['A4', 'A3', 'letter'])
+    imp.add_argument('--no-crop-marks', action='store_true')
+    for p in [side, imp]:
+        p.add_argument('-o', '--output', required=True, help="output .png or .tif")
+        p.add_argument('--dpi', type=int, default=1200)
+        p.add_argument('--cosmology', default='Planck18')
+        p.add_argument('--text-engine', choices=TEXT_ENGINES, default=None,
+                       help="typeset texts with LaTeX or matplotlib's mathtext (default: as in the spec)")
+        p.add_argument('--tile-rows', type=int, default=DEFAULT_TILE_ROWS,
+                       help="pixel rows rendered and written at once (memory of a band: 4 bytes per pixel)")
+        p.add_argument('--jobs', '-j', type=int, default=1, help="processes rendering bands")
+    args = parser.parse_args(argv)
+
+    cosmo = None if args.cosmology == 'Planck18' else get_cosmology(args.cosmology)
+    table = default_table(cosmo)
+    if args.command == 'side':
+        spec = build_spec(args.side, table, cosmo)
+        sha = export_tiled(spec, args.output, args.dpi, args.text_engine, args.tile_rows, args.jobs)
+        print("{}: {} x {} px".format(args.output, *pixel_size(spec, args.dpi)))
+        if args.verify:
+            same = monolithic_digest(spec, args.dpi, args.text_engine) == sha
+            print("identical to a render in one piece" if same else "DIFFERENT from a render in one piece")
+            if not same:
+                raise SystemExit(1)
+    else:
+        recto, verso = build_spec(args.recto, table, cosmo), build_spec(args.verso, table, cosmo)
+        paths, per_sheet = impose_raster(recto, verso, args.output, args.dpi, args.sheet, args.text_engine,
+                                         args.tile_rows, args.jobs, not args.no_crop_marks)
+        for path in paths:
+            print(path)
+        if args.copies:
+            print("{} copies per sheet: print {} duplex sheets".format(per_sheet, math.ceil(args.copies / per_sheet)))
+
+
+if __name__ == '__main__':
+    main()
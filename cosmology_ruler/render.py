@@ -0,0 +1,204 @@
+# Drawing and export of bookmark sides
+#
+# build_side(spec) draws one side described by a spec from
+# cosmology_ruler.sides and returns the matplotlib Figure. Texts are
+# typeset by LaTeX or by matplotlib's mathtext (text_engine, see
+# cosmology_ruler.labels).
+# export(fig, basename, formats, dpis) writes it in every format and dpi,
+# export_bytes(fig, format, dpi) returns one format without writing a file.
+# A density strip (spec "density", see cosmology_ruler.density) is drawn
+# next to an axis as one image.
+# retick_side(fig, spec) changes a drawn side to another spec of the same
+# layout (e.g. another cosmology): only ticks, labels and texts change;
+# retext_side(fig, texts) only the texts (e.g. another language).
+#
+# No pyplot and no change to the process-wide rcParams: the figure is a
+# plain Figure on its own Agg canvas (the pdf/svg canvases are attached
+# by savefig for the time of the call), and the style of the spec is set
+# on the artists themselves. Sides can then be built and drawn from
+# several threads at once, and nothing leaks from one bookmark to the next.
+#
+# Example:
+# fig = build_side(recto_spec())
+# export(fig, "CosmologyRulerBookmark_Recto_v0", formats=['png', 'pdf'], dpis=[300])
+#
+
+import io
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import mpl_toolkits.axisartist as axisartist
+
+from .labels import (MATH_FONTFAMILY, TEXT_ENGINES, mathtext_label, prepare_tex_labels,
+                     save_tex_cache, use_tex_cache)
+from .profiling import count, stage
+
+# output of these formats does not depend on the dpi (no raster content)
+VECTOR_FORMATS = ['pdf', 'svg', 'eps', 'ps']
+
+
+class SideFigure(Figure):
+    # LaTeX label boxes read from the table on disk by the renderers that
+    # draw the side (cosmology_ruler.labels)
+
+    def draw(self, renderer):
+        use_tex_cache(renderer)
+        super().draw(renderer)
+
+
+def setup_axes(fig, pos):
+    ax = fig.add_subplot(*pos, axes_class=axisartist.Axes)
+    ax.axis[:].set_visible(False)
+    ax.axis["x"] = ax.new_floating_axis(1, 0.5)
+    return ax
+
+
+def build_side(spec, text_engine=None):
+    """Figure of one bookmark side: a row of vertical axes plus texts.
+    text_engine ('usetex' or 'mathtext') overrides the one of the spec."""
+    text_engine = text_engine or spec.get('text_engine', 'mathtext')
+    if text_engine not in TEXT_ENGINES:
+        raise ValueError("text_engine must be one of {}".format(TEXT_ENGINES))
+    usetex = text_engine == 'usetex'
+
+    fig = SideFigure(figsize=spec['figsize'])
+    FigureCanvasAgg(fig)
+    fig.subplots_adjust(**spec['subplots_adjust'])
+
+    n = len(spec['axes'])
+    with stage('axes setup'):
+        for i, axis in enumerate(spec['axes']):
+            ax = setup_axes(fig, (1, n, i + 1))
+            ax.axis["x"].major_ticklabels.set_usetex(usetex)
+            if not usetex:
+                ax.axis["x"].major_ticklabels.set_math_fontfamily(MATH_FONTFAMILY)
+            set_axis(ax, axis)
+        count('axes', n)
+
+    with stage('text layout'):
+        for text in spec['texts']:
+            if usetex:
+                fig.text(usetex=True, **text)
+            else:
+                s, props = mathtext_label(text['s'])
+                fig.text(**dict(text, s=s, usetex=False, math_fontfamily=MATH_FONTFAMILY, **props))
+        count('texts', len(spec['texts']))
+
+    if spec.get('density') is not None:
+        with stage('density strip'):
+            draw_density(fig, fig.axes[spec['density']['axis']], spec['density'])
+
+    return fig
+
+
+def draw_density(fig, ax, density):
+    """Counts of density as one image, a strip left of the line of ax."""
+    from matplotlib.colors import LogNorm, Normalize
+
+    pos = ax.get_position()
+    x = pos.x0 + pos.width / 2 - density['offset'] - density['width']
+    strip = fig.add_axes([x, pos.y0, density['width'], pos.height], label='density')
+    strip.set_axis_off()
+    counts = np.asarray(density['counts'], dtype=float)[:, None]
+    if density.get('norm', 'log') == 'log':
+        norm = LogNorm(1, max(counts.max(), 1))
+        counts = np.ma.masked_less(counts, 1)
+    else:
+        norm = Normalize(0, max(counts.max(), 1))
+    strip.imshow(counts, cmap=density.get('cmap', 'Greys'), norm=norm, origin='lower', aspect='auto',
+                 interpolation='nearest', extent=(0, 1) + tuple(density['ylim']))
+    strip.set_ylim(*density['ylim'])
+    return strip
+
+
+def set_axis(ax, axis):
+    # limits, scale, ticks and labels of one axis of a spec
+    ax.set_ylim(*axis['ylim'])
+    ax.set_yscale(axis.get('yscale', 'linear'))
+    ax.set_yticks(axis['ticks'], labels=axis.get('labels'))
+    count('ticks', len(axis['ticks']))
+    if axis.get('more_ticks') is not None:
+        # more ticks, the labels stay on the ticks above
+        ax.set_yticks(axis['more_ticks'])
+        count('ticks', len(axis['more_ticks']))
+
+
+def retick_side(fig, spec, text_engine=None):
+    """Change fig, drawn by build_side, to spec: same figure, axes and
+    texts (number and places), new ticks, labels and text strings. No
+    artist is created, the figure is not drawn."""
+    axes = [ax for ax in fig.axes if ax.get_label() != 'density']
+    if len(axes) != len(spec['axes']) or len(fig.texts) != len(spec['texts']):
+        raise ValueError("spec {} does not have the layout of the figure".format(spec.get('name')))
+    with stage('axes setup'):
+        for ax, axis in zip(axes, spec['axes']):
+            set_axis(ax, axis)
+    return retext_side(fig, spec['texts'], text_engine or spec.get('text_engine'))
+
+
+def retext_side(fig, texts, text_engine=None):
+    """Change the strings of the texts of fig, drawn by build_side, to
+    those of texts (same number and places, e.g. another language): the
+    axes are not touched, the figure is not drawn."""
+    usetex = (text_engine or 'mathtext') == 'usetex'
+    if len(fig.texts) != len(texts):
+        raise ValueError("{} texts for the {} of the figure".format(len(texts), len(fig.texts)))
+    with stage('text layout'):
+        for artist, text in zip(fig.texts, texts):
+            if usetex:
+                artist.set_text(text['s'])
+            else:
+                s, props = mathtext_label(text['s'])
+                artist.set_text(s)
+                artist.set_fontweight(props.get('fontweight', text.get('fontweight', 'normal')))
+    return fig
+
+
+def export(fig, basename, formats=('png', 'pdf'), dpis=(300,)):
+    """Write fig as basename.<format> for every format; with several dpis,
+    raster formats are written as basename_<dpi>dpi.<format>.
+
+    The figure is laid out once (text metrics, TeX labels) before writing;
+    vector formats are written once whatever the dpis, raster formats
+    once per dpi. Returns the list of written paths."""
+    layout(fig, dpis if any(fmt not in VECTOR_FORMATS for fmt in formats) else ())
+    paths = []
+    for path, fmt, dpi in output_files(basename, formats, dpis):
+        with stage('export.' + fmt):
+            fig.savefig(path, format=fmt, dpi=dpi)
+        count('files written')
+        paths.append(path)
+    save_tex_cache()
+    return paths
+
+
+def export_bytes(fig, fmt='png', dpi=300):
+    """fig in format fmt (at dpi for raster formats), as bytes."""
+    layout(fig, () if fmt in VECTOR_FORMATS else (dpi,))
+    buf = io.BytesIO()
+    with stage('export.' + fmt):
+        fig.savefig(buf, format=fmt, dpi=dpi)
+    save_tex_cache()
+    return buf.getvalue()
+
+
+def layout(fig, raster_dpis=()):
+    # text metrics and TeX labels, once before writing
+    with stage('tex labels'):
+        prepare_tex_labels(fig, raster_dpis)
+    with stage('text layout'):
+        fig.draw_without_rendering()
+
+
+def output_files(basename, formats=('png', 'pdf'), dpis=(300,)):
+    """(path, format, dpi) of the files written by export."""
+    files = []
+    for fmt in formats:
+        for dpi in (dpis[:1] if fmt in VECTOR_FORMATS else dpis):
+            if len(dpis) > 1 and fmt not in VECTOR_FORMATS:
+                path = "{}_{}dpi.{}".format(basename, dpi, fmt)
+            else:
+                path = "{}.{}".format(basename, fmt)
+            files.append((path, fmt, dpi))
+    return files
@@ -0,0 +1,504 @@
+# Local web service rendering bookmarks on demand
+#
+# A small HTTP server (standard library only) around the ruler build, for
+# a classroom: a form to choose the cosmology, the side (recto, verso,
+# 21cm, any redshift range, or the band of an instrument with its lines),
+# the language and the format, and the bookmark is sent back as PNG, PDF
+# or SVG.
+#
+#   GET /                 the form
+#   GET /bookmark?...     the bookmark; parameters: cosmology, side
+#                         (recto, verso, 21cm, ruler or a band of
+#                         cosmology_ruler.lines.BANDS), zmin, zmax, scale
+#                         (ruler), lines (band, comma separated), lang,
+#                         format (png, pdf, svg), dpi (png), text_engine,
+#                         auto_ticks
+#   GET /options          the choices, as JSON
+#   GET /metrics          latencies and cache statistics, as JSON
+#
+# Rendering is done by a pool of worker processes (--workers), which caps
+# the number of renders at once; beyond --max-pending different bookmarks
+# waiting, requests are refused (503). Identical requests arriving while
+# their bookmark is being rendered wait for that render instead of
+# starting another one. Rendered bookmarks are kept in a bounded LRU cache
+# (--cache-items, --cache-mb); each worker keeps its cosmology tables and
+# side specs (planned ticks) in LRU caches as well. If a worker dies (e.g.
+# killed for memory), the pool is replaced by a new one and the requests
+# it was rendering are refused (503).
+#
+# Example:
+# python -m cosmology_ruler.server --port 8000 --workers 4
+# then open http://localhost:8000/
+#
+# TeX is slow to start and may not be installed: texts are typeset by
+# mathtext unless --text-engine usetex (or text_engine=usetex).
+#
+
+import argparse
+import collections
+import concurrent.futures
+import functools
+import html
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from .manifest import digest
+
+CONTENT_TYPES = {'png': 'image/png', 'pdf': 'application/pdf', 'svg': 'image/svg+xml'}
+SIDES = ['recto', 'verso', '21cm', 'ruler']
+MAX_DPI = 600
+
+# per worker process
+TABLE_CACHE = 8
+SPEC_CACHE = 64
+
+
+class Busy(Exception):
+    pass
+
+
+# Requests
+#----------
+
+def _one(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _float(query, name, default):
+    try:
+        return float(_one(query, name, default))
+    except ValueError:
+        raise ValueError("{} must be a number".format(name))
+
+
+def parse_request(query, text_engine='mathtext'):
+    """Canonical bookmark request from the query parameters (dict of
+    lists, as from urllib.parse.parse_qs); ValueError if invalid."""
+    import astropy.cosmology
+
+    from .engine import available_languages
+    from .labels import TEXT_ENGINES
+    from .lines import BANDS, LINES
+
+    request = {
+        'cosmology': _one(query, 'cosmology', 'Planck18'),
+        'side': _one(query, 'side', 'recto'),
+        'lang': _one(query, 'lang', 'en'),
+        'format': _one(query, 'format', 'png'),
+        'text_engine': _one(query, 'text_engine', text_engine),
+        'auto_ticks': _one(query, 'auto_ticks', '0') in ['1', 'true', 'on', 'yes'],
+    }
+    if request['cosmology'] not in astropy.cosmology.available:
+        raise ValueError("unknown cosmology {!r}, one of {}".format(
+            request['cosmology'], ', '.join(astropy.cosmology.available)))
+    if request['side'] not in SIDES and request['side'] not in BANDS:
+        raise ValueError("unknown side {!r}, one of {}".format(request['side'], ', '.join(SIDES + list(BANDS))))
+    if request['lang'] not in available_languages():
+        raise ValueError("unknown language {!r}, one of {}".format(request['lang'], ', '.join(available_languages())))
+    if request['format'] not in CONTENT_TYPES:
+        raise ValueError("format must be one of {}".format(', '.join(CONTENT_TYPES)))
+    if request['text_engine'] not in TEXT_ENGINES:
+        raise ValueError("text_engine must be one of {}".format(', '.join(TEXT_ENGINES)))
+
+    # the dpi of vector formats does not change them
+    request['dpi'] = int(_float(query, 'dpi', 150)) if request['format'] == 'png' else 72
+    if not 30 <= request['dpi'] <= MAX_DPI:
+        raise ValueError("dpi must be within [30, {}]".format(MAX_DPI))
+    if request['side'] == 'ruler':
+        request['scale'] = _one(query, 'scale', 'log')
+        request['zmin'] = _float(query, 'zmin', 0.1 if request['scale'] == 'log' else 0.)
+        request['zmax'] = _float(query, 'zmax', 1000. if request['scale'] == 'log' else 30.)
+        if request['scale'] not in ['log', 'linear']:
+            raise ValueError("scale must be log or linear")
+        if not (request['zmin'] < request['zmax'] <= 1000) or request['zmin'] < 0 or \
+                (request['scale'] == 'log' and request['zmin'] <= 0):
+            raise ValueError("need 0 <= zmin < zmax <= 1000 (zmin > 0 in log scale)")
+    elif request['side'] in BANDS:
+        lines = [name.strip() for name in _one(query, 'lines', '').split(',') if name.strip()]
+        unknown = [name for name in lines if name not in LINES]
+        if unknown:
+            raise ValueError("unknown line(s) {}, see /options".format(', '.join(unknown)))
+        request['lines'] = lines
+    return request
+
+
+def file_name(request):
+    return "CosmologyRulerBookmark_{}_{}.{}".format(request['side'], request['cosmology'], request['format'])
+
+
+# Rendering (worker processes)
+#------------------------------
+
+@functools.lru_cache(maxsize=TABLE_CACHE)
+def _table(cosmology):
+    from .engine import default_table, get_cosmology
+
+    return default_table(get_cosmology(cosmology))
+
+
+@functools.lru_cache(maxsize=SPEC_CACHE)
+def _side(key):
+    # spec of a side (ticks planned, texts) for the request without its format
+    from astropy.cosmology import Planck18
+
+    from .engine import build_spec, get_cosmology
+    from .lines import band_spec
+    from .sides import ruler_spec
+
+    request = json.loads(key)
+    table = _table(request['cosmology'])
+    cosmo = get_cosmology(request['cosmology'])
+    # Planck18: the texts of the printed bookmark
+    cosmo = None if cosmo is Planck18 else cosmo
+    if request['side'] == 'ruler':
+        return ruler_spec(request['zmin'], request['zmax'], request['scale'], table, cosmo,
+                          language=request['lang'])
+    if request['side'] in SIDES:
+        return build_spec(request['side'], table, cosmo, request['auto_ticks'], request['lang'])
+    return build_spec(band_spec(request['side'], request['lines']), table, cosmo,
+                      request['auto_ticks'], request['lang'])
+
+
+def warm_up():
+    # imports and default table, before the first request
+    from . import render  # noqa: F401
+
+    _table('Planck18')
+
+
+def request_spec(request):
+    """Spec of the side of a request (see parse_request), cached."""
+    return _side(json.dumps({k: v for k, v in request.items() if k not in ['format', 'dpi', 'text_engine']},
+                            sort_keys=True))
+
+
+def render_request(request):
+    """Bookmark of a request (see parse_request): dict(data, seconds,
+    table_cached, spec_cached)."""
+    from .render import build_side, export_bytes
+
+    start = time.perf_counter()
+    tables, specs = _table.cache_info().hits, _side.cache_info().hits
+    spec = request_spec(request)
+    fig = build_side(spec, request['text_engine'])
+    data = export_bytes(fig, request['format'], request['dpi'])
+    return dict(data=data, seconds=time.perf_counter() - start,
+                table_cached=_table.cache_info().hits > tables, spec_cached=_side.cache_info().hits > specs)
+
+
+# Caches and metrics
+#--------------------
+
+class LRUCache:
+    """Bounded mapping: at most max_items values and max_bytes bytes (sum
+    of their len), the least recently used dropped first."""
+
+    def __init__(self, max_items=256, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def peek(self, key):
+        # without counting a hit or a miss, nor refreshing key
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= len(self._data.pop(key))
+            if self.max_bytes is not None and len(value) > self.max_bytes:
+                return
+            self._data[key] = value
+            self.nbytes += len(value)
+            while len(self._data) > self.max_items or \
+                    (self.max_bytes is not None and self.nbytes > self.max_bytes):
+                self.nbytes -= len(self._data.popitem(last=False)[1])
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(items=len(self._data), bytes=self.nbytes, max_items=self.max_items,
+                        max_bytes=self.max_bytes, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions)
+
+
+class Metrics:
+    """Latencies of the last window requests of each outcome (cached,
+    shared, rendered, invalid, busy, error; worker: time of the renders in
+    the workers), and counters."""
+
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, outcome, seconds):
+        with self._lock:
+            self.latencies[outcome].append(seconds)
+            self.counters[outcome] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            latency = {}
+            for outcome, values in self.latencies.items():
+                ms = np.array(values) * 1e3
+                p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+                latency[outcome] = dict(count=len(ms), **{name: round(float(v), 3) for name, v in zip(
+                    ['mean', 'p50', 'p90', 'p99', 'max'], [ms.mean(), p50, p90, p99, ms.max()])})
+            return dict(uptime=time.time() - self.started, counters=dict(self.counters), latency_ms=latency)
+
+
+# Service
+#---------
+
+class BookmarkService:
+    """Bookmarks rendered by a pool of workers processes, with a cache of
+    the outputs and deduplication of the requests in flight."""
+
+    def __init__(self, workers=2, cache_items=256, cache_bytes=256 * 2**20, max_pending=32,
+                 text_engine='mathtext'):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.text_engine = text_engine
+        self.pool = self._new_pool()
+        self.outputs = LRUCache(cache_items, cache_bytes)
+        self.metrics = Metrics()
+        self.inflight = {}
+        self._lock = threading.Lock()
+
+    def bookmark(self, query):
+        """(bytes, request, key, outcome) of the bookmark asked by query;
+        outcome: cached, shared (rendered for an identical request) or
+        rendered. Raises ValueError (bad request) or Busy."""
+        request = parse_request(query, self.text_engine)
+        key = digest(request)
+        data = self.outputs.get(key)
+        if data is not None:
+            return data, request, key, 'cached'
+        with self._lock:
+            # rendered since, while waiting for the lock
+            data = self.outputs.peek(key)
+            if data is not None:
+                return data, request, key, 'cached'
+            future, pool = self.inflight.get(key, (None, self.pool))
+            shared = future is not None
+            if not shared:
+                if len(self.inflight) >= self.max_pending:
+                    raise Busy("{} bookmarks being rendered, retry later".format(len(self.inflight)))
+                try:
+                    future = pool.submit(render_request, request)
+                except BrokenProcessPool:
+                    self._restart(pool)
+                    raise Busy("a worker died, workers restarted: retry")
+                self.inflight[key] = future, pool
+        if not shared:
+            # out of the lock: run at once, in this thread, if already done
+            future.add_done_callback(functools.partial(self._done, key))
+        try:
+            result = future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                self._restart(pool)
+            raise Busy("a worker died while rendering, workers restarted: retry")
+        return result['data'], request, key, 'shared' if shared else 'rendered'
+
+    def _new_pool(self):
+        return concurrent.futures.ProcessPoolExecutor(self.workers, initializer=warm_up)
+
+    def _restart(self, pool):
+        # new workers in place of the broken pool (lock held), once
+        if self.pool is pool:
+            self.pool = self._new_pool()
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.metrics.count('pool restarts')
+
+    def _done(self, key, future):
+        with self._lock:
+            del self.inflight[key]
+            if future.exception() is None:
+                result = future.result()
+                self.outputs.put(key, result['data'])
+                self.metrics.observe('worker', result['seconds'])
+                self.metrics.count('worker.table_hits', result['table_cached'])
+                self.metrics.count('worker.spec_hits', result['spec_cached'])
+
+    def options(self):
+        import astropy.cosmology
+
+        from .engine import available_languages
+        from .lines import BANDS, LINES
+
+        return dict(cosmologies=list(astropy.cosmology.available), sides=SIDES, bands=sorted(BANDS),
+                    lines=sorted(LINES), languages=available_languages(), formats=list(CONTENT_TYPES))
+
+    def status(self):
+        with self._lock:
+            inflight = len(self.inflight)
+        return dict(self.metrics.snapshot(), outputs=self.outputs.stats(), inflight=inflight,
+                    workers=self.workers, max_pending=self.max_pending)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+# HTTP
+#------
+
+def form_page(options):
+    def select(name, values, default=None):
+        items = ''.join('<option{}>{}</option>'.format(' selected' if v == default else '', html.escape(v))
+                        for v in values)
+        return '<label>{} <select name="{}">{}</select></label>'.format(name, name, items)
+
+    return """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Cosmology Ruler Bookmark</title>
+<style>body {{font-family: sans-serif; max-width: 40em}} label {{display: block; margin: 0.5em 0}}</style>
+</head><body>
+<h1>Cosmology Ruler Bookmark</h1>
+<form action="/bookmark" method="get">
+{cosmology}
+{side}
+<fieldset><legend>ruler: any redshift range</legend>
+<label>zmin <input name="zmin" value="0.1" size="6"></label>
+<label>zmax <input name="zmax" value="1000" size="6"></label>
+{scale}
+</fieldset>
+<fieldset><legend>instrument band: lines (comma separated, default: those of the band)</legend>
+<label>lines <input name="lines" size="30" placeholder="CO3-2, CII158"></label>
+<small>{lines}</small>
+</fieldset>
+{lang}
+{format}
+<label>dpi (png) <input name="dpi" value="150" size="4"></label>
+<label><input type="checkbox" name="auto_ticks" value="1"> ticks planned for the cosmology</label>
+<button type="submit">Render</button>
+</form>
+</body></html>
+""".format(cosmology=select('cosmology', options['cosmologies'], 'Planck18'),
+           side=select('side', options['sides'] + options['bands'], 'recto'),
+           scale=select('scale', ['log', 'linear'], 'log'),
+           lines=html.escape(', '.join(options['lines'])),
+           lang=select('lang', options['languages'], 'en'),
+           format=select('format', options['formats'], 'png'))
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    service = None
+    verbose = False
+
+    def send(self, status, content_type, body, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_json(self, status, obj):
+        self.send(status, 'application/json', json.dumps(obj, indent=1).encode())
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/':
+            self.send(200, 'text/html; charset=utf-8', form_page(self.service.options()).encode())
+        elif url.path == '/options':
+            self.send_json(200, self.service.options())
+        elif url.path == '/metrics':
+            self.send_json(200, self.service.status())
+        elif url.path == '/bookmark':
+            self.bookmark(urllib.parse.parse_qs(url.query))
+        else:
+            self.send_json(404, {'error': 'not found: ' + url.path})
+
+    do_HEAD = do_GET
+
+    def bookmark(self, query):
+        start = time.perf_counter()
+        try:
+            data, request, key, outcome = self.service.bookmark(query)
+        except ValueError as e:
+            self.service.metrics.observe('invalid', time.perf_counter() - start)
+            return self.send_json(400, {'error': str(e)})
+        except Busy as e:
+            self.service.metrics.observe('busy', time.perf_counter() - start)
+            return self.send_json(503, {'error': str(e)})
+        except Exception as e:
+            self.service.metrics.observe('error', time.perf_counter() - start)
+            return self.send_json(500, {'error': "{}: {}".format(type(e).__name__, e)})
+
+        etag = '"{}"'.format(key[:32])
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+        else:
+            self.send(200, CONTENT_TYPES[request['format']], data, [
+                ('Content-Disposition', 'inline; filename="{}"'.format(file_name(request))),
+                ('ETag', etag), ('X-Bookmark-Cache', outcome)])
+        self.service.metrics.observe(outcome, time.perf_counter() - start)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv=None):
+    from .labels import TEXT_ENGINES
+
+    parser = argparse.ArgumentParser(description="Local web service rendering bookmarks on demand.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2,
+                        help="worker processes: bookmarks rendered at once")
+    parser.add_argument('--max-pending', type=int, default=32,
+                        help="different bookmarks waiting or rendering, beyond which requests are refused")
+    parser.add_argument('--cache-items', type=int, default=256, help="rendered bookmarks kept in memory")
+    parser.add_argument('--cache-mb', type=float, default=256., help="memory of the rendered bookmarks kept")
+    parser.add_argument('--text-engine', choices=TEXT_ENGINES, default='mathtext',
+                        help="default engine of the texts (mathtext: no TeX needed)")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args(argv)
+
+    service = BookmarkService(args.workers, args.cache_items, int(args.cache_mb * 2**20),
+                              args.max_pending, args.text_engine)
+    handler = type('BookmarkHandler', (Handler,), dict(service=service, verbose=args.verbose))
+    server = http.server.ThreadingHTTPServer((args.host, args.port), handler)
+    print("serving bookmarks on http://{}:{}/".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Specifications of the bookmark sides
+#
+# Each function returns the spec of one side, as used by
+# cosmology_ruler.render.build_side: figure size and margins, one entry
+# per vertical axis (scale, limits, ticks and labels) and the texts placed
+# on the figure, with the engine typesetting them (LaTeX or mathtext).
+# The sides are described by the spec files of cosmology_ruler/specs
+# (tick lists, texts), built by cosmology_ruler.engine.
+#
+# recto_spec: redshift range [0.1, 1000] in log scale
+# verso_spec: redshift range [0, 30] in linear scale
+# spec_21cm:  redshift, age, observed 21cm wavelength and frequency
+#             (lines of other rulers: cosmology_ruler.lines)
+# ruler_spec: the axes of the recto and verso for any redshift range
+#
+# The ticks of the recto, verso and 21cm are the hand-made lists of the
+# printed bookmark; with auto_ticks=True (and always in ruler_spec) they
+# are planned by cosmology_ruler.ticks for the cosmology and z range.
+#
+# Planck18 cosmology used
+# Astropy cosmology package used:
+# https://docs.astropy.org/en/stable/cosmology/index.html
+#
+
+import astropy.constants as cst
+
+from .engine import build_spec, default_table, language_strings, line_wavelength, load_spec
+
+
+#--------------------------------------------
+# ANY REDSHIFT RANGE : PLANNED TICKS
+#--------------------------------------------
+
+# strings of the z range of a ruler (translations: side "ruler" of specs/lang)
+RULER_STRINGS = {'label_axis1_format': "redshift z [{zmin:g}, {zmax:g}] in {scale} scale",
+                 'zrange_format': "$z \\in [{zmin:g}, {zmax:g}]$ in {scale} scale",
+                 'log': "log", 'linear': "linear"}
+
+
+def ruler_spec(zmin, zmax, scale='log', table=None, cosmo=None, name='ruler', texts=None, language=None):
+    # same axes and texts as the recto, ticks chosen automatically
+    spec = load_spec('recto')
+    strings = dict(RULER_STRINGS, **language_strings(language or spec.get('language'), 'ruler'))
+    fields = dict(zmin=zmin, zmax=zmax, scale=strings[scale])
+    spec['strings'].update(label_axis1=strings['label_axis1_format'].format(**fields),
+                           zrange=strings['zrange_format'].format(**fields))
+    spec.update(name=name, z=dict(min=zmin, max=zmax, scale=scale))
+    spec = build_spec(spec, table, cosmo, auto_ticks=True, language=language)
+    if texts is not None:
+        spec['texts'] = texts
+    return spec
+
+
+#--------------------------------------------
+# RECTO of BOOKMARK : LARGE REDSHIFT RANGE
+# redshift range [0.1, 1000] in log scale: specs/recto.json
+#--------------------------------------------
+
+def recto_spec(table=None, cosmo=None, auto_ticks=False):
+    # cosmo=None: Planck18, with the texts of the printed bookmark
+    return build_spec('recto', table, cosmo, auto_ticks)
+
+
+#--------------------------------------------
+# VERSO of BOOKMARK : SMALLER REDSHIFT RANGE
+# redshift range [0, 30] in linear scale: specs/verso.json
+#--------------------------------------------
+
+def verso_spec(table=None, cosmo=None, auto_ticks=False):
+    # cosmo=None: Planck18, with the texts of the printed bookmark
+    return build_spec('verso', table, cosmo, auto_ticks)
+
+
+#--------------------------------------------
+# 21cm BOOKMARK: specs/21cm.json
+# Modified by Adélie Gorce for 21cm cosmology
+#--------------------------------------------
+
+# Choose rest frequency of reference line
+lambda_ref = line_wavelength(load_spec('21cm')['line'])  # meters
+nu_ref = cst.c.si.value / lambda_ref  # Hz
+
+
+def spec_21cm(table=None, cosmo=None, auto_ticks=False):
+    # cosmo=None: Planck18, with the texts of the printed bookmark
+    return build_spec('21cm', table, cosmo, auto_ticks)
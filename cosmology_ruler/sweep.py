@@ -0,0 +1,276 @@
+# Cosmology parameter sweeps, as animations
+#
+# How the axes of a side move when one parameter of the cosmology (Om0,
+# H0, ...) goes away from Planck18: one frame per value of the parameter.
+# A side is built once per process; for each frame only the tick
+# positions and labels (from the batch inversion on the table of the
+# frame's cosmology, computed in memory and not cached on disk) and the
+# texts of the cosmology parameters change (render.retick_side), then the
+# figure is drawn again. The tables of the frames are as coarse as ticks
+# within a tenth of a pixel allow (fit degree and grid of
+# cosmology_ruler.precision.tolerances, at both ends of the sweep, e.g.
+# 513 points instead of 16385), and an H0 sweep reuses the fits of its
+# first frame where that is exact (FastFlatLCDM.share_fits).
+#
+# Frames are drawn by worker processes, a chunk of consecutive frames
+# each, and written in order as they arrive, with at most two chunks per
+# worker in flight: memory does not grow with the number of frames.
+#
+# Output: .gif (Pillow, written frame by frame), a video (.mp4, .webm,
+# .mkv, .avi: ffmpeg must be on the PATH, frames are piped to it), or a
+# directory of png frames.
+#
+# Example: Om0 from 0.2 to 0.4 and back, 200 frames, 8 processes
+# python -m cosmology_ruler.sweep --parameter Om0 --values 0.2 0.4 --frames 100 --bounce -o om0.gif -j 8
+#
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from .profiling import count, stage
+
+VIDEO_EXTENSIONS = ['.mp4', '.webm', '.mkv', '.avi', '.mov']
+# frames drawn by a worker per task
+CHUNK = 4
+
+# of a worker process: built side for (side, text_engine, dpi, language)
+_figures = {}
+# of a worker process: fast cosmology of an H0 sweep whose fits are shared
+_shared_fits = {}
+
+
+# Frames
+#--------
+
+def sweep_values(start, stop, frames, bounce=False):
+    """Values of the parameter, one per frame; bounce: back to start."""
+    values = np.linspace(start, stop, frames)
+    return np.concatenate([values, values[-2:0:-1]]) if bounce else values
+
+
+def frame_cosmology(base, parameter, value):
+    # base cosmology with parameter = value, named after it
+    name = "{} {}={:.4g}".format(base.name, parameter, value)
+    return base.clone(name=name, **{parameter: value})
+
+
+def frame_grid(sweep, values):
+    """Fit degree and table points (dict(degree, n)) of the frames: ticks
+    within a tenth of a pixel at the dpi of the sweep, for the values at
+    both ends (see cosmology_ruler.precision.tolerances)."""
+    from .fast import DEFAULT_DEGREE
+    from .precision import tolerances
+
+    # finer than half a pixel: labels read off the table at given
+    # redshifts, close to a rounding, are printed as with the full table
+    tolerance_mm = 25.4 / sweep['dpi'] / 10.
+    settings = [tolerances([sweep['side']], tolerance_mm, frame_cosmology(sweep['base'], sweep['parameter'], value))
+                for value in [min(values), max(values)]]
+    degrees = [s['degree'] or DEFAULT_DEGREE for s in settings]
+    return dict(degree=max(degrees), n=max(s['n'] for s in settings))
+
+
+def frame_spec(sweep, value):
+    from .cache import DEFAULT_GRID, cosmology_table
+    from .engine import build_spec
+    from .fast import DEFAULT_DEGREE, FastFlatLCDM, fast_cosmology
+
+    grid = sweep.get('grid') or dict(degree=DEFAULT_DEGREE, n=DEFAULT_GRID['n'])
+    cosmo = fast_cosmology(frame_cosmology(sweep['base'], sweep['parameter'], value), degree=grid['degree'])
+    if sweep['parameter'] == 'H0' and isinstance(cosmo, FastFlatLCDM):
+        first = _shared_fits.setdefault((repr(sweep['base']), grid['degree']), cosmo)
+        if first is not cosmo:
+            cosmo.share_fits(first)
+    table = cosmology_table(cosmo, n=grid['n'], directory=False)
+    return build_spec(sweep['side'], table, cosmo, sweep['auto_ticks'], sweep['language'])
+
+
+def draw_frames(sweep, values):
+    """RGBA arrays of the frames of values, drawn on the side built once in
+    this process; and the time taken by each frame."""
+    from .render import build_side, retick_side
+
+    key = (sweep['side'], sweep['text_engine'], sweep['dpi'], sweep['language'])
+    frames, times = [], []
+    for value in values:
+        start = time.perf_counter()
+        spec = frame_spec(sweep, value)
+        fig = _figures.get(key)
+        if fig is None:
+            fig = _figures[key] = build_side(spec, sweep['text_engine'])
+            fig.set_dpi(sweep['dpi'])
+        else:
+            retick_side(fig, spec, sweep['text_engine'])
+        with stage('frame draw'):
+            fig.canvas.draw()
+            frames.append(np.asarray(fig.canvas.buffer_rgba()).copy())
+        count('frames')
+        times.append(time.perf_counter() - start)
+    return frames, times
+
+
+def _ordered(results, ahead):
+    # results of the futures, in order, at most ahead of them pending
+    pending = collections.deque()
+    for submit in results:
+        pending.append(submit())
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def sweep_frames(sweep, values, jobs=1, chunk=CHUNK):
+    """(frame, time) of every value, in order; jobs: worker processes."""
+    chunks = [values[i:i + chunk] for i in range(0, len(values), chunk)]
+    if jobs == 1:
+        results = (draw_frames(sweep, c) for c in chunks)
+        for frames, times in results:
+            yield from zip(frames, times)
+        return
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        tasks = (lambda c=c: pool.submit(draw_frames, sweep, c) for c in chunks)
+        for frames, times in _ordered(tasks, 2 * jobs):
+            yield from zip(frames, times)
+
+
+# Writers
+#---------
+
+class PngFrames:
+    """One png per frame in a directory."""
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.n = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, frame):
+        from PIL import Image
+
+        Image.fromarray(frame).save(os.path.join(self.path, "frame_{:05d}.png".format(self.n)))
+        self.n += 1
+
+    def close(self):
+        pass
+
+
+class GifWriter:
+    """Animated gif streamed frame by frame (Pillow's gif header and frame
+    encoders), each frame quantized with its own palette."""
+
+    def __init__(self, path, fps):
+        self.f = open(path, 'wb')
+        self.duration = 1000. / fps
+        self.started = False
+
+    def write(self, frame):
+        from PIL import GifImagePlugin, Image
+
+        image = Image.fromarray(frame).convert('RGB').quantize(colors=64)
+        if not self.started:
+            header, _ = GifImagePlugin.getheader(image, info={'loop': 0})
+            self.f.write(b''.join(header))
+            self.started = True
+        for data in GifImagePlugin.getdata(image, duration=self.duration, include_color_table=True):
+            self.f.write(data)
+
+    def close(self):
+        if self.started:
+            self.f.write(b';')
+        self.f.close()
+
+
+class FFmpegWriter:
+    """Video written by ffmpeg, frames piped as raw RGBA."""
+
+    def __init__(self, path, fps):
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError("videos need ffmpeg on the PATH (or write a .gif or a directory of frames)")
+        self.path = path
+        self.fps = fps
+        self.process = None
+
+    def write(self, frame):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.process = subprocess.Popen(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                 '-s', '{}x{}'.format(width, height), '-r', str(self.fps), '-i', '-',
+                 # yuv420p: even width and height
+                 '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white', '-pix_fmt', 'yuv420p', self.path],
+                stdin=subprocess.PIPE)
+        self.process.stdin.write(frame.tobytes())
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait():
+                raise RuntimeError("ffmpeg failed writing {}".format(self.path))
+
+
+def open_writer(path, fps):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.gif':
+        return GifWriter(path, fps)
+    if ext in VIDEO_EXTENSIONS:
+        return FFmpegWriter(path, fps)
+    if ext:
+        raise ValueError("unknown output {!r}: .gif, {} or a directory".format(path, ', '.join(VIDEO_EXTENSIONS)))
+    return PngFrames(path, fps)
+
+
+def main(argv=None):
+    from .engine import TEXT_ENGINES, available_languages, available_specs, get_cosmology
+    from .profiling import add_profile_arguments, profiler_from_args
+
+    parser = argparse.ArgumentParser(description="Animate the ruler while a cosmological parameter changes.")
+    parser.add_argument('--side', default='recto',
+                        help="spec file, or one of {}".format(', '.join(available_specs())))
+    parser.add_argument('--cosmology', default='Planck18', help="cosmology the sweep starts from")
+    parser.add_argument('--parameter', default='Om0', help="parameter swept: Om0, H0, Tcmb0, ...")
+    parser.add_argument('--values', nargs=2, type=float, default=[0.2, 0.4], metavar=('START', 'STOP'))
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--bounce', action='store_true', help="from START to STOP and back")
+    parser.add_argument('--fps', type=float, default=20.)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--auto-ticks', action='store_true',
+                        help="ticks planned for each frame instead of the printed lists")
+    parser.add_argument('--lang', choices=available_languages(), default='en')
+    parser.add_argument('--text-engine', choices=TEXT_ENGINES, default='mathtext')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="worker processes")
+    parser.add_argument('--output', '-o', default='sweep.gif',
+                        help=".gif, a video ({}) or a directory of png frames".format(', '.join(VIDEO_EXTENSIONS)))
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    sweep = dict(side=args.side, base=get_cosmology(args.cosmology), parameter=args.parameter,
+                 auto_ticks=args.auto_ticks, language=args.lang, text_engine=args.text_engine, dpi=args.dpi)
+    values = sweep_values(*args.values, args.frames, args.bounce)
+    writer = open_writer(args.output, args.fps)
+    start = time.perf_counter()
+    times = []
+    with profiler_from_args(args) as profiler:
+        with stage('frame grid'):
+            sweep['grid'] = frame_grid(sweep, values)
+        for frame, seconds in sweep_frames(sweep, values, args.jobs):
+            with stage('frame write'):
+                writer.write(frame)
+            times.append(seconds)
+        with stage('frame write'):
+            writer.close()
+    if args.profile_report:
+        profiler.write(args.profile_report)
+    print("{}: {} frames in {:.1f} s; per frame: first {:.0f} ms, then {:.0f} ms (median)".format(
+        args.output, len(times), time.perf_counter() - start, times[0] * 1e3, np.median(times[1:] or times) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# Tick tables of the bookmark sides, without drawing them
+#
+# The numbers only: for every axis of a side, its ticks with their
+# redshift, position along the axis (fraction from the bottom, and mm on
+# the printed bookmark) and label (none for the unlabelled ticks). Written
+# as JSON (one document, all sides) or CSV (one row per tick), for web
+# front ends and laser cutters.
+#
+# Only numpy and the cosmology layer are imported: no matplotlib, no TeX.
+# Planck18 comes from the table cache (cosmology_ruler.cache.named_table);
+# other cosmologies import astropy.cosmology. Planned ticks (--auto-ticks)
+# measure their labels with matplotlib's font metrics, which imports it.
+#
+# Example:
+# python -m cosmology_ruler.tables recto verso 21cm -o ticks.json
+# python -m cosmology_ruler.tables recto --cosmology WMAP9 -o ticks.csv
+# python redshift_ruler.py --tables-only
+#
+
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+from .cache import COLUMNS, UNITS
+from .engine import available_specs, build_spec, default_table, get_cosmology, load_spec
+from .lines import DEFAULT_UNITS
+
+MM_PER_POINT = 25.4 / 72.
+CSV_FIELDS = ['side', 'axis', 'quantity', 'unit', 'z', 'position', 'mm', 'label']
+
+
+def quantity_unit(axis):
+    # unit of the values of a declarative axis
+    if axis['quantity'] in COLUMNS:
+        return str(UNITS[COLUMNS.index(axis['quantity'])])
+    return axis.get('unit') or DEFAULT_UNITS.get(axis['quantity'], '')
+
+
+def tick_table(side, table=None, cosmo=None, auto_ticks=False):
+    """Ticks of side (shipped spec name, spec file or dict) for cosmo
+    (default: Planck18): dict(name, scale, zmin, zmax, length_mm,
+    axes=[dict(quantity, unit, ticks=[dict(z, position, mm, label)])]),
+    ticks from the bottom of the axis up; label None: unlabelled tick."""
+    from .ticks import axis_length
+
+    spec = load_spec(side)
+    built = build_spec(spec, table or default_table(cosmo), cosmo, auto_ticks)
+    scale = spec.get('z', {}).get('scale', 'log')
+    length = axis_length(built['figsize'], built['subplots_adjust']) * MM_PER_POINT
+    axes, zlim = [], None
+    for axis, entry in zip(spec['axes'], built['axes']):
+        log = entry.get('yscale') == 'log'
+        # axis coordinates: log10(z) on log-scale axes, as in the spec otherwise
+        to_coord = np.log10 if log else (lambda c: np.asarray(c, dtype=float))
+        to_z = (lambda c: 10**c) if log or scale == 'log' else (lambda c: c)
+        c0, c1 = to_coord(entry['ylim'])
+        zlim = zlim or (float(to_z(c0)), float(to_z(c1)))
+        # labelled ticks, and all of them (more_ticks)
+        labels = dict(zip(np.round(to_coord(entry['ticks']), 9), entry['labels']))
+        coords = to_coord(np.concatenate([entry['ticks'], entry.get('more_ticks', [])]))
+        keys, first = np.unique(np.round(coords, 9), return_index=True)
+        rows = []
+        for key, c in zip(keys, coords[first]):
+            position = (c - c0) / (c1 - c0)
+            rows.append(dict(z=float(to_z(c)), position=float(position), mm=float(position * length),
+                             label=labels.get(key)))
+        axes.append(dict(quantity=axis['quantity'], unit=quantity_unit(axis), ticks=rows))
+    return dict(name=built['name'], scale=scale, zmin=zlim[0], zmax=zlim[1], length_mm=float(length), axes=axes)
+
+
+def write_tables(tables, path):
+    """Tick tables (list of tick_table) as JSON, or CSV if path ends with .csv."""
+    if os.path.splitext(path)[1].lower() != '.csv':
+        with open(path, 'w') as f:
+            json.dump({'sides': tables}, f, indent=1)
+        return path
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, CSV_FIELDS)
+        writer.writeheader()
+        for table in tables:
+            for i, axis in enumerate(table['axes']):
+                for tick in axis['ticks']:
+                    writer.writerow(dict(tick, side=table['name'], axis=i, quantity=axis['quantity'],
+                                         unit=axis['unit'], label='' if tick['label'] is None else tick['label']))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tick tables of bookmark sides (JSON or CSV), without drawing.")
+    parser.add_argument('sides', nargs='*', default=['recto', 'verso'],
+                        help="spec files, or names of shipped specs ({})".format(', '.join(available_specs())))
+    parser.add_argument('--cosmology', default='Planck18', help="astropy cosmology (default: Planck18)")
+    parser.add_argument('--auto-ticks', action='store_true', help="plan the ticks for the cosmology")
+    parser.add_argument('--output', '-o', default='CosmologyRulerBookmark_ticks.json',
+                        help="output .json or .csv file")
+    args = parser.parse_args(argv)
+
+    cosmo = table = None
+    if args.cosmology != 'Planck18':
+        cosmo = get_cosmology(args.cosmology)
+        table = default_table(cosmo)
+    tables = [tick_table(side, table, cosmo, args.auto_ticks) for side in args.sides]
+    print(write_tables(tables, args.output))
+
+
+if __name__ == '__main__':
+    main()
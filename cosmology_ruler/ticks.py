@@ -0,0 +1,232 @@
+# Automatic tick planning for the ruler axes
+#
+# Instead of hand-made tick lists, the ticks of an axis are chosen from
+# round values of its quantity (age, lookback time, z, ...), roundest
+# first:
+#   1. candidates: multiples of the steps 5, 2, 1 x 10^k in the range of
+#      the quantity on the side (at most max_digits significant digits),
+#      all inverted to redshifts in one batch (cosmology table)
+#   2. from the coarsest step to the finest, a step is used only where its
+#      consecutive multiples are at least one label apart on the axis, and
+#      each new value is labelled if its label does not collide with the
+#      labels already placed (text extents from the font metrics, no draw)
+#   3. minor ticks (unlabelled) are chosen the same way, with a smaller
+#      separation
+# A new cosmology or z range then needs one pass, no re-render.
+#
+# Example: ticks of the lookback time axis of the recto
+# plan_quantity(table, 'lookback_time', 0.1, 1000, 'log', length=739)
+#
+# python -m cosmology_ruler.ticks --zmin 0.1 --zmax 1000 --scale log
+#
+
+import argparse
+import bisect
+import functools
+import math
+
+import numpy as np
+
+from .profiling import count, stage
+
+# 1 point = 1/72 inch
+POINTS_PER_INCH = 72.
+# matplotlib (axisartist) tick label size
+FONTSIZE = 10.
+
+
+def axis_coordinates(z, scale):
+    """Coordinate of redshifts z along an axis: log10(z) or z."""
+    z = np.asarray(z, dtype=float)
+    if scale == 'log':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.log10(z)
+    return z
+
+
+def step_label(value, step):
+    # shortest decimal writing of value, a multiple of step
+    decimals = max(0, -int(math.floor(math.log10(step) + 1e-9)))
+    return np.format_float_positional(round(value, decimals), precision=decimals, trim='-')
+
+
+@functools.lru_cache(maxsize=4096)
+def _text_width(s, fontsize):
+    from matplotlib.font_manager import FontProperties
+    from matplotlib.textpath import text_to_path
+
+    return text_to_path.get_text_width_height_descent(s, FontProperties(size=fontsize), ismath=False)[0]
+
+
+def label_extent(labels, fontsize=FONTSIZE):
+    """Extents along the axis (points) of the labels, written along the
+    vertical axes: their widths, from the font metrics only (no draw)."""
+    return np.array([_text_width(s, fontsize) for s in labels])
+
+
+def candidates(vmin, vmax, vlow, max_digits=5):
+    """Round values of [vmin, vmax]: list of (step, values), coarsest step
+    first. Values below vlow > 0 are not refined further."""
+    top = max(abs(vmin), abs(vmax))
+    if not (np.isfinite(top) and top > 0 and 0 < vlow < np.inf):
+        raise ValueError("no round values in [{:g}, {:g}] down to {:g}: the range must be "
+                         "finite and not zero".format(vmin, vmax, vlow))
+    kmax = int(math.ceil(math.log10(top)))
+    kmin = int(math.floor(math.log10(vlow))) - max_digits + 1
+    levels = []
+    for k in range(kmax, kmin - 1, -1):
+        for mantissa in [5, 2, 1]:
+            step = mantissa * 10.**k
+            lo = math.ceil(vmin / step - 1e-9)
+            hi = math.floor(vmax / step + 1e-9)
+            # at most max_digits significant digits
+            hi = min(hi, 10**max_digits)
+            lo = max(lo, -10**max_digits)
+            if hi >= lo:
+                levels.append((step, np.arange(lo, hi + 1) * step))
+    return levels
+
+
+def plan_ticks(value_of, z_of, zmin, zmax, scale='log', length=700., fontsize=FONTSIZE,
+               pad=None, minor_sep=None, minor=True, max_digits=5, label_values=None, fmt=None):
+    """Ticks of one axis of quantity value_of(z) over [zmin, zmax].
+
+    value_of(z) and z_of(values) convert between redshifts and values of
+    the quantity (z_of takes an array: all candidates are inverted in one
+    call). length is the axis length in points, pad the free space between
+    labels (default: fontsize / 2), minor_sep the minimum distance between
+    ticks (default: fontsize / 2; minor=False: no minor ticks). Labels are the values, written with the
+    digits of their step, or fmt.format(x) of x = label_values(values)
+    (non-finite x are not labelled).
+
+    Returns dict(ticks, labels[, more_ticks]) in axis coordinates (log10(z)
+    or z), as in the axes of the specs of cosmology_ruler.sides: more_ticks
+    are all the ticks, labelled or not."""
+    pad = fontsize / 2. if pad is None else pad
+    minor_sep = fontsize / 2. if minor_sep is None else minor_sep
+    c0, c1 = axis_coordinates([zmin, zmax], scale)
+
+    with stage('tick planning'):
+        # quantity along the axis: range, and smallest non-zero value
+        zs = zmin + (zmax - zmin) * np.linspace(0, 1, 1001) if scale != 'log' else np.geomspace(zmin, zmax, 1001)
+        # (finite values only: e.g. arcsec_per_kpc_proper is infinite at z = 0)
+        vs = np.asarray(value_of(zs), dtype=float)
+        vs = vs[np.isfinite(vs)]
+        if not np.any(vs != 0):
+            raise ValueError("the quantity has no finite non-zero value for z in [{:g}, {:g}]: "
+                             "no ticks to plan".format(zmin, zmax))
+        vmin, vmax = vs.min(), vs.max()
+        levels = candidates(vmin, vmax, np.abs(vs[vs != 0]).min(), max_digits)
+
+        # one inversion for all candidates
+        values = np.concatenate([v for _, v in levels])
+        positions = (axis_coordinates(z_of(values), scale) - c0) / (c1 - c0) * length
+        count('tick candidates', values.size)
+        if label_values is not None:
+            with np.errstate(all='ignore'):
+                shown = np.asarray(label_values(values), dtype=float)
+        start = 0
+
+        # a value placed at a coarser step collides with itself later on
+        majors, ticks = [], []  # sorted positions: labelled, all
+        widths = []  # of the labels of majors
+        labelled, unlabelled = [], []
+        for step, v in levels:
+            p = positions[start:start + len(v)]
+            x = shown[start:start + len(v)] if label_values is not None else None
+            start += len(v)
+            # spacing of the multiples of step around each value
+            gaps = np.abs(np.diff(p))
+            spacing = np.minimum(np.r_[np.inf, gaps], np.r_[gaps, np.inf])
+            inside = (p >= -1e-6 * length) & (p <= length * (1 + 1e-6))
+
+            idx = np.flatnonzero(inside & (spacing >= pad))
+            if fmt is None:
+                labels = [step_label(v[i], step) for i in idx]
+            else:
+                labels = [fmt.format(x[i]) if np.isfinite(x[i]) else None for i in idx]
+            extents = label_extent([s or '' for s in labels], fontsize)
+            for i, label, extent in zip(idx, labels, extents):
+                if label is None or spacing[i] < extent + pad:
+                    continue
+                # labels centred on their ticks
+                j = bisect.bisect(majors, p[i])
+                near = [k for k in (j - 1, j) if 0 <= k < len(majors)]
+                if all(abs(p[i] - majors[k]) >= (extent + widths[k]) / 2 + pad for k in near):
+                    majors.insert(j, p[i])
+                    widths.insert(j, extent)
+                    bisect.insort(ticks, p[i])
+                    labelled.append((p[i], label))
+
+            for i in np.flatnonzero(inside & (spacing >= minor_sep)) if minor else ():
+                j = bisect.bisect(ticks, p[i])
+                near = [ticks[k] for k in (j - 1, j) if 0 <= k < len(ticks)]
+                if all(abs(p[i] - q) >= minor_sep for q in near):
+                    ticks.insert(j, p[i])
+                    unlabelled.append(p[i])
+
+    labelled.sort()
+    to_coord = lambda pos: c0 + np.asarray(pos, dtype=float) / length * (c1 - c0)
+    count('ticks planned', len(ticks))
+    axis = dict(ticks=to_coord([pos for pos, _ in labelled]), labels=[s for _, s in labelled])
+    if unlabelled:
+        # all the ticks, as more_ticks in the specs
+        axis['more_ticks'] = to_coord(ticks)
+    return axis
+
+
+def plan_quantity(table, name, zmin, zmax, scale='log', **kwargs):
+    """plan_ticks for a quantity of the cosmology table ('age',
+    'lookback_time', ...) or for 'z' itself."""
+    if name == 'z':
+        return plan_ticks(lambda z: z, lambda v: v, zmin, zmax, scale, **kwargs)
+    unit = table_unit(name)
+    # ticks from the first finite value of the table (arcsec_per_kpc_proper
+    # is infinite at z = 0), on the part of the axis left
+    zg, fg = table.grid(name)
+    zfinite = zg[np.isfinite(fg)]
+    if len(zfinite) and zmin < zfinite[0] < zmax:
+        c = axis_coordinates([zmin, zmax, zfinite[0]], scale)
+        kwargs['length'] = kwargs.get('length', 700.) * (c[1] - c[2]) / (c[1] - c[0])
+        zmin = zfinite[0]
+    # grid points just around [zmin, zmax]: every value of the axis is reached
+    zlo = zg[max(np.searchsorted(zg, zmin, side='right') - 1, 0)]
+    zhi = zg[min(np.searchsorted(zg, zmax, side='left'), len(zg) - 1)]
+    return plan_ticks(lambda z: table.evaluate(name, z).to_value(unit),
+                      lambda v: table.z_at(name, v * unit, zlo, zhi),
+                      zmin, zmax, scale, **kwargs)
+
+
+def table_unit(name):
+    from .cache import COLUMNS, UNITS
+    return UNITS[COLUMNS.index(name)]
+
+
+def axis_length(figsize, subplots_adjust):
+    """Length in points of the vertical axes of a side."""
+    return figsize[1] * POINTS_PER_INCH * (subplots_adjust['top'] - subplots_adjust['bottom'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan the ticks of the ruler axes for a z range.")
+    parser.add_argument('--zmin', type=float, default=0.1)
+    parser.add_argument('--zmax', type=float, default=1000.)
+    parser.add_argument('--scale', choices=['log', 'linear'], default='log')
+    parser.add_argument('--cosmology', default='Planck18')
+    parser.add_argument('--length', type=float, default=axis_length((2, 12), dict(bottom=0.025, top=0.88)),
+                        help="axis length in points (default: the recto)")
+    parser.add_argument('--fontsize', type=float, default=FONTSIZE)
+    args = parser.parse_args(argv)
+
+    from .engine import default_table, get_cosmology
+
+    table = default_table(get_cosmology(args.cosmology))
+    for name in ['z', 'age', 'lookback_time']:
+        axis = plan_quantity(table, name, args.zmin, args.zmax, args.scale,
+                             length=args.length, fontsize=args.fontsize)
+        print("{}: {} labels, {} ticks".format(name, len(axis['labels']), len(axis.get('more_ticks', axis['ticks']))))
+        print("  " + " ".join(axis['labels']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# Language and branding variants of the sides, from one build of their geometry
+#
+# The same side in several languages (translations in specs/lang) and with
+# several institution footers or titles (brandings) differs only by its
+# text strings. Here the ticks of each side are computed once per
+# cosmology (engine.build_spec), and every variant is that built spec with
+# its own texts (engine.build_texts with the strings of the language, then
+# those of the branding). Variants are exported by worker processes, a
+# chunk of the variants of one side each: a worker draws the side once
+# (render.build_side), then for every variant only swaps the strings of
+# the text artists (render.retext_side) before writing it.
+#
+# Brandings file (JSON or YAML): {name: {string name: text}}, e.g.
+#   {"saclay": {},
+#    "iac": {"bottom_text": "IAC - Tenerife - 2024"}}
+# Variants are every language with every branding, written as
+# CosmologyRulerBookmark_<cosmology>_<Side>_v0_<language>[_<branding>].<format>
+# Variants up to date in the manifest of the output directory are
+# skipped, as in cosmology_ruler.batch.
+#
+# Example: 4 languages x 2 brandings of the recto and verso, 4 processes
+# python -m cosmology_ruler.variants --languages en fr es de --brandings brandings.json -j 4
+#
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .batch import profiled_job, side_basename
+from .engine import (TEXT_ENGINES, available_languages, build_spec, build_texts, default_table,
+                     get_cosmology, load_spec, read_spec_file)
+from .fast import fast_cosmology
+from .manifest import Manifest, add_manifest_arguments, side_digest, target_name
+from .profiling import add_profile_arguments, count, current_profiler, profiler_from_args, stage
+from .render import output_files
+
+# of a worker process: side drawn for the variants of its chunks
+_figure = {}
+
+
+def load_brandings(path=None):
+    """{branding name: strings} of a brandings file; without one, a single
+    branding (None) with the strings of the specs."""
+    if path is None:
+        return {None: {}}
+    return {name: dict(strings or {}) for name, strings in read_spec_file(path).items()}
+
+
+def variant_specs(side, languages, brandings, table=None, cosmo=None, auto_ticks=False):
+    """(variant name, spec) of side in every language with every branding,
+    all sharing the axes of one build_spec."""
+    spec = load_spec(side)
+    with stage('variant geometry'):
+        built = build_spec(spec, table, cosmo, auto_ticks)
+    variants = []
+    for language in languages:
+        for branding, strings in brandings.items():
+            name = language if branding is None else "{}_{}".format(language, branding)
+            with stage('variant texts'):
+                variants.append((name, dict(built, texts=build_texts(spec, cosmo, language, strings))))
+    return variants
+
+
+def export_variants(key, variants, text_engine, formats, dpi):
+    """Worker: export variants [(basename, spec)] of one side, drawn once
+    in this process (key) and only re-texted for each; returns the
+    written paths of each variant."""
+    from .render import build_side, export, retext_side
+
+    written = []
+    for basename, spec in variants:
+        if _figure.get('key') != key:
+            _figure.update(key=key, fig=build_side(spec, text_engine))
+        else:
+            retext_side(_figure['fig'], spec['texts'], text_engine or spec.get('text_engine'))
+        written.append(export(_figure['fig'], basename, formats=formats, dpis=[dpi]))
+        count('variants')
+    return written
+
+
+def run_variants(cosmologies=('Planck18',), sides=('recto', 'verso'), languages=('en',), brandings=None,
+                 formats=('png', 'pdf'), dpi=300, output_dir='.', jobs=None, text_engine=None,
+                 auto_ticks=False, manifest=None):
+    """Export the variants (languages x brandings, see load_brandings) of
+    all sides of all cosmologies with `jobs` worker processes (default:
+    number of cores). Returns the list of written files."""
+    os.makedirs(output_dir, exist_ok=True)
+    if manifest is None:
+        manifest = Manifest(output_dir)
+    brandings = brandings or {None: {}}
+    jobs = jobs or os.cpu_count() or 1
+
+    # stale variants of each side, split in one chunk per worker
+    chunks, targets = [], {}
+    for cosmology in cosmologies:
+        cosmo = None if cosmology == 'Planck18' else fast_cosmology(get_cosmology(cosmology))
+        table = default_table(cosmo)
+        for side in sides:
+            stale = []
+            for name, spec in variant_specs(side, languages, brandings, table, cosmo, auto_ticks):
+                basename = "{}_{}".format(side_basename(output_dir, cosmology, spec['name']), name)
+                target = target_name(basename, dpi)
+                outputs = [path for path, _, _ in output_files(basename, formats, [dpi])]
+                digest = side_digest(spec, table, text_engine, formats, dpi)
+                if manifest.check(target, digest, outputs) is not None and not manifest.dry_run:
+                    stale.append((basename, spec))
+                    targets[basename] = (target, digest, outputs)
+            size = math.ceil(len(stale) / jobs) if stale else 1
+            key = (cosmology, load_spec(side)['name'], text_engine)
+            chunks += [(key, stale[i:i + size]) for i in range(0, len(stale), size)]
+
+    written = []
+    if not chunks:
+        return written
+
+    # workers time their chunks when a profiler is active here (as in batch)
+    profiler = current_profiler()
+    numbers = iter(range(len(chunks)))
+
+    def submit(*args):
+        profile = None
+        if profiler is not None:
+            output = profiler.profile_output
+            if output:
+                root, ext = os.path.splitext(output)
+                output = "{}.{}{}".format(root, next(numbers), ext)
+            profile = (profiler.profile_stage, output, profiler.tool)
+        return pool.submit(profiled_job, export_variants, profile, *args)
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as pool:
+        futures = [(submit(key, chunk, text_engine, formats, dpi), chunk) for key, chunk in chunks]
+        for future, chunk in futures:
+            result, report = future.result()
+            if report is not None:
+                profiler.merge(report)
+            for (basename, _), paths in zip(chunk, result):
+                manifest.record(*targets[basename])
+                written += paths
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export language and branding variants of bookmark sides, "
+                                                 "computing the ticks of each side once.")
+    parser.add_argument('--sides', nargs='+', default=['recto', 'verso'],
+                        help="spec files, or names of shipped specs (default: recto verso)")
+    parser.add_argument('--languages', nargs='+', choices=available_languages(), default=available_languages(),
+                        help="default: all of them")
+    parser.add_argument('--brandings', metavar='FILE', help="JSON or YAML: {name: {string name: text}}")
+    parser.add_argument('--cosmology', nargs='+', default=['Planck18'],
+                        help="astropy cosmologies (default: Planck18)")
+    parser.add_argument('--formats', nargs='+', default=['png', 'pdf'])
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="number of worker processes (default: number of cores)")
+    parser.add_argument('--text-engine', choices=TEXT_ENGINES, default=None,
+                        help="typeset texts with LaTeX or matplotlib's mathtext (default: as in the spec)")
+    parser.add_argument('--auto-ticks', action='store_true',
+                        help="plan the ticks for each cosmology instead of the printed lists")
+    add_manifest_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    manifest = Manifest(args.output_dir, args.force, args.dry_run)
+    start = time.perf_counter()
+    with profiler_from_args(args) as profiler:
+        written = run_variants(args.cosmology, args.sides, args.languages, load_brandings(args.brandings),
+                               args.formats, args.dpi, args.output_dir, args.jobs, args.text_engine,
+                               args.auto_ticks, manifest)
+    if args.profile_report:
+        profiler.write(args.profile_report)
+    for path in written:
+        print(path)
+    if args.dry_run:
+        print('\n'.join(manifest.summary()))
+    else:
+        print("{} files in {:.1f} s".format(len(written), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_directory(tmp_path, monkeypatch):
+    # tables and label boxes of a test in its own cache directory
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('COSMOLOGY_RULER_CACHE', str(path))
+    return str(path)
@@ -0,0 +1,44 @@
+import pytest
+from pypdf import PdfReader
+
+from cosmology_ruler.assemble import MM, SHEETS, impose, merge_pdf_files, sheet_layout
+from cosmology_ruler.engine import default_table
+from cosmology_ruler.render import build_side, export_bytes
+from cosmology_ruler.sides import recto_spec, verso_spec
+
+
+@pytest.fixture(scope='module')
+def sides():
+    table = default_table()
+    return [export_bytes(build_side(spec(table), 'mathtext'), 'pdf') for spec in [recto_spec, verso_spec]]
+
+
+def test_merged_pdf_has_one_page_per_side(tmp_path, sides):
+    output = str(tmp_path / 'merged.pdf')
+    merge_pdf_files(sides, output)
+    pages = PdfReader(output, strict=True).pages
+    assert len(pages) == 2
+    assert [(float(page.mediabox.width), float(page.mediabox.height)) for page in pages] == [(144., 864.)] * 2
+    assert all(list(page['/Resources']['/XObject']) == ['/S'] for page in pages)
+
+
+def test_imposed_sheets(tmp_path, sides):
+    output = str(tmp_path / 'sheets.pdf')
+    per_sheet = len(sheet_layout(144., 864., 'A3')[1])
+    sheets = impose(sides[0], sides[1], output, per_sheet + 1, sheet='A3')
+    assert sheets == 2
+    pages = PdfReader(output, strict=True).pages
+    assert len(pages) == 4
+    width, height = SHEETS['A3']
+    for page in pages:
+        assert sorted([float(page.mediabox.width), float(page.mediabox.height)]) == pytest.approx([width, height],
+                                                                                                  abs=1e-3)
+    # fronts: rectos, backs: versos, one copy of each side in the file
+    assert [list(page['/Resources']['/XObject']) for page in pages] == [['/R'], ['/V']] * 2
+    forms = [page['/Resources']['/XObject'].raw_get(name).idnum for page, name in zip(pages, ['/R', '/V'] * 2)]
+    assert forms[0] == forms[2] and forms[1] == forms[3]
+
+
+def test_side_larger_than_the_sheet():
+    with pytest.raises(ValueError, match='does not fit on a A4 sheet'):
+        sheet_layout(100., 1000 * MM, 'A4')
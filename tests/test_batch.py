@@ -0,0 +1,22 @@
+import os
+
+from pypdf import PdfReader
+
+from cosmology_ruler.batch import make_jobs, run_batch
+
+
+def test_sides_and_merged_pdf_are_written(tmp_path):
+    output_dir = str(tmp_path)
+    written = run_batch(sides=['recto', 'verso'], formats=['png', 'pdf'], dpis=[30], output_dir=output_dir,
+                        jobs=2, text_engine='mathtext')
+    names = sorted(os.path.basename(path) for path in written)
+    assert names == ['CosmologyRulerBookmark_Planck18_Recto_v0.pdf', 'CosmologyRulerBookmark_Planck18_Recto_v0.png',
+                     'CosmologyRulerBookmark_Planck18_Verso_v0.pdf', 'CosmologyRulerBookmark_Planck18_Verso_v0.png',
+                     'CosmologyRulerBookmark_Planck18_v0.pdf']
+    assert len(PdfReader(os.path.join(output_dir, 'CosmologyRulerBookmark_Planck18_v0.pdf')).pages) == 2
+
+
+def test_vector_formats_in_the_first_dpi_job_only():
+    jobs = make_jobs(['Planck18'], ['verso'], ['png', 'pdf'], [150, 300], 'out', {'Planck18': None})
+    assert [job['dpi'] for job in jobs] == [150, 300]
+    assert [[formats for _, formats in job['outputs']] for job in jobs] == [[['png'], ['pdf']], [['png']]]
@@ -0,0 +1,29 @@
+from cosmology_ruler.benchmark import compare, run, select
+
+
+def result(time, rss):
+    return {'time_min': time, 'time_median': time, 'repeat': 1, 'setup_rss_mb': rss, 'peak_rss_mb': rss}
+
+
+def test_select_patterns():
+    assert select(['inversion.*.recto']) == ['inversion.scalar.recto', 'inversion.batched.recto',
+                                             'inversion.table.recto']
+    assert select(['nothing']) == []
+
+
+def test_compare_flags_slower_and_bigger():
+    baseline = {'results': {'a': result(1., 100.), 'b': result(1., 100.), 'c': result(1., 100.)}}
+    new = {'results': {'a': result(1.05, 110.), 'b': result(1.2, 100.), 'c': result(1., 130.),
+                       'd': result(1., 100.), 'e': {'skipped': 'latex or dvipng not installed'}}}
+    lines, flagged = compare(baseline, new, threshold=0.1, rss_threshold=0.2)
+    assert flagged == ['b', 'c']
+    assert lines[1].endswith('SLOWER') and lines[2].endswith('MORE MEMORY')
+    assert lines[3].endswith('not compared') and lines[4].endswith('not compared')
+
+
+def test_benchmark_runs_in_its_own_process():
+    report = run(['arcsec.fast.1e+03'], repeat=2, verbose=False)
+    r = report['results']['arcsec.fast.1e+03']
+    assert r['repeat'] == 2 and 0 < r['time_min'] <= r['time_median']
+    assert r['peak_rss_mb'] >= r['setup_rss_mb'] > 0
+    assert report['meta']['numpy']
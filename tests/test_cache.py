@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+from astropy.cosmology import WMAP9, Planck18
+
+from cosmology_ruler import cache
+from cosmology_ruler.cache import cosmology_table, named_table, table_key
+
+GRID = dict(zmin=0., zmax=10., n=65)
+
+
+def test_miss_then_hit(cache_directory):
+    table = cosmology_table(Planck18, **GRID)
+    path = os.path.join(cache_directory, table.key + '.npy')
+    assert os.path.exists(path)
+    os.utime(path, (0, 0))
+    again = cosmology_table(Planck18, **GRID)
+    assert isinstance(again.data, np.memmap)
+    assert again.key == table.key == table_key(Planck18, **GRID)
+    np.testing.assert_array_equal(again.data, table.data)
+    # marked as recently used
+    assert os.stat(path).st_mtime > 0
+
+
+def test_read_only_cache(cache_directory, monkeypatch):
+    table = cosmology_table(Planck18, **GRID)
+
+    def utime(path, *args):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(cache.os, 'utime', utime)
+    assert cosmology_table(Planck18, **GRID).key == table.key
+
+
+def test_least_recently_used_are_evicted(cache_directory):
+    paths = []
+    for i, zmax in enumerate([10., 20., 30.]):
+        table = cosmology_table(Planck18, 0., zmax, 65, max_bytes=2 * 6 * 65 * 8 + 512)
+        paths.append(os.path.join(cache_directory, table.key + '.npy'))
+        os.utime(paths[-1], (i, i))
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+
+def test_no_cache(cache_directory):
+    cosmology_table(Planck18, directory=False, **GRID)
+    assert not os.path.exists(cache_directory)
+
+
+def test_realizations_are_named():
+    keys = {cosmo.name: cosmology_table(cosmo).key for cosmo in [Planck18, WMAP9]}
+    assert {name: named_table(name).key for name in keys} == keys
+
+
+def test_unnamed(cache_directory):
+    cosmology_table(Planck18.clone(H0=70.))
+    assert named_table('Planck18') is None
+    assert [name for name in os.listdir(cache_directory) if name.endswith(cache.NAME_SUFFIX)] == []
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.cosmology import Planck18
+
+from cosmology_ruler.catalog import QUANTITIES, convert
+
+
+@pytest.fixture
+def catalog_csv(tmp_path):
+    # blank lines, a missing value, z <= -1 and z beyond the table
+    path = str(tmp_path / 'catalog.csv')
+    with open(path, 'w') as f:
+        f.write("id,z\n1,0.5\n\n2,\n3,3.0\n\n\n4,-2\n5,2e4\n6,1100")
+    return path
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_csv_with_blank_lines_and_missing_values(tmp_path, catalog_csv, jobs):
+    output = str(tmp_path / 'out')
+    assert convert(catalog_csv, output, column='z', chunk=2, jobs=jobs) == 6
+    assert sorted(os.listdir(output)) == sorted(name + '.npy' for name, _ in QUANTITIES)
+    z = np.load(os.path.join(output, 'z.npy'))
+    age = np.load(os.path.join(output, 'age.npy'))
+    assert np.array_equal(z, [0.5, np.nan, 3., -2., 2e4, 1100.], equal_nan=True)
+    valid = [0, 2, 4, 5]
+    assert np.all(np.isnan(age[[1, 3]]))
+    assert np.allclose(age[valid], Planck18.age(z[valid]).value, rtol=1e-6)
+    assert np.allclose(np.load(os.path.join(output, 'arcsec_per_kpc_proper.npy'))[valid],
+                       Planck18.arcsec_per_kpc_proper(z[valid]).value, rtol=1e-6)
+
+
+def test_structured_npy_by_column(tmp_path):
+    path = str(tmp_path / 'catalog.npy')
+    data = np.zeros(5, dtype=[('id', int), ('Z', float)])
+    data['Z'] = [0.1, 1., 2., 5., 10.]
+    np.save(path, data)
+    output = str(tmp_path / 'out')
+    assert convert(path, output, column='Z', chunk=3) == 5
+    assert np.allclose(np.load(os.path.join(output, 'lookback_time.npy')),
+                       Planck18.lookback_time(data['Z']).value, rtol=1e-6)
+
+
+def test_unknown_format_and_column(tmp_path, catalog_csv):
+    with pytest.raises(ValueError, match='unknown catalog format'):
+        convert(str(tmp_path / 'catalog.txt'), str(tmp_path / 'out'))
+    with pytest.raises(ValueError, match="no column 'redshift'"):
+        convert(catalog_csv, str(tmp_path / 'out'), column='redshift')
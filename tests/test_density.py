@@ -0,0 +1,35 @@
+import numpy as np
+
+from cosmology_ruler.density import bin_counts, catalog_density
+from cosmology_ruler.engine import build_spec, default_table, load_spec
+from cosmology_ruler.profiling import Profiler
+from cosmology_ruler.render import build_side
+
+
+def test_chunked_counts_are_the_histogram():
+    z = np.random.default_rng(1).lognormal(0., 1., 10000)
+    counts = bin_counts(np.array_split(np.r_[z, np.nan, -1.], 7), -1., 3., 64, 'log')
+    assert np.array_equal(counts, np.histogram(np.log10(z), bins=64, range=(-1., 3.))[0])
+
+
+def test_histograms_are_cached_until_the_catalog_changes(tmp_path):
+    path = str(tmp_path / 'catalog.npy')
+    np.save(path, np.array([0.5, 1., 1.5, 2., 25.]))
+    with Profiler() as profiler:
+        first = catalog_density(path, zmin=0., zmax=30., scale='linear', bins=30, chunk=2)
+        assert np.array_equal(catalog_density(path, zmin=0., zmax=30., scale='linear', bins=30), first)
+    assert first.sum() == 5 and first[25] == 1
+    assert profiler.counters['density from cache'] == 1
+    assert profiler.counters['catalog rows'] == 5
+
+    np.save(path, np.array([0.5, 1.]))
+    assert catalog_density(path, zmin=0., zmax=30., scale='linear', bins=30).sum() == 2
+
+
+def test_strip_is_drawn_next_to_the_axis(tmp_path):
+    path = str(tmp_path / 'catalog.npy')
+    np.save(path, np.linspace(0.1, 10., 1000))
+    spec = build_spec(dict(load_spec('verso'), density={'catalog': path}), default_table())
+    assert spec['density']['counts'].sum() == 1000
+    fig = build_side(spec, 'mathtext')
+    assert [ax.get_label() for ax in fig.axes].count('density') == 1
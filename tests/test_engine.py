@@ -0,0 +1,52 @@
+import json
+
+import numpy as np
+import pytest
+from astropy.cosmology import Planck18
+
+from cosmology_ruler import engine
+from cosmology_ruler.engine import build_spec, default_table, load_spec, register_quantity
+from cosmology_ruler.inversion import z_at_values
+
+SPEC = {'name': 'side', 'figsize': [1, 4], 'subplots_adjust': {'bottom': 0.1, 'top': 0.9},
+        'z': {'min': 0, 'max': 3, 'scale': 'linear'}}
+
+
+def test_ticks_are_at_the_redshifts_of_their_values():
+    spec = build_spec('verso', default_table())
+    age = load_spec('verso')['axes'][1]
+    z = np.asarray(spec['axes'][1]['ticks'])
+    assert spec['axes'][1]['labels'] == ['{:g}'.format(value) for value in age['ticks']]
+    assert np.allclose(z, z_at_values(Planck18.age, age['ticks'], zmin=0.), rtol=1e-7)
+
+
+def test_spec_file_includes_a_shipped_spec(tmp_path):
+    path = tmp_path / 'variant.json'
+    path.write_text(json.dumps({
+        'include': 'verso',
+        'strings': {'zrange': 'Variant'},
+        'axes': [{'quantity': 'z', 'ticks': [0, 10, 20, 30]},
+                 {'quantity': 'age', 'range': [1, 5], 'ticks': [0.5, 1, 2, 5, 10]}],
+    }))
+    spec = load_spec(str(path))
+    assert spec['name'] == 'variant' and spec['z'] == load_spec('verso')['z']
+    assert spec['strings']['zrange'] == 'Variant' and 'label_axis1' in spec['strings']
+    built = build_spec(str(path), default_table())
+    assert 'Variant' in [text['s'] for text in built['texts']]
+    # values outside the range of the axis are dropped
+    assert built['axes'][1]['labels'] == ['1', '2', '5']
+
+
+def test_registered_quantity(monkeypatch):
+    monkeypatch.setattr(engine, 'QUANTITIES', dict(engine.QUANTITIES))
+    register_quantity('scale_factor', lambda table, z, axis: 1 / (1 + np.asarray(z)),
+                      lambda values, axis: 1 / np.asarray(values) - 1)
+    spec = build_spec(dict(SPEC, axes=[{'quantity': 'scale_factor', 'ticks': [1, 0.5, 0.25]}]), default_table())
+    assert np.allclose(spec['axes'][0]['ticks'], [0, 1, 3])
+
+
+def test_unknown_quantity_and_spec():
+    with pytest.raises(ValueError, match="unknown axis quantity 'redshift'"):
+        build_spec(dict(SPEC, axes=[{'quantity': 'redshift', 'ticks': [1]}]), default_table())
+    with pytest.raises(ValueError, match='unknown spec'):
+        load_spec('no_such_side')
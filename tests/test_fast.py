@@ -0,0 +1,28 @@
+import astropy.units as u
+import numpy as np
+import pytest
+from astropy.cosmology import LambdaCDM, Planck18
+
+from cosmology_ruler.fast import FastFlatLCDM, check_accuracy, fast_cosmology
+
+
+@pytest.mark.parametrize('cosmo', [Planck18, Planck18.clone(name='no radiation', Tcmb0=0.)])
+def test_agrees_with_astropy(cosmo):
+    fast = fast_cosmology(cosmo)
+    assert fast.analytic == (cosmo.Tcmb0.value == 0)
+    assert max(check_accuracy(fast).values()) < 1e-8
+
+
+def test_beyond_zmax_goes_to_astropy():
+    fast = FastFlatLCDM(Planck18, zmax=10.)
+    z = np.array([1., 100.])
+    assert np.allclose(fast.lookback_time(z).to_value(u.Gyr), Planck18.lookback_time(z).to_value(u.Gyr),
+                       rtol=1e-10)
+    assert fast.H0 == Planck18.H0
+
+
+def test_other_cosmologies_are_left_to_astropy():
+    curved = LambdaCDM(70., 0.3, 0.6)
+    assert fast_cosmology(curved) is curved
+    with pytest.raises(TypeError):
+        FastFlatLCDM(curved)
@@ -0,0 +1,25 @@
+import astropy.units as u
+import numpy as np
+import pytest
+from astropy.cosmology import Planck18, z_at_value
+
+from cosmology_ruler.inversion import forward_grid, invert_grid, z_at_values
+
+
+def test_grid_and_newton_agree_with_astropy():
+    ages = [0.5, 1., 3., 8., 13.]
+    expected = [z_at_value(Planck18.age, age * u.Gyr, zmax=1000, ztol=1e-10).value for age in ages]
+    grid = forward_grid(Planck18.age, 1e-8, 1000, 256, u.Gyr)
+    assert np.allclose(invert_grid(*grid, ages), expected, rtol=1e-5)
+    assert np.allclose(z_at_values(Planck18.age, ages * u.Gyr, grid=grid), expected, rtol=1e-8)
+
+
+def test_unconverged_values_raise():
+    with pytest.raises(RuntimeError, match='no convergence'):
+        z_at_values(Planck18.age, [1., 2.] * u.Gyr, ztol=1e-12, max_iter=1)
+
+
+def test_flat_function_is_exact_to_rounding():
+    # lookback time at z ~ 650: float steps in log(1+z) stay above 1e-12
+    z = z_at_values(Planck18.lookback_time, [13.786] * u.Gyr, zmin=0., ztol=1e-12)
+    assert np.isclose(Planck18.lookback_time(z).to_value(u.Gyr), 13.786, rtol=1e-14, atol=0)
@@ -0,0 +1,33 @@
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.font_manager import FontProperties
+from matplotlib.texmanager import TexManager
+
+from cosmology_ruler import labels
+from cosmology_ruler.engine import build_spec, default_table
+from cosmology_ruler.labels import TexBoxes, mathtext_label, use_tex_cache
+from cosmology_ruler.render import build_side
+
+
+def test_label_boxes_are_read_from_the_table(monkeypatch):
+    measure = TexManager.__dict__['get_text_width_height_descent']
+    renderer = RendererAgg(100, 100, 72)
+    use_tex_cache(renderer)
+    assert isinstance(renderer.get_texmanager(), TexBoxes)
+    # no LaTeX run: the box is in the table
+    key = labels._metrics_key('$z$', 10., 1.)
+    monkeypatch.setattr(labels, '_metrics', {key: [5., 7., 2.]})
+    box = renderer.get_text_width_height_descent('$z$', FontProperties(size=10), ismath='TeX')
+    assert box == (5., 7., 2.)
+    assert TexManager.__dict__['get_text_width_height_descent'] is measure
+
+
+def test_sides_draw_with_the_table():
+    fig = build_side(build_spec('verso', default_table()), 'mathtext')
+    fig.canvas.draw()
+    assert isinstance(fig.canvas.get_renderer().get_texmanager(), TexBoxes)
+    assert not isinstance(RendererAgg(10, 10, 72).get_texmanager(), TexBoxes)
+
+
+def test_mathtext_label():
+    assert mathtext_label(r'{\bf Age \& time}') == ('Age & time', {'fontweight': 'bold'})
+    assert mathtext_label(r'\rm{Gyr}') == (r'\mathrm{Gyr}', {})
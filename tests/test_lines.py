@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from cosmology_ruler.engine import build_spec, default_table
+from cosmology_ruler.lines import BANDS, band_spec, emitted_at, observe, rest_wavelength, rest_wavelengths, windows
+
+
+def test_all_lines_at_all_redshifts():
+    names = ['CO1-0', 'CII158', 'HI21']
+    z = np.array([0., 1., 6.])
+    nu = observe(rest_wavelengths(names)[:, None], z[None, :], 'frequency', 'GHz')
+    assert nu.shape == (3, 3)
+    assert np.allclose(nu[0], 115.2712018 / (1 + z))
+    assert np.allclose(nu[2], 1.420405751768 / (1 + z))
+    assert np.allclose(emitted_at(rest_wavelengths(names)[:, None], nu, 'frequency', 'GHz'), z[None, :])
+    assert np.isclose(observe(rest_wavelength('Ha'), 1., 'wavelength', 'um'), 2 * 0.656461)
+
+
+def test_band_windows():
+    # CO(1-0) in ALMA band 3: 84-116 GHz
+    zlo, zhi = windows([rest_wavelength('CO1-0')], (84., 116.), 'frequency', 'GHz')
+    assert np.allclose([zlo[0], zhi[0]], [115.2712018 / 116 - 1, 115.2712018 / 84 - 1])
+
+
+def test_band_ruler_ticks_are_observed_in_the_band():
+    table = default_table()
+    spec = band_spec('ALMA-B3', text_engine='mathtext')
+    # [CII] is in band 3 for z ~ 15.4-21.6 only
+    assert [axis.get('line') for axis in spec['axes']] == [None, 'CO1-0', 'CO2-1', 'CO3-2', 'CO4-3', 'CI1-0',
+                                                           'CII158']
+    built = build_spec(spec, table)
+    lo, hi = BANDS['ALMA-B3'][2]
+    for axis, entry in zip(spec['axes'][1:], built['axes'][1:]):
+        z = np.asarray(entry['ticks']) if spec['z']['scale'] == 'linear' else 10 ** np.asarray(entry['ticks'])
+        nu = observe(rest_wavelength(axis['line']), z, 'frequency', 'GHz')
+        assert entry['labels'] and np.all((nu >= lo - 1e-9) & (nu <= hi + 1e-9))
+        assert np.allclose([float(label) for label in entry['labels']], nu, rtol=1e-6)
+
+
+def test_unknown_line_and_quantity():
+    with pytest.raises(ValueError, match="unknown line 'CO9-8'"):
+        rest_wavelength('CO9-8')
+    with pytest.raises(ValueError, match="quantity must be"):
+        observe(1e-3, 1., 'energy')
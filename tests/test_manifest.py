@@ -0,0 +1,43 @@
+import os
+
+from cosmology_ruler.batch import run_batch
+from cosmology_ruler.engine import default_table
+from cosmology_ruler.manifest import Manifest, update_side
+from cosmology_ruler.sides import verso_spec
+
+
+def build(output_dir, manifest=None):
+    written = run_batch(sides=['recto', 'verso'], formats=['png', 'pdf'], dpis=[30], output_dir=output_dir,
+                        jobs=1, text_engine='mathtext', manifest=manifest)
+    return sorted(os.path.basename(path) for path in written)
+
+
+def test_up_to_date_sides_are_skipped(tmp_path):
+    output_dir = str(tmp_path)
+    assert len(build(output_dir)) == 5
+    assert build(output_dir) == []
+
+    # a modified output: that side only, the merged pdf is unchanged
+    with open(os.path.join(output_dir, 'CosmologyRulerBookmark_Planck18_Verso_v0.png'), 'ab') as f:
+        f.write(b'\0')
+    manifest = Manifest(output_dir, dry_run=True)
+    assert build(output_dir, manifest) == []
+    assert manifest.stale == [('CosmologyRulerBookmark_Planck18_Verso_v0 30dpi', 'output modified')]
+    assert manifest.summary()[-1] == 'up to date: 2 target(s)'
+    assert build(output_dir) == ['CosmologyRulerBookmark_Planck18_Verso_v0.pdf',
+                                 'CosmologyRulerBookmark_Planck18_Verso_v0.png']
+    assert build(output_dir, Manifest(output_dir, force=True)) != []
+
+
+def test_changed_inputs(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    table = default_table()
+    basename = str(tmp_path / 'verso')
+    spec = verso_spec(table)
+    update_side(manifest, spec, table, basename, formats=['png'], dpi=30, text_engine='mathtext')
+    spec['texts'][0] = dict(spec['texts'][0], s='another caption')
+    update_side(manifest, spec, table, basename, formats=['png'], dpi=30, text_engine='mathtext')
+    assert [reason for _, reason in manifest.stale] == ['new', 'inputs changed']
+    # read again from the file
+    assert Manifest(str(tmp_path)).reason('verso 30dpi', manifest.digests['verso 30dpi'],
+                                          [basename + '.png']) is None
@@ -0,0 +1,20 @@
+from astropy.cosmology import Planck18
+
+from cosmology_ruler.cache import DEFAULT_GRID, cosmology_table, named_table
+from cosmology_ruler.precision import precise_table, tick_errors, tolerances
+
+
+def test_precise_table_keeps_the_named_table(cache_directory):
+    table = cosmology_table(Planck18)
+    precise = precise_table(None, dict(degree=48, n=DEFAULT_GRID['n']))
+    assert precise.key != table.key
+    assert named_table('Planck18').key == table.key
+
+
+def test_tolerance_is_met():
+    settings = tolerances(['recto'], 0.01)
+    table = precise_table(None, settings, directory=False)
+    errors = tick_errors('recto', table)
+    assert errors
+    assert max(row['error_mm'] for row in errors) <= 0.01
+    assert all(row['label_ok'] for row in errors)
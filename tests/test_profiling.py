@@ -0,0 +1,66 @@
+import json
+import pstats
+
+import pytest
+
+from cosmology_ruler.engine import default_table
+from cosmology_ruler.profiling import Profiler, count, current_profiler, stage
+from cosmology_ruler.render import build_side, export_bytes
+from cosmology_ruler.sides import verso_spec
+
+
+def test_stages_and_counters_of_a_build(tmp_path):
+    with Profiler() as profiler:
+        export_bytes(build_side(verso_spec(default_table()), 'mathtext'), 'png', 30)
+    report = profiler.report()
+    assert {'tick inversion', 'axes setup', 'text layout', 'export.png'} <= set(report['stages'])
+    assert report['stages']['export.png']['calls'] == 1
+    assert report['counters']['ticks'] > 0
+    assert report['wall_time'] >= report['stages']['export.png']['total']
+    path = str(tmp_path / 'report.json')
+    profiler.write(path)
+    with open(path) as f:
+        assert json.load(f) == report
+
+
+def test_nothing_is_recorded_without_a_profiler():
+    assert current_profiler() is None
+    with stage('anything'):
+        count('anything')
+
+
+def test_merged_reports_add_up():
+    profilers = []
+    for n in [1, 2]:
+        with Profiler() as profiler:
+            with stage('work'):
+                count('items', n)
+        profilers.append(profiler)
+    total = Profiler()
+    for profiler in profilers:
+        total.merge(profiler.report())
+    report = total.report()
+    assert report['stages']['work']['calls'] == 2
+    assert report['stages']['work']['max'] == max(p.stages['work']['max'] for p in profilers)
+    assert report['counters'] == {'items': 3}
+
+
+def test_cprofile_inside_one_stage(tmp_path):
+    output = str(tmp_path / 'work.prof')
+
+    def busy():
+        return sum(range(1000))
+
+    with Profiler(profile_stage='work', profile_output=output):
+        with stage('work'):
+            busy()
+        with stage('other'):
+            sorted(range(10))
+    functions = {name for _, _, name in pstats.Stats(output).stats}
+    assert 'busy' in functions
+    assert not any('sorted' in name for name in functions)
+
+
+def test_unknown_tool():
+    with pytest.raises(ValueError):
+        Profiler(tool='perf')
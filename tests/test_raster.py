@@ -0,0 +1,25 @@
+import hashlib
+
+import numpy as np
+from PIL import Image
+
+from cosmology_ruler.engine import build_spec, default_table
+from cosmology_ruler.raster import export_tiled, monolithic_digest, pixel_size, tiles
+
+
+def test_bands_are_the_render_in_one_piece(tmp_path):
+    spec = build_spec('verso', default_table())
+    path = str(tmp_path / 'verso.png')
+    sha = export_tiled(spec, path, 100, 'mathtext', tile_rows=37)
+    assert sha == monolithic_digest(spec, 100, 'mathtext')
+    image = np.asarray(Image.open(path))
+    assert image.shape[1::-1] == pixel_size(spec, 100)
+    assert hashlib.sha256(image.tobytes()).hexdigest() == sha
+
+
+def test_bands_are_bounded():
+    spec = build_spec('recto', default_table())
+    width, height = pixel_size(spec, 50)
+    rows = [tile.shape for tile in tiles(spec, 50, 'mathtext', tile_rows=64)]
+    assert all(shape[0] <= 64 and shape[1:] == (width, 3) for shape in rows)
+    assert sum(shape[0] for shape in rows) == height
@@ -0,0 +1,33 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+
+from cosmology_ruler.engine import default_table
+from cosmology_ruler.render import build_side, export, export_bytes, output_files
+from cosmology_ruler.sides import verso_spec
+
+
+def test_export_writes_vector_formats_once(tmp_path):
+    basename = str(tmp_path / 'verso')
+    fig = build_side(verso_spec(default_table()), 'mathtext')
+    paths = export(fig, basename, formats=['png', 'pdf'], dpis=[50, 100])
+    assert paths == [basename + '_50dpi.png', basename + '_100dpi.png', basename + '.pdf']
+    assert paths == [path for path, _, _ in output_files(basename, ['png', 'pdf'], [50, 100])]
+    assert all(os.path.getsize(path) > 0 for path in paths)
+
+
+def test_export_bytes():
+    fig = build_side(verso_spec(default_table()), 'mathtext')
+    assert export_bytes(fig, 'png', 50).startswith(b'\x89PNG')
+    assert export_bytes(fig, 'pdf').startswith(b'%PDF')
+
+
+def test_sides_render_in_threads_without_global_state():
+    rc = dict(matplotlib.rcParams)
+    spec = verso_spec(default_table())
+    alone = export_bytes(build_side(spec, 'mathtext'), 'png', 50)
+    with ThreadPoolExecutor(4) as pool:
+        images = list(pool.map(lambda _: export_bytes(build_side(spec, 'mathtext'), 'png', 50), range(4)))
+    assert images == [alone] * 4
+    assert dict(matplotlib.rcParams) == rc
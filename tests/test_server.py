@@ -0,0 +1,74 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from cosmology_ruler.server import BookmarkService, Handler, parse_request, request_spec
+from cosmology_ruler.sides import ruler_spec
+
+
+@pytest.fixture
+def server():
+    service = BookmarkService(workers=1)
+    handler = type('BookmarkHandler', (Handler,), dict(service=service))
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield service, "http://127.0.0.1:{}".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+@pytest.mark.parametrize('query', ['side=nowhere', 'dpi=10', 'format=gif', 'lang=xx', 'cosmology=Planck99',
+                                   'side=ruler&zmin=5&zmax=1', 'side=ruler&scale=linear&zmin=-1'])
+def test_invalid_requests(server, query):
+    service, url = server
+    status, _, body = get(url + '/bookmark?' + query)
+    assert status == 400
+    assert 'error' in json.loads(body)
+
+
+def test_identical_requests_are_rendered_once(server):
+    service, url = server
+    query = url + '/bookmark?side=verso&dpi=30'
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(get, [query] * 4))
+    assert all(status == 200 and body.startswith(b'\x89PNG') for status, _, body in responses)
+    assert len({body for _, _, body in responses}) == 1
+    assert service.status()['counters']['worker'] == 1
+    status, headers, _ = get(query)
+    assert headers['X-Bookmark-Cache'] == 'cached'
+
+
+def test_workers_are_restarted(server):
+    service, url = server
+    assert get(url + '/bookmark?side=verso&dpi=30')[0] == 200
+    for process in list(service.pool._processes.values()):
+        process.kill()
+        process.join()
+    assert get(url + '/bookmark?side=recto&dpi=30')[0] == 503
+    assert get(url + '/bookmark?side=recto&dpi=30')[0] == 200
+    assert service.status()['counters']['pool restarts'] == 1
+
+
+def test_ruler_in_french_has_no_english_text():
+    query = {'side': ['ruler'], 'lang': ['fr'], 'scale': ['linear'], 'zmin': ['0'], 'zmax': ['30']}
+    french = [text['s'] for text in request_spec(parse_request(query))['texts']]
+    english = {text['s'] for text in ruler_spec(0., 30., 'linear')['texts']}
+    # texts of the printed bookmark in every language (bilingual title, credits)
+    printed = {text['s'] for text in request_spec(parse_request({'lang': ['fr']}))['texts']}
+    assert "décalage spectral z [0, 30] échelle linéaire" in french
+    assert [s for s in french if s in english and s not in printed] == []
@@ -0,0 +1,51 @@
+import numpy as np
+from astropy.cosmology import Planck18
+from PIL import Image, ImageSequence
+
+from cosmology_ruler.cache import DEFAULT_GRID, cosmology_table
+from cosmology_ruler.fast import FastFlatLCDM
+from cosmology_ruler.precision import tick_errors
+from cosmology_ruler.sweep import GifWriter, frame_cosmology, frame_grid, sweep_frames, sweep_values
+
+
+def make_sweep(parameter='Om0', base=Planck18, dpi=100):
+    return dict(side='recto', base=base, parameter=parameter, auto_ticks=False, language='en',
+                text_engine='mathtext', dpi=dpi)
+
+
+def test_frame_tables_are_coarse_and_place_the_ticks():
+    sweep = make_sweep()
+    values = sweep_values(0.2, 0.4, 5)
+    grid = frame_grid(sweep, values)
+    assert grid['n'] < DEFAULT_GRID['n']
+    for value in values[[0, -1]]:
+        cosmo = frame_cosmology(Planck18, 'Om0', value)
+        table = cosmology_table(FastFlatLCDM(cosmo, degree=grid['degree']), n=grid['n'], directory=False)
+        errors = tick_errors('recto', table, cosmo)
+        assert max(row['error_mm'] for row in errors) <= 25.4 / sweep['dpi'] / 10.
+        assert all(row['label_ok'] for row in errors)
+
+
+def test_fits_are_shared_across_H0_without_radiation():
+    base = Planck18.clone(Tcmb0=0.)
+    first, other = FastFlatLCDM(base), FastFlatLCDM(base.clone(H0=60.))
+    assert other.share_fits(first)
+    z = np.logspace(-3, 4, 200)
+    expected = FastFlatLCDM(base.clone(H0=60.)).comoving_distance(z)
+    np.testing.assert_allclose(other.comoving_distance(z).value, expected.value, rtol=1e-13)
+    # photon and neutrino densities depend on H0
+    assert not FastFlatLCDM(Planck18.clone(H0=60.)).share_fits(FastFlatLCDM(Planck18))
+
+
+def test_gif_is_streamed(tmp_path):
+    sweep = make_sweep('H0', dpi=30)
+    values = sweep_values(60., 75., 3)
+    sweep['grid'] = frame_grid(sweep, values)
+    path = str(tmp_path / 'sweep.gif')
+    writer = GifWriter(path, 10.)
+    for frame, seconds in sweep_frames(sweep, values):
+        writer.write(frame)
+    writer.close()
+    frames = list(ImageSequence.Iterator(Image.open(path)))
+    assert len(frames) == 3
+    assert frames[0].size == (frame.shape[1], frame.shape[0])
@@ -0,0 +1,43 @@
+import csv
+import json
+import subprocess
+import sys
+
+import pytest
+
+from cosmology_ruler.tables import tick_table, write_tables
+
+
+def test_verso_ticks_and_positions():
+    table = tick_table('verso')
+    assert (table['name'], table['scale'], table['zmin'], table['zmax']) == ('verso', 'linear', 0., 30.)
+    z_axis = table['axes'][0]
+    assert z_axis['quantity'] == 'z' and len(z_axis['ticks']) == 31
+    five = z_axis['ticks'][5]
+    assert five['label'] == '5' and five['position'] == pytest.approx(5 / 30)
+    assert five['mm'] == pytest.approx(five['position'] * table['length_mm'])
+    age = table['axes'][1]
+    assert age['unit'] == 'Gyr'
+    # unlabelled ticks (more_ticks) too, sorted from the bottom
+    assert None in [tick['label'] for tick in age['ticks']]
+    assert [tick['z'] for tick in age['ticks']] == sorted(tick['z'] for tick in age['ticks'])
+
+
+def test_csv_has_one_row_per_tick(tmp_path):
+    tables = [tick_table('recto'), tick_table('verso')]
+    path = write_tables(tables, str(tmp_path / 'ticks.csv'))
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == sum(len(axis['ticks']) for table in tables for axis in table['axes'])
+    assert {row['side'] for row in rows} == {'recto', 'verso'}
+
+
+def test_tables_without_matplotlib(tmp_path):
+    output = str(tmp_path / 'ticks.json')
+    code = ("import sys\n"
+            "from cosmology_ruler.tables import main\n"
+            "main(['recto', 'verso', '21cm', '-o', {!r}])\n"
+            "assert 'matplotlib' not in sys.modules\n".format(output))
+    subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        assert [table['name'] for table in json.load(f)['sides']] == ['recto', 'verso', '21cm']
@@ -0,0 +1,28 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from cosmology_ruler.engine import default_table
+from cosmology_ruler.ticks import candidates, plan_quantity, plan_ticks
+
+
+def test_infinite_end_of_the_axis_is_clipped():
+    # arcsec_per_kpc_proper is infinite at z = 0
+    table = default_table()
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        axis = plan_quantity(table, 'arcsec_per_kpc_proper', 0., 1., 'linear', length=700.)
+    assert axis['labels'] and np.all(np.isfinite(axis['ticks']))
+    assert np.all((np.asarray(axis['ticks']) > 0) & (np.asarray(axis['ticks']) <= 1))
+    z = np.asarray(axis['ticks'])[[label == '1' for label in axis['labels']]]
+    assert np.allclose(table.evaluate('arcsec_per_kpc_proper', z).value, 1., rtol=1e-3)
+
+
+def test_axis_without_finite_values_is_rejected():
+    with pytest.raises(ValueError, match='no finite non-zero value'):
+        plan_ticks(lambda z: np.zeros_like(z), lambda v: v, 0., 1., 'linear')
+    with pytest.raises(ValueError, match='finite and not zero'):
+        candidates(1., np.inf, 1.)
+    with pytest.raises(ValueError, match='finite and not zero'):
+        candidates(0., 1., 0.)
@@ -0,0 +1,19 @@
+import os
+
+from cosmology_ruler.profiling import Profiler
+from cosmology_ruler.variants import run_variants
+
+
+def test_variants_are_profiled_and_skipped_when_up_to_date(tmp_path):
+    output_dir = str(tmp_path)
+    with Profiler() as profiler:
+        written = run_variants(sides=['verso'], languages=['en', 'fr'], formats=['png'], dpi=30,
+                               output_dir=output_dir, jobs=2, text_engine='mathtext')
+    assert sorted(os.path.basename(path) for path in written) == [
+        'CosmologyRulerBookmark_Planck18_Verso_v0_en.png', 'CosmologyRulerBookmark_Planck18_Verso_v0_fr.png']
+    report = profiler.report()
+    # stages and counters of the worker processes
+    assert report['counters']['variants'] == 2
+    assert report['stages']['export.png']['calls'] == 2
+    assert run_variants(sides=['verso'], languages=['en', 'fr'], formats=['png'], dpi=30,
+                        output_dir=output_dir, jobs=2, text_engine='mathtext') == []